@@ -6,14 +6,300 @@ mwapi is a MIT-licensed library provides a very simple convenience wrapper aroun
 It requires Python 3 and that your wiki is using MediaWiki 1.15.3 or greater.'''
 
 # import all the necessary dependencies
-import requests
+import argparse
+import csv
 import json
-import mwapi #importing mwapi
-import re #importing regular expression
-import pywikibot #import pywikibot dependencies
-from pywikibot.data.sparql import SparqlQuery #import dependencies for sparql query
+import os
+import queue #hands the members listed by the crawler threads to the caller
+import threading #the shared client is used from several threads
+from concurrent.futures import ThreadPoolExecutor #fetches the next page of a category while the current one is used
+from typing import TYPE_CHECKING, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+from html_extract import clean_extmetadata #precompiled extractor for the html extmetadata
+from instrumentation import Metrics, endpoint_name #request counts, bytes and latency of every endpoint
+from throttle import Throttle, Throttled, check_response #maxlag, Retry-After, backoff and adaptive concurrency of every host
 
-def get_categories_list(title, lang) -> list:
+if TYPE_CHECKING: #mwapi is imported with the first session, see WikiClient.session
+    import mwapi
+
+USER_AGENT = "Outreachy round fall 2022"
+DEFAULT_HOST = "https://{0}.wikimedia.org"
+OTHER_HOSTS = {"wikidata": "https://www.wikidata.org"} #the wikis that are not at <lang>.wikimedia.org
+
+
+class WikiClient:
+    
+    """
+    shared api client that keeps one keep-alive connection pool per host (lang) so every function reuses the same connections
+    instead of doing a new TCP+TLS handshake for each request
+
+    Args:
+        user_agent (string): the user agent sent with every request
+        host (string): the host for each lang, {0} is replaced with the lang eg https://{0}.wikimedia.org
+        hosts (dict): the host of the langs that do not follow host, OTHER_HOSTS when host is the default
+        pool_maxsize (int): how many keep-alive connections are kept open for each host
+        timeout (float): how long to wait for the server before giving up, None waits forever
+        cache (ResponseCache): optional cache the responses are reused from, see response_cache.py
+        metrics (Metrics): where the requests, bytes, latencies and cache hits are counted, see instrumentation.py
+        throttle (Throttle): sends maxlag, retries what the server pushes back on and adapts the concurrency of every
+            host, see throttle.py. a Throttle growing up to pool_maxsize requests per host is made when it is not given
+    """
+
+    def __init__(self, user_agent=USER_AGENT, host=DEFAULT_HOST, pool_maxsize=10, timeout=None, cache=None, metrics=None, throttle=None, hosts=None):
+        self.user_agent = user_agent
+        self.host = host
+        self.hosts = hosts if hosts is not None else OTHER_HOSTS if host == DEFAULT_HOST else {}
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.throttle = throttle if throttle is not None else Throttle(max_concurrency=pool_maxsize, metrics=self.metrics)
+        self.requests_served = 0
+        self._sessions = {} #one mwapi session (and so one connection pool) for each lang
+        self._lock = threading.Lock()
+
+    def session(self, lang) -> "mwapi.Session":
+        
+        """
+        gets the mwapi session for the host of lang, creating it on first use
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+
+        Returns:
+            session (mwapi.Session): the session shared by every request sent to this host
+        """
+        
+        with self._lock:
+            if lang not in self._sessions:
+                import mwapi, requests #mwapi (which imports aiohttp) and requests take most of the import time, so they are loaded with the first session
+                from requests.adapters import HTTPAdapter #keep-alive connection pool for each host
+                http = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize) #a single host per session so a single pool is needed
+                http.mount("https://", adapter)
+                http.mount("http://", adapter)
+                http.hooks["response"].append(self._count_bytes)
+                http.hooks["response"].append(check_response) #429, 503 and maxlag raise Throttled so the throttle retries them
+                self._sessions[lang] = mwapi.Session(
+                    host=self.hosts.get(lang) or self.host.format(lang),
+                    user_agent=self.user_agent,
+                    timeout=self.timeout,
+                    session=http,
+                )
+            return self._sessions[lang]
+
+    def get(self, lang, params, cache=True) -> dict:
+        
+        """
+        sends a get request to the api of lang over the shared connection pool, or reuses the cached response
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            params (dict): the parameters of the api request
+            cache (bool): whether the cache of the client may answer the request, False always goes to the network
+
+        Returns:
+            response (dict): the json response of the api
+        """
+        
+        endpoint = endpoint_name(params)
+        use_cache = cache and self.cache is not None
+        if use_cache:
+            response = self.cache.get(lang, params)
+            if response is not None:
+                self.metrics.record_cache_hit(endpoint)
+                return response
+        
+        response = self.throttle.call(lang, endpoint, self._send, lang, endpoint, params)
+        
+        if use_cache:
+            self.cache.set(lang, params, response)
+        return response
+
+    def _send(self, lang, endpoint, params) -> dict:
+        
+        """
+        one attempt of a request, timed and counted
+        """
+        
+        if self.throttle.maxlag is not None:
+            params = dict(params, maxlag=self.throttle.maxlag) #the api refuses the request while the replicas lag, instead of adding to the lag
+        with self.metrics.timed(endpoint):
+            response = self.session(lang).get(**params) #mwapi adds format=json to the parameters it is given
+        with self._lock:
+            self.requests_served += 1
+        return response
+
+    def _count_bytes(self, response, *args, **kwargs):
+        
+        """
+        response hook of the requests session that counts the bytes received for each endpoint
+        """
+        
+        params = {key: values[0] for key, values in parse_qs(urlparse(response.request.url).query).items()}
+        self.metrics.record_bytes(endpoint_name(params), len(response.content))
+
+    def continuation(self, lang, params, cache=True):
+        
+        """
+        sends a get request and keeps following the 'continue' field of the response until the api has nothing left
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            params (dict): the parameters of the api request, with the continue values of an earlier response to start from there
+            cache (bool): whether the cache of the client may answer the requests, see get
+
+        Returns:
+            generator of the json responses of the api, one per request
+        """
+        
+        first_params = dict({"continue": ""}, **params) #opts in to the simple continuation of the api
+        params = first_params
+        while True:
+            response = self.get(lang, params, cache=cache)
+            yield response
+            if 'continue' not in response:
+                break
+            params = dict(first_params, **response['continue']) #the continue values of the last response only, a stale clcontinue would skip pages
+
+    @property
+    def connections_opened(self) -> int:
+        
+        """
+        the number of connections opened to all the hosts since the client was created
+        """
+        
+        with self._lock:
+            sessions = list(self._sessions.values())
+        
+        opened = 0
+        for session in sessions:
+            pools = session.session.get_adapter(session.api_url).poolmanager.pools
+            opened += sum(pools[pool_key].num_connections for pool_key in pools.keys())
+        return opened
+
+    def stats(self) -> dict:
+        
+        """
+        how many connections the client opened against how many requests it served
+
+        Returns:
+            stats (dict): connections_opened, requests_served, the concurrency of every host and the statistics of the cache when there is one
+        """
+        
+        stats = {"connections_opened": self.connections_opened, "requests_served": self.requests_served, "concurrency": self.throttle.stats()}
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def close(self):
+        
+        """
+        closes the connection pools of all the hosts
+        """
+        
+        with self._lock:
+            for session in self._sessions.values():
+                session.session.close()
+            self._sessions.clear()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client() -> WikiClient:
+    
+    """
+    the client shared by all the functions when no client is passed to them
+
+    Returns:
+        client (WikiClient): the module wide shared client
+    """
+    
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = WikiClient()
+        return _default_client
+
+def _chunks(items, size):
+    
+    """
+    splits an iterable into lists of at most size items without reading it all into memory
+
+    Args:
+        items (iterable): the items to split eg titles or pageids
+        size (int): the largest number of items in a chunk
+
+    Returns:
+        generator of lists of items
+    """
+    
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _query_batches(client, lang, params, cache=True):
+    
+    """
+    sends a query and follows its continuation, merging the pages of every response until the api marks the batch as complete.
+    props like categories or imageinfo can be split over several responses for the same pages, so lists are appended
+
+    Args:
+        client (WikiClient): the shared api client
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        params (dict): the parameters of the query, with the continue values of an earlier batch to start from there
+        cache (bool): whether the cache of the client may answer the requests
+
+    Returns:
+        generator of (pages, normalized, next_continue) for each complete batch, pages maps the title to the merged page,
+        normalized maps the title sent to the title the api normalized it to and next_continue is the continue values
+        the next batch starts from, None after the last batch
+    """
+    
+    pages = {}
+    normalized = {}
+    for response in client.continuation(lang, params, cache=cache):
+        query = response.get('query', {})
+        for normalized_item in query.get('normalized', []):
+            normalized[normalized_item['from']] = normalized_item['to']
+        
+        response_pages = query.get('pages', {})
+        if isinstance(response_pages, dict): #formatversion 1 gives a dictionary keyed by pageid, formatversion 2 a list
+            response_pages = response_pages.values()
+        for page in response_pages:
+            merged_page = pages.setdefault(page['title'], {})
+            for page_key, page_value in page.items():
+                if isinstance(page_value, list):
+                    merged_page.setdefault(page_key, []).extend(page_value)
+                else:
+                    merged_page[page_key] = page_value
+        
+        if 'batchcomplete' in response:
+            yield pages, normalized, response.get('continue')
+            pages, normalized = {}, {}
+    
+    if pages:
+        yield pages, normalized, None
+
+def _query_pages(client, lang, params, cache=True):
+    
+    """
+    _query_batches without the continue values
+
+    Returns:
+        generator of (pages, normalized) for each complete batch
+    """
+    
+    for pages, normalized, next_continue in _query_batches(client, lang, params, cache=cache):
+        yield pages, normalized
+
+def get_categories_list(title, lang, client=None) -> list:
     
     """
     gets all the categories of the file using api: https://commons.wikimedia.org/w/api.php
@@ -21,15 +307,13 @@ def get_categories_list(title, lang) -> list:
     Args:
         title (string): the title of the commons file
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
 
     Returns:
         categories_list ([string]): list containing all the categories from the api associated with the file
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang),
-        user_agent="Outreachy round fall 2022"
-    )
+    client = client or get_client() #reuses the pooled connections instead of a new session on every call
 
     params = {
             "action": "query",
@@ -39,7 +323,7 @@ def get_categories_list(title, lang) -> list:
             "format": "json",
     }
 
-    response = session.get(params) #get request for the wikiapi
+    response = client.get(lang, params) #get request for the wikiapi
     response_pages = response['query']['pages'] 
     page_id = list(response_pages.keys())[0] # gets the pageid
     categories = response_pages[page_id]['categories'] #gets values of the categories the file belongs to
@@ -49,7 +333,7 @@ def get_categories_list(title, lang) -> list:
 
 #get_categories_list('File:Açude_Cedro_-_Detalhe_do_acabamento_da_barragem_principal.jpg', lang='commons')
 
-def get_hidden_categories_list(title, lang) -> list:
+def get_hidden_categories_list(title, lang, client=None) -> list:
     
     """
     gets all the hidden categories of the file using api: https://commons.wikimedia.org/w/api.php
@@ -57,15 +341,13 @@ def get_hidden_categories_list(title, lang) -> list:
     Args:
         title (string): the title of the commons file
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
 
     Returns:
         categories_hidden_list ([string]): list containing all the hidden categories from the api associated with the file
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang),
-        user_agent="Outreachy round fall 2022"
-    )
+    client = client or get_client() #reuses the pooled connections instead of a new session on every call
 
     params = {
             "action": "query",
@@ -75,7 +357,7 @@ def get_hidden_categories_list(title, lang) -> list:
             "format": "json",
     }
 
-    response = session.get(params) #get request for the wikiapi
+    response = client.get(lang, params) #get request for the wikiapi
     response_pages = response['query']['pages'] 
     page_id = list(response_pages.keys())[0] # gets the pageid
     categories = response_pages[page_id]['categories'] #gets values of the categories the file belongs to
@@ -85,278 +367,774 @@ def get_hidden_categories_list(title, lang) -> list:
 
 #get_hidden_categories_list('File:Açude_Cedro_-_Detalhe_do_acabamento_da_barragem_principal.jpg', lang='commons')
 
+def _split_categories(page) -> dict:
+    
+    """
+    the categories of a page queried with clprop=hidden, split into {'hidden': [string], 'visible': [string]}
+    """
+    
+    file_categories = {'hidden': [], 'visible': []}
+    for categories_item in page.get('categories', []):
+        if categories_item.get('hidden', False) is not False: #formatversion 1 gives an empty string, formatversion 2 gives true
+            file_categories['hidden'].append(categories_item['title'])
+        else:
+            file_categories['visible'].append(categories_item['title'])
+    return file_categories
 
-def get_metadata_item(title, lang) -> str:
+def get_categories_bulk(titles, lang, client=None, chunk_size=50) -> dict:
     
     """
-    metadata of the file on the homepage using api: https://commons.wikimedia.org/w/api.php
+    gets the hidden and visible categories of many files at once using api: https://commons.wikimedia.org/w/api.php
+    the titles are sent 50 at a time (the most the api accepts) and clprop=hidden marks the hidden categories,
+    so one request gives both kinds of categories for a whole chunk of files
 
     Args:
-        title (string): the title of the commons file
+        titles ([string]): the titles of the commons files, any iterable
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        chunk_size (int): how many titles are sent in each request
 
     Returns:
-        all metadata and their values as strings
+        files_categories (dict): maps each title to {'hidden': [string], 'visible': [string]}
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang), #lang can vary depending on the api and language working with eg lang can be fr, as, commons, en etc
-        user_agent="Outreachy round fall 2022"
-    )
+    client = client or get_client()
+    
+    files_categories = {}
+    for titles_chunk in _chunks(titles, chunk_size):
+        params = {
+                "action": "query",
+                "prop":"categories",
+                "titles": "|".join(titles_chunk),
+                "clprop": "hidden", #marks the hidden categories instead of filtering them out
+                "cllimit": "max",
+                "format": "json",
+        }
+        
+        chunk_pages = {}
+        chunk_normalized = {}
+        for pages, normalized in _query_pages(client, lang, params): #follows clcontinue when the categories do not fit in one response
+            chunk_pages.update(pages)
+            chunk_normalized.update(normalized)
+        
+        for title in titles_chunk:
+            page = chunk_pages.get(chunk_normalized.get(title, title), {}) #the api answers with the normalized title eg underscores become spaces
+            files_categories[title] = _split_categories(page) #a title asked for twice gets the same categories, not twice as many
+    
+    return files_categories
 
-    params = {
-            "action": "query",
-            "prop":"imageinfo", #Returns file information and upload history. from the api https://commons.wikimedia.org/w/api.php?action=help&modules=query
-            "titles":title,
-            "iiprop":"metadata", #Which file information to get eg metadata, size, dimension, mime
-            "iimetadataversion":"latest", #Version of metadata to use. If latest is specified, use latest version. Defaults to 1 for backwards compatibility
-            "format": "json",
-    }
+#get_categories_bulk(['File:Açude_Cedro_-_Detalhe_do_acabamento_da_barragem_principal.jpg'], lang='commons')
+
+
+def get_imageinfo_bulk(titles, lang, client=None, iiprop="extmetadata|commonmetadata|size|dimensions|mime|mediatype", chunk_size=50) -> dict:
+    
+    """
+    gets the imageinfo of many files at once using api: https://commons.wikimedia.org/w/api.php
+    the titles are sent 50 at a time, the most the api accepts for extmetadata
+
+    Args:
+        titles ([string]): the titles of the commons files, any iterable
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        iiprop (string): which file information to get eg metadata, extmetadata, size, dimensions, mime
+        chunk_size (int): how many titles are sent in each request
+
+    Returns:
+        files_imageinfo (dict): maps each title to its imageinfo list, empty when the file does not exist
+    """
+    
+    client = client or get_client()
+    
+    files_imageinfo = {}
+    for titles_chunk in _chunks(titles, chunk_size):
+        params = {
+                "action": "query",
+                "prop": "imageinfo",
+                "titles": "|".join(titles_chunk),
+                "iiprop": iiprop,
+                "format": "json",
+        }
+        if "metadata" in iiprop.split("|"):
+            params["iimetadataversion"] = "latest" #Version of metadata to use. Defaults to 1 for backwards compatibility
+        
+        chunk_pages = {}
+        chunk_normalized = {}
+        for pages, normalized in _query_pages(client, lang, params):
+            chunk_pages.update(pages)
+            chunk_normalized.update(normalized)
+        
+        for title in titles_chunk:
+            files_imageinfo[title] = chunk_pages.get(chunk_normalized.get(title, title), {}).get('imageinfo', [])
+    
+    return files_imageinfo
+
+#get_imageinfo_bulk(['File:Açude_Cedro_-_Detalhe_do_acabamento_da_barragem_principal.jpg'], lang='commons')
+
+class MetadataRecord(NamedTuple):
+    
+    """
+    one metadata value of a file, key is the name of the nested value when the metadata has a list of values
+    """
+    
+    title: str
+    name: str
+    key: Optional[str]
+    value: object
 
-    response = session.get(params)
-    response_imageinfo = response['query']['pages']  #selects the query -> pages dictionary from the api response
-    page_id = list(response_imageinfo.keys())[0] #automates how to extract information using the pageid than manually entering it
-    imageinfo = response_imageinfo[page_id]['imageinfo']
+
+class FileRecord(NamedTuple):
+    
+    """
+    summary data of a file from its imageinfo, extmetadata and commonmetadata
+    """
+    
+    title: str
+    datetime_original: Optional[str]
+    license: Optional[str]
+    license_url: Optional[str]
+    image_description: Optional[str]
+    artist: Optional[str]
+    credit: Optional[str]
+    categories: Optional[str]
+    gps_latitude: Optional[float]
+    gps_longitude: Optional[float]
+    size: Optional[int]
+    width: Optional[int]
+    height: Optional[int]
+    mime: Optional[str]
+    mediatype: Optional[str]
+
+
+def _titles(title) -> list:
+    return [title] if isinstance(title, str) else title #a single title or any iterable of titles
+
+def _metadata_records(title, imageinfo):
+    
+    """
+    the MetadataRecord of every metadata value of a file from its imageinfo list
+    """
     
     for response_value in imageinfo:
-        response_item = response_value['metadata'] #selects the metadata dictionary
-        for metadata_value in response_item: #loops through this list
+        for metadata_value in response_value.get('metadata') or []: #loops through the metadata list
             if type(metadata_value['value']) == list: #some of the metadata further have a list of dictionaries that give more information
-                for i in range (len(metadata_value['value'])-1): # looping through this list and extracting these informations
-                    print(metadata_value["name"], '-> ', metadata_value['value'][i]['name'], '->', metadata_value['value'][i]['value'])
-                    
+                for nested_value in metadata_value['value']:
+                    yield MetadataRecord(title, metadata_value['name'], nested_value['name'], nested_value['value'])
             else: #conditional when the value of the metadata is not a list
-                print(metadata_value["name"], '-> ', metadata_value['value'])
-            
+                yield MetadataRecord(title, metadata_value['name'], None, metadata_value['value'])
+
+def get_metadata_item(title, lang, client=None, chunk_size=50):
+    
+    """
+    metadata of the file on the homepage using api: https://commons.wikimedia.org/w/api.php
+
+    Args:
+        title (string or [string]): the title of the commons file, or many titles which are fetched 50 per request
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        chunk_size (int): how many titles are sent in each request
+
+    Returns:
+        generator of MetadataRecord(title, name, key, value) for all the metadata of the files
+    """
+    
+    for titles_chunk in _chunks(_titles(title), chunk_size):
+        files_imageinfo = get_imageinfo_bulk(titles_chunk, lang, client=client, iiprop="metadata", chunk_size=chunk_size) #Version of metadata is the latest
+        
+        for file_title in titles_chunk:
+            yield from _metadata_records(file_title, files_imageinfo[file_title])
             
 #get_metadata_item('File:Açude_Cedro_-_Detalhe_do_acabamento_da_barragem_principal.jpg', lang='commons')
 
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
 
-def get_all_files_data(title, lang) -> str:
+def _file_record(title, imageinfo_item) -> FileRecord:
+    
+    """
+    builds the FileRecord of a file from one item of its imageinfo list
+    """
+    
+    extmetadata = clean_extmetadata(imageinfo_item.get('extmetadata') or {}) #the ImageDescription, Artist and Credit come as html
+    commonmetadata = {item['name']: item['value'] for item in imageinfo_item.get('commonmetadata') or [] if not isinstance(item['value'], list)}
+    
+    return FileRecord(
+        title=title,
+        datetime_original=extmetadata.get('DateTimeOriginal', commonmetadata.get('DateTimeOriginal')),
+        license=extmetadata.get('LicenseShortName', extmetadata.get('License')),
+        license_url=extmetadata.get('LicenseUrl'),
+        image_description=extmetadata.get('ImageDescription'),
+        artist=extmetadata.get('Artist'),
+        credit=extmetadata.get('Credit'),
+        categories=extmetadata.get('Categories'),
+        gps_latitude=_to_float(extmetadata.get('GPSLatitude', commonmetadata.get('GPSLatitude'))), #commonmetadata has the coordinates when extmetadata does not
+        gps_longitude=_to_float(extmetadata.get('GPSLongitude', commonmetadata.get('GPSLongitude'))),
+        size=imageinfo_item.get('size'),
+        width=imageinfo_item.get('width'),
+        height=imageinfo_item.get('height'),
+        mime=imageinfo_item.get('mime'),
+        mediatype=imageinfo_item.get('mediatype'),
+    )
+
+def get_all_files_data(title, lang, client=None, chunk_size=50):
     
     """
     summary data of te file on the homepage using api: https://commons.wikimedia.org/w/api.php
 
     Args:
-        title (string): the title of the commons file
+        title (string or [string]): the title of the commons file, or many titles which are fetched 50 per request
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        chunk_size (int): how many titles are sent in each request
 
     Returns:
-        DateTimeOriginal|Categories|License|LicenseUrl|ImageDescription|Credit|GPSLatitude|GPSLongitude
+        generator of FileRecord with DateTimeOriginal|Categories|License|LicenseUrl|ImageDescription|Artist|Credit|GPSLatitude|GPSLongitude|size|mime, one per file
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang),
-        user_agent="Outreachy round fall 2022"
-    )
+    for titles_chunk in _chunks(_titles(title), chunk_size):
+        files_imageinfo = get_imageinfo_bulk(titles_chunk, lang, client=client, chunk_size=chunk_size)
+        
+        for file_title in titles_chunk:
+            for imageinfo_item in files_imageinfo[file_title]: #a file has a single imageinfo item, the latest version
+                yield _file_record(file_title, imageinfo_item)
 
-    params = {
-            "action": "query",
-            "prop":"imageinfo",
-            "titles": title,
-            "iiprop":"extmetadata|commonmetadata|size|dimensions|mime|mediatype", #the type of file information to get
-            "format": "json",
-    }
+def write_jsonl(records, file) -> int:
+    
+    """
+    writes records to a JSON Lines file one at a time, so the whole result set is never held in memory
 
+    Args:
+        records (iterable): FileRecord or MetadataRecord, eg the generator of get_all_files_data
+        file (file object): the text file to write to
 
-    response = session.get(params)
-    response_pages = response['query']['pages'] 
+    Returns:
+        count (int): how many records were written
+    """
     
-    page_id = list(response_pages.keys())[0]  # automates the pageid for each file/a file 
-    imageinfo = response_pages[page_id]['imageinfo'] # retrieves the value of item imageinfo
+    count = 0
+    for record in records:
+        file.write(json.dumps(record._asdict(), ensure_ascii=False))
+        file.write("\n")
+        count += 1
+    return count
+
+def write_csv(records, file) -> int:
     
-    for response_item in imageinfo: #loops through the imageinfo list
-        for response_item_keys in list(response_item.keys()): #automate the keys of the response_item dictionary to get the values
-            
-            if type(response_item[response_item_keys]) == list: #conditional statement if the values is a list
-                for response_item_nestedkeys in response_item[response_item_keys]: #loop through this list
-                    if type(response_item_nestedkeys['value']) == list:  #conditional statement if the value of the above list is a list
-                        for nested_keys in response_item_nestedkeys['value']: #loop through this list
-                            print(response_item_nestedkeys['name'], '-> ', nested_keys['name'], '-> ', nested_keys['value'])
-                    else:
-                        print(response_item_nestedkeys['name'], ' -> ', response_item_nestedkeys['value'])
-                    
-            elif isinstance(response_item[response_item_keys], dict): #conditional statement if the values is a dictionary
-                for response_itemkeys in list(response_item[response_item_keys].keys()): #automate the keys of the response_itemkeys dictionary to get the values
-                    if response_itemkeys == 'ImageDescription': #conditional statement if the dictionary value is a ImageDescription inorder to use this particular regex to extract image description
-                        try: #the imagedescription difer for different artist
-                            image_value = re.findall(r"(.*?)<a\b[^>]*>([^<]+)<\/a>", response_item[response_item_keys][response_itemkeys]['value']) # regex to extract the image description from anchor html tags
-                            print(response_itemkeys, "-> ", image_value[0][0], image_value[0][1])
-
-                        except:
-                            print(response_itemkeys, "-> ", response_item[response_item_keys][response_itemkeys]['value'])
-                            
-                    elif response_itemkeys == 'Artist': #conditional statement if the dictionary value is an artist inorder to use this particular regex to extract artist name
-                        try: #the artist difer for different artist
-                            artist_value = re.findall(r"<a\b[^>]*>([^<]+)<\/a>", response_item[response_item_keys][response_itemkeys]['value']) # regex to extract the artist from anchor html tags
-                            print(response_itemkeys, '-> ', artist_value[0])
-                        except:
-                            artist_value = re.findall(r"<span\b[^>]*>([^<]+)<\/span>", response_item[response_item_keys][response_itemkeys]['value']) # regex to extract the artist from anchor html tags
-                            print(response_itemkeys, '-> ', artist_value[0])
-                    
-                    elif response_itemkeys == 'Credit': #conditional statement if the dictionary value is a credit property inorder to use this particular regex to extract credit
-                        try: #the credit difer for different artist
-                            credit_value = re.findall(r"<span\b[^>]*>([^<]+)<\/span>", response_item[response_item_keys][response_itemkeys]['value']) # regex to extract the credit from span html tags
-                            print(response_itemkeys, "-> ", credit_value[0])
-                        except:
-                            credit_value = re.findall(r"(.*?)<a\b[^>]*>([^<]+)<\/a>", response_item[response_item_keys][response_itemkeys]['value']) # regex to extract the credit from span html tags
-                            print(response_itemkeys, "-> ", credit_value[0][0], credit_value[0][1])
-                            
-                    else:
-                        print(response_itemkeys, ' -> ', response_item[response_item_keys][response_itemkeys]['value'])
-                        
-            else:
-                print(response_item_keys, ' -> ', response_item[response_item_keys])
+    """
+    writes records to a CSV file one at a time, the header comes from the fields of the first record
+
+    Args:
+        records (iterable): FileRecord or MetadataRecord, eg the generator of get_all_files_data
+        file (file object): the text file to write to, opened with newline=''
+
+    Returns:
+        count (int): how many records were written
+    """
+    
+    writer = None
+    count = 0
+    for record in records:
+        if writer is None:
+            writer = csv.writer(file)
+            writer.writerow(record._fields)
+        writer.writerow(record)
+        count += 1
+    return count
     
 #get_all_files_data('File:Açude_Cedro_-_Detalhe_do_acabamento_da_barragem_principal.jpg', lang='commons')
 
-def get_all_files_subcat(cat_title, lang='commons') -> list:
+class CategoryMember(NamedTuple):
     
     """
-    files/images of wikidata item for subcategory
+    a page in a category as given by list=categorymembers
+    """
+    
+    pageid: int
+    title: str
+    ns: int
+
+
+def iter_category_members(cat_title, lang='commons', namespace=6, client=None, limit=500, prefetch=True):
+    
+    """
+    streams the members of a category page by page, following cmcontinue so big categories are not cut off at 500.
+    the request for the next page is sent before the members of the current page are given out, so downstream work
+    on page 1 overlaps with page 2 being in flight, and at most two pages are held in memory
 
     Args:
         cat_title (string): the title/name of the category of interest
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        namespace (int or string): 6 gets files, 14 gets subcategories, "6|14" gets both
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        limit (int): how many members are asked for in each request, 500 is the most the api gives
+        prefetch (bool): whether the next page is fetched in the background while the current page is used
 
     Returns:
-         files_list ([string]): the title of the files/images of wikidata item for category(subcategory) for each wikidata id in a category
+        generator of CategoryMember(pageid, title, ns)
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang),
-        user_agent="Outreachy round fall 2022"
-    )
-    params_1 = {
-                "action": "query",
-                "generator":"categorymembers", #Get information about all categories used in the page
-                "gcmlimit": 500,
-                "gcmtitle": cat_title,
-                "gcmnamespace": 6, #the namespace here means it gets just files, but a 14 gets a subcategory
-                "format": "json",
-        }
+    client = client or get_client()
+    params = {
+            "action": "query",
+            "list": "categorymembers",
+            "cmtitle": cat_title,
+            "cmnamespace": namespace,
+            "cmprop": "ids|title",
+            "cmlimit": limit,
+            "continue": "",
+            "format": "json",
+    }
     
-    response = session.get(params_1)
-    pageids = list(response['query']['pages'].keys())
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        response = client.get(lang, params)
+        while True:
+            next_params = dict(params, **response['continue']) if 'continue' in response else None
+            next_response = executor.submit(client.get, lang, next_params) if executor and next_params else None
+            
+            for member in response['query']['categorymembers']:
+                yield CategoryMember(member['pageid'], member['title'], member['ns'])
+            
+            if next_params is None:
+                break
+            response = next_response.result() if next_response else client.get(lang, next_params)
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True) #the caller can stop reading before the last page
+
+#iter_category_members('Category:2021 in São Paulo (state)', lang='commons')
+
+def get_all_files_subcat(cat_title, lang='commons', client=None) -> list:
     
-    files_list=[response['query']['pages'][str(pageid)]['title'] for pageid in pageids]
+    """
+    files/images of wikidata item for subcategory
+
+    Args:
+        cat_title (string): the title/name of the category of interest
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+
+    Returns:
+         files_list ([string]): the title of the files/images of wikidata item for category(subcategory) for each wikidata id in a category
+    """
+    
+    files_list=[member.title for member in iter_category_members(cat_title, lang, namespace=6, client=client)] #namespace 6 gets just files, but a 14 gets a subcategory
     
     return files_list
 
 #get_all_files_subcat('Category:2021 in São Paulo (state)', lang='commons')
 
-def get_all_files_cat(cat, lang):
+def crawl_category_tree(cat, lang='commons', max_depth=None, client=None, workers=4, min_depth=0, queue_size=1000):
     
     """
-    files/images of all the subcategory in a category
+    breadth-first crawl of a category and its subcategories, streaming (category, file) pairs as they are found.
+    the subcategories of a level are expanded concurrently, a category is never listed twice so cycles in the category
+    tree end, and a file found in several categories is only given out the first time
 
     Args:
-        cat_title (string): the title/name of all the files in each subcategory in a category of interest
+        cat (string): the title/name of the category at the root of the tree
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        max_depth (int): how many levels of subcategories are followed, 0 lists only the root, None follows the whole tree
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        workers (int): how many sibling categories are listed at the same time
+        min_depth (int): files of categories shallower than this are not listed, their subcategories are still followed
+        queue_size (int): how many members can wait for the caller before the listing threads pause
 
     Returns:
-         cat_file_list([string]): the title of the files/images of wikidata item for each subcategory in a category
+        generator of (category, file) with the title of the category the file was found in and the title of the file
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang),
-        user_agent="Outreachy round fall 2022"
-    )
+    client = client or get_client()
     
-    params = {
-            "action": "query",
-            "list":"categorymembers", #Get information about all categories used in the page
-            "cmtitle": cat,
-            "cmtype": 'subcat', #get sub categories in a category
-            "format": "json",
-    }
+    visited_categories = {cat}
+    seen_files = set()
+    stop = threading.Event()
+    level = [cat]
+    depth = 0
+    
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while level:
+            expand = max_depth is None or depth < max_depth
+            namespace = "|".join(str(namespace) for namespace, wanted in ((6, depth >= min_depth), (14, expand)) if wanted) #the files of a level above min_depth are not listed at all
+            if not namespace:
+                break
+            members = queue.Queue(maxsize=queue_size) #bounded so the listing threads wait for the caller instead of filling memory
+            
+            def _put(item) -> bool:
+                while not stop.is_set():
+                    try:
+                        members.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        continue
+                return False #the crawl was stopped, the listing ends without fetching its next pages
+            
+            def _list_category(category):
+                try:
+                    for member in iter_category_members(category, lang, namespace=namespace, client=client, prefetch=False):
+                        if not _put((category, member)):
+                            return
+                    _put((category, None)) #this category is done
+                except Exception as error:
+                    _put((category, error))
+                
+            for category in level:
+                executor.submit(_list_category, category)
+            
+            next_level = []
+            pending = len(level)
+            while pending:
+                category, member = members.get()
+                if member is None:
+                    pending -= 1
+                elif isinstance(member, Exception):
+                    raise member
+                elif member.ns == 14:
+                    if member.title not in visited_categories:
+                        visited_categories.add(member.title)
+                        next_level.append(member.title)
+                elif depth >= min_depth and member.title not in seen_files:
+                    seen_files.add(member.title)
+                    yield category, member.title
+            
+            level = next_level
+            depth += 1
+    finally:
+        stop.set() #the listing threads stop at their next member when the caller stops reading early or a listing failed
+        executor.shutdown(wait=False, cancel_futures=True) #the sibling listings that have not started are dropped
+
+#crawl_category_tree('Category:Wiki Loves Monuments 2021 in Brazil', lang='commons', max_depth=2)
+
+def get_all_files_cat(cat, lang, client=None):
+    
+    """
+    files/images of all the subcategory in a category
 
-    response = session.get(params) #get request for the wikiapi to get the category members pageid
-    category_member = response['query']['categorymembers']
+    Args:
+        cat_title (string): the title/name of all the files in each subcategory in a category of interest
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+
+    Returns:
+         cat_file_list([string]): the title of the files/images of wikidata item for each subcategory in a category, each file once
+    """
     
-    cat_file_list= sum([get_all_files_subcat(category_item['title'], lang='commons') for category_item in category_member], []) #add more files to the list to create the category list
-    '''for category_item in category_member:
-        cat_title = category_item['title']
-        files = get_all_files_subcat(cat_title, lang='commons')
-        cat_file_list += files '''
+    cat_file_list = [file_title for category, file_title in crawl_category_tree(cat, lang, max_depth=1, min_depth=1, client=client)] #the files of the subcategories one level down, appended in linear time
         
     return cat_file_list
 
 #get_all_files_cat('Category:Top_contributors_of_Wiki_Loves_Monuments_2020_in_Brazil', lang='commons')
 
-def get_wikidata(cat, lang) -> list:
+def get_category_revisions(cat_title, lang='commons', client=None) -> dict:
     
     """
-    unique wikidata item for each image in all subcategory of a category of interest
+    the latest revision of every file of a category, 500 files per request with generator=categorymembers and prop=info.
+    the requests always go to the network, never to the cache of the client
 
     Args:
-        cat (string): the title/name of the category of interest
+        cat_title (string): the title/name of the category of interest
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
 
     Returns:
-        new_wikidata_list ([string]): the unique wikidata item for each image in a category
+        files_revisions (dict): maps each title to {'pageid': int, 'lastrevid': int}
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang),
-        user_agent="Outreachy round fall 2022"
-    )
-    
+    client = client or get_client()
     params = {
             "action": "query",
-            "generator":"categorymembers", #Get information about all categories used in the page
-            "gcmlimit": 500,
-            "gcmtitle": cat,
-            "gcmnamespace": 6, #get files as namespace 6 is for files note it can also be used to get subcategories 
+            "generator": "categorymembers",
+            "gcmtitle": cat_title,
+            "gcmnamespace": 6, #files
+            "gcmlimit": "max",
+            "prop": "info",
             "format": "json",
     }
+    
+    files_revisions = {}
+    for pages, normalized in _query_pages(client, lang, params, cache=False): #a cached listing would hide every edit
+        for title, page in pages.items():
+            files_revisions[title] = {'pageid': page['pageid'], 'lastrevid': page['lastrevid']}
+    return files_revisions
 
-    response = session.get(params) #get request for the wikiapi to get the category members pageid
-    pageids = list(response['query']['pages'].keys()) #automatically get the pageids
+def load_snapshot(path) -> dict:
+    
+    """
+    loads the snapshot a previous sync_category saved, None when there is none yet
+    """
+    
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as snapshot_file:
+        return json.load(snapshot_file)
+
+def save_snapshot(snapshot, path):
+    
+    """
+    saves a snapshot atomically, a crash while writing leaves the previous snapshot in place
+    """
+    
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as snapshot_file:
+        json.dump(snapshot, snapshot_file, ensure_ascii=False)
+    os.replace(temporary_path, path)
+
+def sync_category(cat_title, lang='commons', snapshot_path=None, snapshot=None, client=None) -> dict:
+    
+    """
+    incremental sync of the categories and summary data of the files of a category. the latest revision of every
+    member is listed in bulk (500 per request) and compared with the lastrevid of the file in the previous snapshot,
+    then only the new and edited files are refetched and merged in, and the removed ones are dropped.
+    so a nightly run costs the number of edits plus one request per 500 files, not a full refetch
+
+    Args:
+        cat_title (string): the title/name of the category of interest
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        snapshot_path (string): the json file the snapshot is loaded from and saved to
+        snapshot (dict): the previous snapshot, used instead of loading it from snapshot_path
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+
+    Returns:
+        snapshot (dict): the category, lang, the files mapping each title to
+            its pageid, lastrevid, categories and data (FileRecord as a dictionary), and the changes
+            {'added', 'edited', 'removed'} found by this run
+    """
+    
+    client = client or get_client()
+    if snapshot is None and snapshot_path is not None:
+        snapshot = load_snapshot(snapshot_path)
+    if snapshot is None: #the first run fetches everything
+        snapshot = {'category': cat_title, 'lang': lang, 'files': {}}
+    
+    files = snapshot['files']
+    files_revisions = get_category_revisions(cat_title, lang, client=client)
+    
+    added = [title for title in files_revisions if title not in files]
+    edited = [title for title in files_revisions if title in files and files_revisions[title]['lastrevid'] != files[title]['lastrevid']]
+    removed = [title for title in files if title not in files_revisions]
+    
+    changed = added + edited
+    if client.cache is not None: #the entries cached before the edits would be refetched instead of the new revisions
+        refs = [ref for title in changed + removed for ref in ("title:" + title, "pageid:" + str((files_revisions.get(title) or files[title])['pageid']))]
+        client.cache.invalidate_pages(lang, refs)
+    
+    for title in removed:
+        del files[title]
+    
+    files_categories = get_categories_bulk(changed, lang, client=client)
+    files_data = {record.title: record._asdict() for record in get_all_files_data(changed, lang, client=client)}
+    for title in changed:
+        files[title] = dict(files_revisions[title], categories=files_categories.get(title), data=files_data.get(title))
+    
+    snapshot['changes'] = {'added': added, 'edited': edited, 'removed': removed}
+    
+    if snapshot_path is not None:
+        save_snapshot(snapshot, snapshot_path)
+    return snapshot
+
+#sync_category('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons', snapshot_path='ana_beatriz_sampaio.json')
+
+def _depicts_of(entity) -> list:
+    
+    """
+    the wikidata items (Q-ids) of the depicts (P180) statements of a MediaInfo entity, in the order of the statements
+    """
+    
+    statements = entity.get('statements') or entity.get('claims') or {} #an entity with no statements has an empty list instead of a dictionary
+    
+    wikidata_list = []
+    for statement in statements.get('P180', []) if isinstance(statements, dict) else []: #P180 is the wikidata property number for depicts
+        datavalue = statement.get('mainsnak', {}).get('datavalue') #"somevalue" and "novalue" snaks have no datavalue
+        if datavalue:
+            wikidata_list.append(datavalue['value']['id'])
+    return wikidata_list
+
+def get_depicts_bulk(pageids, lang='commons', client=None, chunk_size=50):
     
-    wikidata_list=[]
-    for pageid in pageids:
-        pageid_number = "M" + str(pageid)
-        params_1 = {
+    """
+    gets the depicts (P180) statements of many files at once from their structured data (MediaInfo entities M<pageid>).
+    the ids are joined with | and sent 50 at a time, the most wbgetentities accepts, instead of one request per file
+
+    Args:
+        pageids ([int]): the pageids of the commons files, any iterable, it is read lazily chunk by chunk
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        chunk_size (int): how many entity ids are sent in each request
+
+    Returns:
+        depicts_by_pageid (dict): maps each pageid to the list of wikidata items (Q-ids) it depicts
+        depicts_set (set): the unique wikidata items depicted by all the files
+    """
+    
+    client = client or get_client()
+    
+    depicts_by_pageid = {}
+    depicts_set = set()
+    for pageids_chunk in _chunks(pageids, chunk_size):
+        params = {
             "action": "wbgetentities", #Gets the data for multiple Wikibase entities.
-            "ids": str(pageid_number),
+            "ids": "|".join("M" + str(pageid) for pageid in pageids_chunk),
+            "props": "claims", #only the statements are needed, not the labels or descriptions
             "format": "json",
         }
-
-        response_1 = session.get(params_1) #get request for the wikiapi to get the data/information about this pageid_number passed
-        pagetitle = response_1.get('entities').get(pageid_number).get('title')
-        property_depict = response_1.get('entities').get(pageid_number).get('statements').get('P180', 'XX') #P180 is the wikidata property number for depicts
         
-        if "XX" not in str(property_depict):
-            
-            depictslist=[]
-            for dict_place in range(0, len(property_depict)): #get the mainsnak dictionary
-                try:
-                    wikidata_num = property_depict[dict_place]['mainsnak']['datavalue']['value']['id'] #get the wikidata number 
+        entities = client.get(lang, params).get('entities', {})
+        for pageid in pageids_chunk:
+            wikidata_list = _depicts_of(entities.get("M" + str(pageid), {})) #a file without structured data comes back as missing
+            depicts_by_pageid[int(pageid)] = wikidata_list
+            depicts_set.update(wikidata_list)
+    
+    return depicts_by_pageid, depicts_set
 
-                    wikidata_list.append(wikidata_num)
-                        
-                except:
-                    continue 
-            
-                
-        else:
-            continue
-            
-    new_wikidata_list=list(set([list_item for list_item in wikidata_list])) #further ensure the wikidata numbers in the list are unique
+#get_depicts_bulk([116512339, 116512340], lang='commons')
+
+def get_wikidata(cat, lang, client=None) -> list:
     
-    '''for list_item in wikidata_list:
-        
-        if list_item not in new_wikidata_list: 
-            new_wikidata_list.append()'''
+    """
+    unique wikidata item for each image in all subcategory of a category of interest
+
+    Args:
+        cat (string): the title/name of the category of interest
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+
+    Returns:
+        new_wikidata_list ([string]): the unique wikidata item for each image in a category
+    """
+    
+    client = client or get_client() #reuses the pooled connections instead of a new session on every call
+    
+    pageids = (member.pageid for member in iter_category_members(cat, lang, namespace=6, client=client)) #get files as namespace 6 is for files, following every page of the category
+    depicts_by_pageid, depicts_set = get_depicts_bulk(pageids, lang, client=client) #one request for every 50 files, sent while the category is still being listed
+    
+    new_wikidata_list = list(depicts_set) #the set already ensures the wikidata numbers are unique
             
     return new_wikidata_list
             
 #get_wikidata('Category:Images_by_Prburley_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
 
+_sparql_query = None
+_sparql_query_lock = threading.Lock()
+
+def get_sparql():
+    
+    """
+    the SparqlQuery shared by the whole run instead of building a new one for every query
+
+    Returns:
+        sparql (SparqlQuery): the module wide sparql query object
+    """
+    
+    global _sparql_query
+    with _sparql_query_lock:
+        if _sparql_query is None:
+            from pywikibot.data.sparql import SparqlQuery #pywikibot is slow to import and reads its user-config, so it is only loaded once sparql is used
+            _sparql_query = SparqlQuery() #sparqlquery that allows the use of sparql queries with python
+        return _sparql_query
+
+SPARQL_HOST = "sparql" #the query service has its own limiter in the throttle, separate from the mediawiki hosts
+
+def _send_sparql(sparql, query, metrics) -> dict:
+    
+    """
+    one attempt of a sparql query, timed and counted
+    """
+    
+    with metrics.timed("sparql"):
+        response = sparql.query(query)
+    if response is None: #pywikibot gives None when the answer is not json, eg the timeout page of the query service
+        raise Throttled("the sparql query gave no json")
+    return response
+
+def _query_sparql(sparql, query, metrics, throttle, cache=None) -> dict:
+    
+    """
+    sends a sparql query through the throttle, or reuses its response from the cache of the client. the responses are
+    cached under the SPARQL_HOST lang keyed by the query text, so a warm cache is a recording of the sparql queries too
+    """
+    
+    params = {"query": query}
+    if cache is not None:
+        response = cache.get(SPARQL_HOST, params)
+        if response is not None:
+            metrics.record_cache_hit("sparql")
+            return response
+    response = throttle.call(SPARQL_HOST, "sparql", _send_sparql, sparql, query, metrics)
+    if cache is not None:
+        cache.set(SPARQL_HOST, params, response)
+    return response
+
+ITEM_DETAILS_QUERY = """
+SELECT 
+    ?item ?itemLabel ?itemDescription 
+    ?locationLabel ?locationDescription  
+    ?streetLabel  
+    ?descriptionLabel 
+    ?heritageLabel
+    WHERE {
+    VALUES ?item { %s }
+    ?item wdt:P131 ?location ;
+            wdt:P1435 ?heritage .
+    SERVICE wikibase:label { bd:serviceParam wikibase:language "en". }
+    OPTIONAL {?item 
+            wdt:P6375 ?street ;
+            wdt:P973 ?description ;}
+    }
+"""
+
+def get_item_details(wikidata_list, chunk_size=50, sparql=None, metrics=None, throttle=None, items=None, client=None) -> dict:
+    
+    """
+    labels and description of the location, heritage, street address, and description of many wikidata items,
+    sending chunk_size items in the VALUES clause of a single sparql query instead of one query per item
+
+    Args:
+        wikidata_list ([string]): the wikidata items eg Q123, any iterable
+        chunk_size (int): how many items are sent in each sparql query
+        sparql (SparqlQuery): the sparql query object, the shared one is used when it is not given
+        metrics (Metrics): where the sparql queries are counted and timed, the metrics of the shared client when it is not given
+        throttle (Throttle): retries the queries the query service pushes back on or times out, the throttle of the shared client when it is not given
+        items (ItemCache): when given the rows are built from the cached items, the missing ones fetched 50 per wbgetentities
+            request, instead of sending every item to the sparql query, see item_cache.py
+        client (WikiClient): sends the wbgetentities requests of items and caches the sparql responses when it has a cache,
+            the shared client when it is not given
+
+    Returns:
+        item_details (dict): maps each wikidata item to the list of its result rows, each row maps the variable name to its value
+    """
+    
+    sparql = sparql or get_sparql()
+    client = client or get_client()
+    metrics = metrics or client.metrics
+    throttle = throttle or client.throttle
+    
+    if items is not None: #only the labels of the location and heritage items go through sparql
+        query = lambda sparql_query: _query_sparql(sparql, sparql_query, metrics, throttle, client.cache)
+        return items.item_details(wikidata_list, client, query, chunk_size=chunk_size)
+    
+    item_details = {}
+    for wikidata_chunk in _chunks(wikidata_list, chunk_size):
+        for wikidata_item in wikidata_chunk:
+            item_details.setdefault(wikidata_item, []) #items without a location or heritage status have no rows
+        
+        query = ITEM_DETAILS_QUERY % " ".join("wd:" + wikidata_item for wikidata_item in wikidata_chunk)
+        response = _query_sparql(sparql, query, metrics, throttle, client.cache)
+        results = response['results']['bindings'] #get list of all the response results
+        
+        for response_item in results:
+            wikidata_item = response_item['item']['value'].rsplit('/', 1)[-1] #http://www.wikidata.org/entity/Q123 -> Q123
+            item_details.setdefault(wikidata_item, []).append({response_keys: response_item[response_keys]['value'] for response_keys in response_item})
+    
+    return item_details
+
+#get_item_details(['Q10333827', 'Q10350893'])
+
 #this function gets the label and description of selected properties(i chose properties depicted in the cultu)
 
-def get_labels_description_subcat(cat, lang):
+def get_labels_description_subcat(cat, lang, client=None, sparql=None, chunk_size=50, verbose=True, items=None) -> dict:
     
     """
     labels and description of the location, heritage, street address, and description of unique wikidata item for each image in all subcategory of a category of interest 
@@ -364,130 +1142,316 @@ def get_labels_description_subcat(cat, lang):
     Args:
         cat (string): the title/name of the category of interest
         lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        sparql (SparqlQuery): the sparql query object, the shared one is used when it is not given
+        chunk_size (int): how many wikidata items are sent in each sparql query
+        verbose (bool): whether the subcategories and the values are printed as they are fetched
+        items (ItemCache): the cache of wikidata items, so an item depicted in several subcategories is fetched once
 
     Returns:
-         response_item[response_keys]['value'] (string): the value of the labels and description of the location, heritage, street address, and description for each wikidata id in a category
+         subcat_details (dict): maps each subcategory to the item_details of get_item_details
     """
     
-    session = mwapi.Session(
-        host="https://{0}.wikimedia.org/w/api.php".format(lang),
-        user_agent="Outreachy round fall 2022"
-    )
+    client = client or get_client() #reuses the pooled connections instead of a new session on every call
     
-    params = {
-            "action": "query",
-            "list":"categorymembers", #Get information about all categories used in the page
-            "cmtitle": cat,
-            "cmtype": 'subcat', #get sub categories in a category
-            "format": "json",
-    }
-
-    response = session.get(params) #get request for the wikiapi to get the category members pageid
-    category_member = (response['query']['categorymembers']) #get the list of all the subcategories
+    category_member = iter_category_members(cat, lang, namespace=14, client=client) #get all the subcategories, page by page
    
-
+    subcat_details = {}
     for category_item in category_member:
         
-        try:
-            wikidata_list = get_wikidata(category_item['title'], lang='commons')
-            print('\n', category_item['title'])
-            
+        wikidata_list = get_wikidata(category_item.title, lang='commons', client=client)
+        if verbose:
+            print('\n', category_item.title)
+        
+        item_details = get_item_details(wikidata_list, chunk_size=chunk_size, sparql=sparql, metrics=client.metrics, throttle=client.throttle, items=items, client=client) #the retries of the throttle replace the bare except that dropped the subcategory
+        subcat_details[category_item.title] = item_details
+        
+        if verbose:
             for wikidata_item in wikidata_list:
-                
-                sparql = """
-                SELECT 
-                    ?item ?itemLabel ?itemDescription 
-                    ?locationLabel ?locationDescription  
-                    ?streetLabel  
-                    ?descriptionLabel 
-                    ?heritageLabel
-                    WHERE {
-                    VALUES ?item { wd:"""+wikidata_item+""" }
-                    ?item wdt:P131 ?location ;
-                            wdt:P1435 ?heritage .
-                    SERVICE wikibase:label { bd:serviceParam wikibase:language "en". }
-                    OPTIONAL {?item 
-                            wdt:P6375 ?street ;
-                            wdt:P973 ?description ;}
-                    }
-                """
-            
-                wikiquery = SparqlQuery() #sparqlquery that allows the use of sparql queries with python
-                response = wikiquery.query(sparql)
-                results = response['results']['bindings'] #get list of all the response results
-                
-                for response_item in results:
+                for response_item in item_details[wikidata_item]:
                     
                     for response_keys in list(response_item.keys()):
-                        print(response_keys, ' -> ', response_item[response_keys]['value'])
-        except:
-            continue
+                        print(response_keys, ' -> ', response_item[response_keys])
+    
+    return subcat_details
                 
 #get_labels_description_subcat('Category:Top_contributors_of_Wiki_Loves_Monuments_2020_in_Brazil', lang='commons')
 
-# list of commons files selected
+REPORT_RESOURCES = { #the resources every report is built from, in the order main prints the reports
+    "categories": {"categories"}, #the hidden categories, what get_categories_list gives
+    "hidden-categories": {"categories"}, #the visible categories, what get_hidden_categories_list gives
+    "data": {"extmetadata"}, #FileRecord of get_all_files_data
+    "metadata": {"metadata"}, #MetadataRecord of get_metadata_item
+    "all-categories": {"categories"},
+    "labels": {"categories", "labels"}, #get_labels_description_subcat of every category of the files
+    "depicts": {"depicts"}, #the wikidata items each file depicts
+    "heritage": {"depicts", "heritage"}, #the sparql location and heritage details of the depicted items
+}
+REPORTS = tuple(REPORT_RESOURCES)
 
-files_list = get_all_files_subcat('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
 
-for title in files_list: #loops through the list of commons files
-    print(title, ' -> ', get_categories_list(title, lang='commons'))
-    print('\n')
+class ReportPlan(NamedTuple):
+    
+    """
+    the resources a set of reports needs and the combined query that fetches them for every batch of files
+    """
+    
+    reports: tuple
+    resources: frozenset
+    query: dict
 
-# list of commons files selected
 
-files_list = get_all_files_subcat('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
+def plan_reports(cat_title, reports=REPORTS, chunk_size=50) -> ReportPlan:
+    
+    """
+    works out the fewest requests that give every resource the reports need. the members of the category, their
+    categories and their imageinfo (extmetadata and metadata together) come from a single generator=categorymembers
+    query per batch of files, the depicts need one wbgetentities per batch and the heritage details one sparql query
+    per 50 depicted items
 
-for title in files_list: #loops through the list of commons files
-    print(title, ' -> ', get_hidden_categories_list(title, lang='commons'))
-    print('\n')
+    Args:
+        cat_title (string): the title/name of the category of interest
+        reports ([string]): the reports wanted, any of REPORTS
+        chunk_size (int): how many files are in each batch, 50 is the most the api gives extmetadata and wbgetentities for
 
-# list of commons files selected
+    Returns:
+        plan (ReportPlan): the reports, the resources they need and the combined query
+    """
+    
+    unknown = [report for report in reports if report not in REPORT_RESOURCES]
+    if unknown:
+        raise ValueError("unknown reports: " + ", ".join(unknown))
+    resources = frozenset().union(*(REPORT_RESOURCES[report] for report in reports))
+    
+    query = {
+            "action": "query",
+            "generator": "categorymembers", #the members and their props in the same request
+            "gcmtitle": cat_title,
+            "gcmnamespace": 6, #files
+            "gcmlimit": chunk_size,
+            "format": "json",
+    }
+    props = []
+    if "categories" in resources:
+        props.append("categories")
+        query.update(clprop="hidden", cllimit="max") #both kinds of categories, the hidden ones marked
+    iiprop = []
+    if "extmetadata" in resources:
+        iiprop += ["extmetadata", "commonmetadata", "size", "dimensions", "mime", "mediatype"]
+    if "metadata" in resources:
+        iiprop.append("metadata")
+        query["iimetadataversion"] = "latest"
+    if iiprop:
+        props.append("imageinfo")
+        query["iiprop"] = "|".join(iiprop)
+    if props:
+        query["prop"] = "|".join(props)
+    
+    return ReportPlan(tuple(reports), resources, query)
 
-files_list = get_all_files_subcat('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
+#plan_reports('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', ["categories", "data"])
 
-for title in files_list: #loops through the list of commons files
-    get_all_files_data(title, lang='commons')
-    print('\n')
+class FileResources(NamedTuple):
+    
+    """
+    the resources of one file fetched for a ReportPlan, shared by every report. categories and depicts are None when
+    the plan does not need them
+    """
+    
+    pageid: int
+    title: str
+    categories: Optional[dict]
+    imageinfo: list
+    depicts: Optional[list]
 
 
-# list of commons files selected
+def iter_report_files(plan, lang='commons', client=None):
+    
+    """
+    streams the files of the category of a plan with the resources it needs, batch by batch
 
-files_list = get_all_files_subcat('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
+    Args:
+        plan (ReportPlan): the plan of plan_reports
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
 
-for title in files_list:  #loops through the list of commons files
-    get_metadata_item(title, lang='commons')
-    print('\n')
+    Returns:
+        generator of FileResources, one per file
+    """
+    
+    client = client or get_client()
+    for pages, normalized in _query_pages(client, lang, plan.query): #one complete batch of files at a time
+        yield from _batch_resources(plan, pages, lang, client)
 
-# list of commons files selected
+def _batch_resources(plan, pages, lang, client) -> list:
+    
+    """
+    the FileResources of one batch of pages of the combined query, with the depicts of the batch when the plan needs them
+    """
+    
+    batch = [page for page in pages.values() if 'pageid' in page]
+    
+    depicts_by_pageid = None
+    if "depicts" in plan.resources:
+        depicts_by_pageid, depicts_set = get_depicts_bulk([page['pageid'] for page in batch], lang, client=client)
+    
+    return [
+        FileResources(
+            pageid=page['pageid'],
+            title=page['title'],
+            categories=_split_categories(page) if "categories" in plan.resources else None,
+            imageinfo=page.get('imageinfo', []),
+            depicts=depicts_by_pageid.get(page['pageid'], []) if depicts_by_pageid is not None else None,
+        )
+        for page in batch
+    ]
+
+def run_reports(cat_title, reports=REPORTS, lang='commons', client=None, sparql=None, chunk_size=50, items=None) -> dict:
+    
+    """
+    builds several reports on the files of a category in a single pass. each resource is fetched once with the
+    requests of plan_reports and fanned out to every report that uses it, so asking for more reports costs no
+    more requests for the resources they share
 
-files_list = get_all_files_subcat('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
+    Args:
+        cat_title (string): the title/name of the category of interest
+        reports ([string]): the reports wanted, any of REPORTS
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        sparql (SparqlQuery): the sparql query object, the shared one is used when it is not given
+        chunk_size (int): how many files or wikidata items are sent in each request
+        items (ItemCache): the cache the heritage and labels reports take the wikidata items from, see item_cache.py
 
-for title in files_list:  #loops through the list of commons files
+    Returns:
+        outputs (dict): maps each report to its output,
+            categories, hidden-categories, all-categories and depicts map each title to a list,
+            data is a list of FileRecord, metadata a list of MetadataRecord,
+            heritage is the item_details of get_item_details for all the depicted items,
+            labels maps each category of the files to the subcat_details of get_labels_description_subcat
+    """
     
-    all_categories_list = get_categories_list(title, lang='commons') + get_hidden_categories_list(title, lang='commons') #get all the categories that is, the hidden plus the unhidden categories
-    print(all_categories_list)
-    print('\n')
-
-# list of commons files selected
+    client = client or get_client()
+    plan = plan_reports(cat_title, reports, chunk_size)
+    outputs = {report: [] if report in ("data", "metadata") else {} for report in plan.reports}
+    
+    depicted_items = {} #every depicted item once, in the order they were first seen
+    files_categories = {}
+    with client.metrics.stage('files'):
+        for file_resources in iter_report_files(plan, lang, client=client):
+            if file_resources.categories is not None:
+                files_categories[file_resources.title] = file_resources.categories
+            if "categories" in outputs:
+                outputs["categories"][file_resources.title] = file_resources.categories['hidden']
+            if "hidden-categories" in outputs:
+                outputs["hidden-categories"][file_resources.title] = file_resources.categories['visible']
+            if "all-categories" in outputs:
+                outputs["all-categories"][file_resources.title] = file_resources.categories['hidden'] + file_resources.categories['visible']
+            if "data" in outputs:
+                outputs["data"].extend(_file_record(file_resources.title, imageinfo_item) for imageinfo_item in file_resources.imageinfo)
+            if "metadata" in outputs:
+                outputs["metadata"].extend(_metadata_records(file_resources.title, file_resources.imageinfo))
+            if "depicts" in outputs:
+                outputs["depicts"][file_resources.title] = file_resources.depicts
+            if file_resources.depicts is not None:
+                depicted_items.update(dict.fromkeys(file_resources.depicts))
+    
+    if "heritage" in outputs:
+        with client.metrics.stage('heritage'):
+            outputs["heritage"] = get_item_details(depicted_items, chunk_size=chunk_size, sparql=sparql, metrics=client.metrics, throttle=client.throttle, items=items, client=client)
+    
+    if "labels" in outputs:
+        all_category = []
+        for file_categories in files_categories.values():
+            all_category += file_categories['hidden'] + file_categories['visible']
+        
+        for cat in dict.fromkeys(all_category): #the categories of all the files without repetition
+            if 'Category:Pages with maps' not in cat: #category:pages with maps, amongst others have no entities so this filters it out
+                with client.metrics.stage('labels and descriptions'):
+                    outputs["labels"][cat] = get_labels_description_subcat(cat, lang=lang, client=client, sparql=sparql, chunk_size=chunk_size, verbose=False, items=items)
+    
+    return outputs
 
-files_list = get_all_files_subcat('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
+#run_reports('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', ["categories", "data", "depicts"], lang='commons')
 
-all_category=[]
-for title in files_list:  #loops through the list of commons files
-    all_categories_list = get_categories_list(title, lang='commons') + get_hidden_categories_list(title, lang='commons') #get all the categories that is, the hidden plus the unhidden categories
-    all_category += all_categories_list
+def main(argv=None):
     
-new_all_category_list = list(set([list_item for list_item in all_category])) #list got from the addition of all the hidden and unhidden category list is filtered to remove category repetition and further ensure the categories in the list are unique to avoid repetition
+    """
+    command line entry point that prints the reports of a category, eg
+    python Task3.py 'Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil' --report categories data
 
-for cat in all_categories_list: #looping through the list
+    Args:
+        argv ([string]): the command line arguments, sys.argv[1:] when not given
+    """
     
-    if 'Category:Pages with maps' not in cat: #category:pages with maps, amongst others have no entities so this filters it out
-        try:
-            info = get_labels_description_subcat(cat, lang='commons')
-        except:
-            continue
-                
-print('\n', info)
+    parser = argparse.ArgumentParser(description="reports on the files of a wikimedia commons category")
+    parser.add_argument("category", nargs="?", default="Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil", help="the title of the category of interest")
+    parser.add_argument("--report", nargs="+", choices=REPORTS, default=["categories", "hidden-categories", "data", "metadata", "all-categories", "labels"], help="the reports to print, the six reports of the original script by default")
+    parser.add_argument("--lang", default="commons", help="the particular wikipedia api needed eg en, fr, commons")
+    parser.add_argument("--item-cache", help="sqlite file the wikidata items of the labels and heritage reports are cached in between runs")
+    parser.add_argument("--cache", help="sqlite file the api responses are cached in between runs, see response_cache.py")
+    parser.add_argument("--revalidate", action="store_true", help="with --cache, first drop the cached responses of the files of the category edited since they were cached")
+    parser.add_argument("--stats", action="store_true", help="print the connection, request and latency statistics at the end")
+    args = parser.parse_args(argv)
+    
+    cache = None
+    if args.cache:
+        from response_cache import ResponseCache
+        cache = ResponseCache(args.cache)
+    client = WikiClient(cache=cache) #one pooled client shared by every request of the run
+    items = None
+    try:
+        if args.revalidate and cache is not None: #one prop=info request per 50 files instead of refetching them all
+            files_revisions = get_category_revisions(args.category, args.lang, client=client)
+            cache.revalidate(client, args.lang, pageids=[file_revision['pageid'] for file_revision in files_revisions.values()])
+        if args.item_cache:
+            from item_cache import ItemCache
+            items = ItemCache(args.item_cache)
+        outputs = run_reports(args.category, [report for report in REPORTS if report in args.report], lang=args.lang, client=client, items=items) #every resource fetched once for all the reports
+        
+        for title, categories_list in outputs.get("categories", {}).items(): #loops through the list of commons files
+            print(title, ' -> ', categories_list)
+            print('\n')
+        
+        for title, categories_list in outputs.get("hidden-categories", {}).items():
+            print(title, ' -> ', categories_list)
+            print('\n')
+        
+        for record in outputs.get("data", []):
+            print(record)
+            print('\n')
+        
+        for record in outputs.get("metadata", []):
+            if record.key is not None: #the metadata that has a list of values
+                print(record.title, '-> ', record.name, '-> ', record.key, '->', record.value)
+            else:
+                print(record.title, '-> ', record.name, '-> ', record.value)
+        
+        for all_categories_list in outputs.get("all-categories", {}).values(): #the hidden plus the unhidden categories of each file
+            print(all_categories_list)
+            print('\n')
+        
+        for cat, info in outputs.get("labels", {}).items():
+            print('\n', cat)
+            print(info)
+        
+        for title, wikidata_list in outputs.get("depicts", {}).items():
+            print(title, ' -> ', wikidata_list)
+        
+        for wikidata_item, response_items in outputs.get("heritage", {}).items():
+            for response_item in response_items:
+                print(wikidata_item, ' -> ', response_item)
+        
+        if args.stats:
+            print(client.stats()) #how many connections were opened for all the requests served
+            client.metrics.dump() #requests, bytes and latency of every endpoint and the time of every stage
+            if items is not None:
+                print(items.stats())
+    finally: #the pooled sessions and the sqlite files are closed even when a report fails
+        client.close()
+        if items is not None:
+            items.close()
+        if cache is not None:
+            cache.close()
 
 
 
@@ -506,23 +1470,5 @@ description and other necessary information that might be of use.
 '''
 
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+'''
+offline benchmark of the public functions of Task3.py. every function runs against a local StubServer that stands in for
+the mediawiki api, wbgetentities and the sparql endpoint, with configurable artificial latency and category sizes, so
+runs can be compared across commits without wikimedia.org or the network in the way.
+
+the responses are synthetic fixtures shaped like the real api responses, or responses recorded in a ResponseCache file
+(a warm cache of a real run is a recording of every api request and sparql query it made) which are replayed first when
+--recorded is given.
+
+    python benchmark.py --sizes 10 100 1000 --latency 0.005 --output bench.json
+
+for every function and size it records the wall time, the requests it sent, requests per file, bytes received, the peak
+memory and the per-endpoint metrics of the client, and writes them as json.
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from urllib.parse import unquote
+
+import requests
+
+import Task3
+import harvest_async
+from item_cache import ItemCache
+from response_cache import ResponseCache
+from stub_server import FaultInjector, StubServer
+
+SUBCATEGORIES = 4 #the root category of every size has this many subcategories sharing its files
+FILE_PAGEID = 1000000 #pageid of the first file, the MediaInfo entity of a file is M<pageid>
+LOCATION_ITEM, HERITAGE_ITEM = "Q40000", "Q40001" #the location and heritage status of every depicted item
+FIXTURE_LABELS = {LOCATION_ITEM: "Quixadá", HERITAGE_ITEM: "national heritage site of Brazil"}
+
+
+class FixtureWiki:
+
+    """
+    synthetic commons for the benchmark. "Category:Benchmark <size>" holds size files and SUBCATEGORIES subcategories
+    "Category:Benchmark <size> part <k>", each holding a slice of the same files. every file has categories (some hidden),
+    imageinfo with extmetadata, commonmetadata and metadata, a MediaInfo entity with depicts statements, and the depicted
+    items have sparql rows
+
+    Args:
+        recorded (ResponseCache): responses recorded from a real run, replayed before the synthetic ones
+    """
+
+    def __init__(self, recorded=None):
+        self.recorded = recorded
+
+    def __call__(self, path, params):
+        if path.rstrip("/").endswith("/sparql"):
+            if self.recorded is not None:
+                response = self.recorded.get(Task3.SPARQL_HOST, {"query": params["query"]}) #recorded by get_item_details, keyed by the query text
+                if response is not None:
+                    return response
+            return self.sparql(params["query"])
+
+        lang = path.strip("/").split("/")[0] #the client host is <stub url>/{0} so the path starts with the lang
+        if self.recorded is not None:
+            response = self.recorded.get(lang, params)
+            if response is not None:
+                return response
+
+        if params.get("action") == "wbgetentities":
+            return self.entities(params)
+        if params.get("list") == "categorymembers":
+            return self.category_members(params)
+        if params.get("generator") == "categorymembers":
+            return self.category_pages(params)
+        if params.get("prop") == "categories":
+            return self.categories(params)
+        if params.get("prop") == "imageinfo":
+            return self.imageinfo(params)
+        if params.get("prop") == "info":
+            return self.info(params)
+        if params.get("prop") == "categoryinfo":
+            return {"batchcomplete": "", "query": {"pages": {str(-1 - i): {"ns": 14, "title": title, "categoryinfo": self._category_info(title)} for i, title in enumerate(unquote(params["titles"]).split("|"))}}}
+        return {"error": {"code": "unknown_action", "info": "the benchmark fixtures do not cover this request"}}
+
+    @staticmethod
+    def _category(title):
+
+        """
+        the (size, part) of a benchmark category, part is None for the root
+        """
+
+        match = re.match(r"Category:Benchmark[ _](\d+)(?:[ _]part[ _](\d+))?$", title)
+        if match is None:
+            return 0, None
+        return int(match.group(1)), None if match.group(2) is None else int(match.group(2))
+
+    def _members(self, title, namespaces):
+        size, part = self._category(title)
+        members = []
+        if 14 in namespaces and part is None:
+            members += [{"pageid": 2 + k, "ns": 14, "title": "Category:Benchmark {0} part {1}".format(size, k)} for k in range(SUBCATEGORIES)]
+        if 6 in namespaces:
+            files = range(size) if part is None else range(part * size // SUBCATEGORIES, (part + 1) * size // SUBCATEGORIES)
+            members += [{"pageid": FILE_PAGEID + i, "ns": 6, "title": "File:Benchmark {0}.jpg".format(i)} for i in files]
+        return members
+
+    def _category_info(self, title):
+        files = len(self._members(title, {6}))
+        subcats = len(self._members(title, {14}))
+        return {"size": files + subcats, "pages": 0, "files": files, "subcats": subcats}
+
+    @staticmethod
+    def _page(members, limit, offset):
+        limit = 500 if limit in ("max", None) else int(limit)
+        return members[offset:offset + limit], offset + limit < len(members), offset + limit
+
+    def category_members(self, params):
+        namespaces = {int(namespace) for namespace in str(params.get("cmnamespace", "6|14")).split("|")}
+        members = self._members(params["cmtitle"], namespaces)
+        page, more, next_offset = self._page(members, params.get("cmlimit", 10), int(params.get("cmcontinue") or 0))
+        response = {"batchcomplete": "", "query": {"categorymembers": page}}
+        if more:
+            response["continue"] = {"cmcontinue": str(next_offset), "continue": "-||"}
+        return response
+
+    def category_pages(self, params):
+        members = self._members(params["gcmtitle"], {int(params.get("gcmnamespace", 6))})
+        page, more, next_offset = self._page(members, params.get("gcmlimit", 10), int(params.get("gcmcontinue") or 0))
+        pages = {str(member["pageid"]): self._info(member["title"]) if member["ns"] == 6 else dict(member) for member in page}
+        props = params.get("prop", "").split("|")
+        if "categoryinfo" in props:
+            for member in page:
+                pages[str(member["pageid"])]["categoryinfo"] = self._category_info(member["title"])
+        titles_params = dict(params, titles="|".join(member["title"] for member in page))
+        for prop, prop_pages in (("categories", self.categories), ("imageinfo", self.imageinfo)):
+            if prop in props and page:
+                for pageid, prop_page in prop_pages(titles_params)["query"]["pages"].items():
+                    pages[pageid][prop] = prop_page[prop]
+        response = {"batchcomplete": "", "query": {"pages": pages}}
+        if more:
+            response["continue"] = {"gcmcontinue": str(next_offset), "continue": "gcmcontinue||"}
+        return response
+
+    @staticmethod
+    def _file_number(title):
+        match = re.search(r"(\d+)\.jpg$", title)
+        return int(match.group(1)) if match else 0
+
+    def _info(self, title):
+        number = self._file_number(title)
+        return {"pageid": FILE_PAGEID + number, "ns": 6, "title": title.replace("_", " "), "lastrevid": 500000000 + number, "touched": "2022-10-01T00:00:00Z"}
+
+    def _titles(self, params):
+        titles = unquote(params["titles"]).split("|")
+        normalized = [{"from": title, "to": title.replace("_", " ")} for title in titles if "_" in title]
+        return titles, normalized
+
+    def categories(self, params):
+        titles, normalized = self._titles(params)
+        show = params.get("clshow")
+        pages = {}
+        for title in titles:
+            number = self._file_number(title)
+            categories = [{"ns": 14, "title": "Category:Benchmark visible {0}".format(number % k)} for k in (3, 7, 11)]
+            categories += [{"ns": 14, "title": "Category:Benchmark hidden {0}".format(number % k), "hidden": ""} for k in (2, 5)]
+            if show == "hidden":
+                categories = [category for category in categories if "hidden" in category]
+            elif show == "!hidden":
+                categories = [dict(category) for category in categories if "hidden" not in category]
+            elif "hidden" not in params.get("clprop", ""):
+                categories = [{"ns": 14, "title": category["title"]} for category in categories]
+            page = self._info(title)
+            pages[str(page["pageid"])] = dict(page, categories=categories)
+        return {"batchcomplete": "", "query": {"normalized": normalized, "pages": pages}}
+
+    def imageinfo(self, params):
+        titles, normalized = self._titles(params)
+        iiprop = params.get("iiprop", "").split("|")
+        pages = {}
+        for title in titles:
+            number = self._file_number(title)
+            latitude, longitude = -3.0 - (number % 1000) / 100.0, -39.0 - (number // 1000) / 100.0
+            imageinfo = {}
+            if "extmetadata" in iiprop:
+                imageinfo["extmetadata"] = {
+                    "DateTimeOriginal": {"value": "2021-09-{0:02d} 10:00:00".format(number % 30 + 1), "source": "commons-desc-page"},
+                    "LicenseShortName": {"value": "CC BY-SA 4.0", "source": "commons-desc-page"},
+                    "LicenseUrl": {"value": "https://creativecommons.org/licenses/by-sa/4.0", "source": "commons-desc-page"},
+                    "ImageDescription": {"value": 'Benchmark file {0}. <a href="https://www.wikidata.org/wiki/Q{1}">Monument {1}</a>'.format(number, number % 97), "source": "commons-desc-page"},
+                    "Artist": {"value": '<a href="//commons.wikimedia.org/wiki/User:Benchmark" title="User:Benchmark">Benchmark</a>', "source": "commons-desc-page"},
+                    "Credit": {"value": '<span class="int-own-work" lang="en">Own work</span>', "source": "commons-desc-page"},
+                    "GPSLatitude": {"value": "{0:.6f}".format(latitude), "source": "commons-desc-page"},
+                    "GPSLongitude": {"value": "{0:.6f}".format(longitude), "source": "commons-desc-page"},
+                    "Categories": {"value": "Benchmark visible {0}|Benchmark visible {1}".format(number % 3, number % 7), "source": "commons-categories"},
+                }
+            if "commonmetadata" in iiprop:
+                imageinfo["commonmetadata"] = [{"name": "GPSLatitude", "value": latitude}, {"name": "GPSLongitude", "value": longitude}]
+            if "metadata" in iiprop:
+                imageinfo["metadata"] = [
+                    {"name": "Make", "value": "Canon"},
+                    {"name": "Model", "value": "Canon EOS 80D"},
+                    {"name": "DateTimeOriginal", "value": "2021:09:01 10:00:00"},
+                    {"name": "MEDIAWIKI_EXIF_VERSION", "value": 2},
+                    {"name": "GPSLatitudeRef", "value": [{"name": "0", "value": "S"}, {"name": "_type", "value": "ol"}]},
+                ]
+            if "size" in iiprop:
+                imageinfo["size"] = 3000000 + number
+            if "dimensions" in iiprop or "size" in iiprop:
+                imageinfo["width"], imageinfo["height"] = 4000, 3000
+            if "mime" in iiprop:
+                imageinfo["mime"] = "image/jpeg"
+            if "mediatype" in iiprop:
+                imageinfo["mediatype"] = "BITMAP"
+            page = self._info(title)
+            pages[str(page["pageid"])] = dict(page, imagerepository="local", imageinfo=[imageinfo])
+        return {"batchcomplete": "", "query": {"normalized": normalized, "pages": pages}}
+
+    def info(self, params):
+        if "pageids" in params:
+            titles = ["File:Benchmark {0}.jpg".format(int(pageid) - FILE_PAGEID) for pageid in params["pageids"].split("|")]
+            normalized = []
+        else:
+            titles, normalized = self._titles(params)
+        pages = {}
+        for title in titles:
+            page = self._info(title)
+            pages[str(page["pageid"])] = page
+        return {"batchcomplete": "", "query": {"normalized": normalized, "pages": pages}}
+
+    @staticmethod
+    def _item(entity_id):
+
+        """
+        the wikidata item of a depicted monument, with the location and heritage claims the sparql fixture answers with
+        """
+
+        claims = {}
+        if int(entity_id[1:]) % 5 and entity_id not in FIXTURE_LABELS: #some items have no location or heritage status
+            for prop, item in (("P131", LOCATION_ITEM), ("P1435", HERITAGE_ITEM)):
+                claims[prop] = [{"mainsnak": {"snaktype": "value", "property": prop, "datavalue": {"value": {"entity-type": "item", "id": item}, "type": "wikibase-entityid"}}, "type": "statement", "rank": "normal"}]
+        label = FIXTURE_LABELS.get(entity_id, "Monument " + entity_id)
+        return {"type": "item", "id": entity_id, "labels": {"en": {"language": "en", "value": label}}, "descriptions": {}, "claims": claims}
+
+    def entities(self, params):
+        entities = {}
+        for entity_id in params["ids"].split("|"):
+            if entity_id.startswith("Q"):
+                entities[entity_id] = self._item(entity_id)
+                continue
+            number = int(entity_id[1:]) - FILE_PAGEID
+            depicts = ["Q{0}".format(number % 97), "Q{0}".format(1000 + number % 13)]
+            entities[entity_id] = {
+                "type": "mediainfo",
+                "id": entity_id,
+                "statements": {"P180": [{"mainsnak": {"snaktype": "value", "property": "P180", "datavalue": {"value": {"entity-type": "item", "id": item}, "type": "wikibase-entityid"}}, "type": "statement", "rank": "normal"} for item in depicts]},
+            }
+        return {"entities": entities, "success": 1}
+
+    def sparql(self, query):
+        bindings = []
+        if "wdt:P131" not in query: #the labels query of item_cache.py
+            for item in re.findall(r"wd:(Q\d+)", query):
+                bindings.append({"item": {"type": "uri", "value": "http://www.wikidata.org/entity/" + item}, "itemLabel": {"type": "literal", "value": FIXTURE_LABELS.get(item, "Monument " + item)}})
+            return {"head": {"vars": ["item", "itemLabel"]}, "results": {"bindings": bindings}}
+        for item in re.findall(r"wd:(Q\d+)", query):
+            if int(item[1:]) % 5 == 0: #some items have no location or heritage status
+                continue
+            bindings.append({
+                "item": {"type": "uri", "value": "http://www.wikidata.org/entity/" + item},
+                "itemLabel": {"type": "literal", "value": "Monument " + item},
+                "locationLabel": {"type": "literal", "value": "Quixadá"},
+                "heritageLabel": {"type": "literal", "value": "national heritage site of Brazil"},
+            })
+        return {"head": {"vars": ["item", "itemLabel", "locationLabel", "heritageLabel"]}, "results": {"bindings": bindings}}
+
+
+class StubSparql:
+
+    """
+    stands in for pywikibot's SparqlQuery against the stub server, only the query method Task3.py uses
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.session = requests.Session()
+        self.queries_sent = 0
+
+    def query(self, query):
+        self.queries_sent += 1
+        response = self.session.get(self.endpoint, params={"query": query, "format": "json"})
+        response.raise_for_status()
+        return response.json()
+
+
+def _files(size):
+    return ["File:Benchmark {0}.jpg".format(i) for i in range(size)]
+
+
+def _pageids(size):
+    return [FILE_PAGEID + i for i in range(size)]
+
+
+def _category(size):
+    return "Category:Benchmark {0}".format(size)
+
+
+def _exhaust(iterator):
+    for _ in iterator:
+        pass
+
+
+BENCHMARKS = {
+    "get_categories_list": lambda size, client, sparql: [Task3.get_categories_list(title, "commons", client=client) for title in _files(size)],
+    "get_hidden_categories_list": lambda size, client, sparql: [Task3.get_hidden_categories_list(title, "commons", client=client) for title in _files(size)],
+    "get_categories_bulk": lambda size, client, sparql: Task3.get_categories_bulk(_files(size), "commons", client=client),
+    "get_imageinfo_bulk": lambda size, client, sparql: Task3.get_imageinfo_bulk(_files(size), "commons", client=client),
+    "get_metadata_item": lambda size, client, sparql: _exhaust(Task3.get_metadata_item(_files(size), "commons", client=client)),
+    "get_all_files_data": lambda size, client, sparql: _exhaust(Task3.get_all_files_data(_files(size), "commons", client=client)),
+    "get_all_files_subcat": lambda size, client, sparql: Task3.get_all_files_subcat(_category(size), "commons", client=client),
+    "get_all_files_cat": lambda size, client, sparql: Task3.get_all_files_cat(_category(size), "commons", client=client),
+    "crawl_category_tree": lambda size, client, sparql: _exhaust(Task3.crawl_category_tree(_category(size), "commons", client=client)),
+    "get_depicts_bulk": lambda size, client, sparql: Task3.get_depicts_bulk(_pageids(size), "commons", client=client),
+    "get_wikidata": lambda size, client, sparql: Task3.get_wikidata(_category(size), "commons", client=client),
+    "get_labels_description_subcat": lambda size, client, sparql: Task3.get_labels_description_subcat(_category(size), "commons", client=client, sparql=sparql),
+    "get_labels_description_subcat_cached": lambda size, client, sparql: Task3.get_labels_description_subcat(_category(size), "commons", client=client, sparql=sparql, items=ItemCache(":memory:")),
+    "sync_category": lambda size, client, sparql: Task3.sync_category(_category(size), "commons", client=client),
+    "harvest_category_1": lambda size, client, sparql: harvest_async.harvest_category(_category(size), "commons", concurrency=1, client=client),
+    "harvest_category_4": lambda size, client, sparql: harvest_async.harvest_category(_category(size), "commons", concurrency=4, client=client),
+    "harvest_category_8": lambda size, client, sparql: harvest_async.harvest_category(_category(size), "commons", concurrency=8, client=client),
+    "run_reports": lambda size, client, sparql: Task3.run_reports(_category(size), ["categories", "hidden-categories", "data", "metadata", "all-categories", "depicts", "heritage"], "commons", client=client, sparql=sparql),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=(10, 100, 1000), functions=None, latency=0.0, recorded=None, capacity=None, fault_rate=0.0) -> dict:
+
+    """
+    times the public functions of Task3.py against the stub server
+
+    Args:
+        sizes ([int]): the numbers of files in the benchmark category, from 10 up to 100000
+        functions ([string]): the names of the functions to time, all of BENCHMARKS when None
+        latency (float): seconds every stub response is delayed by
+        recorded (string): a ResponseCache file whose responses are replayed before the synthetic fixtures
+        capacity (int): the most requests the stub handles at the same time, the ones over it get a 429
+        fault_rate (float): share of the requests answered with a maxlag error or a 503, half each
+
+    Returns:
+        results (dict): meta about the run and one result per function and size with wall_time, requests,
+            requests_per_file and peak_memory
+    """
+
+    functions = list(functions or BENCHMARKS)
+    fixtures = FixtureWiki(recorded=ResponseCache(recorded) if recorded else None)
+    faults = None
+    stub_latency = latency
+    if capacity is not None or fault_rate:
+        fixtures = faults = FaultInjector(fixtures, capacity=capacity, latency=latency, maxlag_rate=fault_rate / 2, unavailable_rate=fault_rate / 2)
+        stub_latency = 0.0 #the fault injector holds the requests itself so they count against the capacity
+
+    results = []
+    with StubServer(fixtures, latency=stub_latency) as stub:
+        for size in sizes:
+            for function_name in functions:
+                client = Task3.WikiClient(host=stub.url + "/{0}")
+                sparql = StubSparql(stub.url + "/sparql")
+                served_before = stub.requests_served
+
+                tracemalloc.start()
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()): #some of the functions still print their results
+                    BENCHMARKS[function_name](size, client, sparql)
+                wall_time = time.perf_counter() - started
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                requests_sent = stub.requests_served - served_before
+                endpoints = client.metrics.summary()["endpoints"]
+                results.append({
+                    "function": function_name,
+                    "size": size,
+                    "wall_time": wall_time,
+                    "requests": requests_sent,
+                    "requests_per_file": requests_sent / size,
+                    "bytes_received": sum(endpoint["bytes_received"] for endpoint in endpoints.values()),
+                    "peak_memory": peak_memory,
+                    "endpoints": endpoints,
+                })
+                client.close()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "latency": latency,
+            "recorded": recorded,
+            "capacity": capacity,
+            "faults": faults.faults if faults is not None else None,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="offline benchmark of the public functions of Task3.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="numbers of files in the benchmark category (10 to 100000)")
+    parser.add_argument("--functions", nargs="+", choices=sorted(BENCHMARKS), help="functions to time, all of them by default")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every stub response is delayed by")
+    parser.add_argument("--recorded", help="ResponseCache sqlite file whose responses are replayed")
+    parser.add_argument("--capacity", type=int, help="most requests the stub handles at the same time, the ones over it get a 429")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="share of the requests answered with a maxlag error or a 503")
+    parser.add_argument("--output", help="json file the results are written to, stdout by default")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.functions, args.latency, args.recorded, args.capacity, args.fault_rate)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    for result in results["results"]:
+        print("{function:32} {size:>7} files {wall_time:9.3f}s {requests:>7} requests {requests_per_file:8.3f}/file {peak_memory:>12} bytes".format(**result), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
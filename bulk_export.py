@@ -0,0 +1,303 @@
+'''
+checkpointed bulk export of a whole category tree, eg "Category:Images from Wiki Loves Monuments 2021 in Brazil".
+the files of every category are fetched 50 at a time with the combined query of Task3.plan_reports and written as
+json lines to sharded files, and after every batch a checkpoint records the categories still to do, the continue
+values of the category being exported and how far the current shard was written. a run that crashes or is stopped
+with Ctrl-C is started again with the same command and resumes after the last checkpointed batch, the shard is cut
+back to the checkpointed offset so no record is duplicated or lost.
+
+    python bulk_export.py 'Category:Images from Wiki Loves Monuments 2021 in Brazil' wlm_2021_brazil --depicts
+'''
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import Task3
+
+CHECKPOINT_NAME = "checkpoint.json"
+SHARD_NAME = "files-{0:05d}.jsonl"
+
+
+class BulkExport:
+
+    """
+    resumable breadth-first export of the files of a category and its subcategories, each file once
+
+    Args:
+        cat_title (string): the title/name of the root category
+        directory (string): where the shards and the checkpoint are written, the export resumes from its checkpoint
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        max_depth (int): how many levels of subcategories are followed, None follows the whole tree
+        shard_size (int): how many records a shard holds before the next one is started
+        depicts (bool): whether the depicts (P180) statements of the files are exported too
+        progress (callable): called with the progress dictionary after every batch, printed to stderr when it is not given
+    """
+
+    def __init__(self, cat_title, directory, lang='commons', client=None, max_depth=None, shard_size=10000, depicts=False, progress=None):
+        self.cat_title = cat_title
+        self.directory = directory
+        self.lang = lang
+        self.client = client or Task3.get_client()
+        self.max_depth = max_depth
+        self.shard_size = shard_size
+        self.progress = progress or print_progress
+        self.plan = Task3.plan_reports(cat_title, ["categories", "data"] + (["depicts"] if depicts else []))
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_NAME)
+        self._shard_file = None
+
+    def _new_checkpoint(self) -> dict:
+        return {
+            'category': self.cat_title,
+            'lang': self.lang,
+            'max_depth': self.max_depth,
+            'pending': [[self.cat_title, 0]], #the categories still to export with their depth, breadth-first
+            'seen_categories': [self.cat_title], #every category queued once, so cycles in the tree end
+            'current': None, #the category being exported, its depth and the continue values of its next batch (None once its files are done)
+            'categories_done': 0,
+            'shard': {'index': 0, 'offset': 0, 'records': 0}, #how far the current shard was written when the checkpoint was saved
+            'exported': 0,
+            'estimated_total': self._category_files([self.cat_title]).get(self.cat_title, 0),
+            'done': False,
+        }
+
+    def _shard_path(self, index) -> str:
+        return os.path.join(self.directory, SHARD_NAME.format(index))
+
+    def _recover_shards(self, checkpoint) -> set:
+
+        """
+        cuts the current shard back to the checkpointed offset, drops any later shard, and gives the pageids already exported
+        """
+
+        shard = checkpoint['shard']
+        for path in glob.glob(os.path.join(self.directory, "files-*.jsonl")):
+            if int(os.path.basename(path)[6:11]) > shard['index']: #started after the checkpoint was saved
+                os.remove(path)
+
+        current_path = self._shard_path(shard['index'])
+        if os.path.exists(current_path) and os.path.getsize(current_path) > shard['offset']:
+            os.truncate(current_path, shard['offset']) #the records written after the last checkpoint are exported again
+
+        exported_pageids = set()
+        for index in range(shard['index'] + 1):
+            if os.path.exists(self._shard_path(index)):
+                with open(self._shard_path(index), encoding="utf-8") as shard_file:
+                    exported_pageids.update(json.loads(line)['pageid'] for line in shard_file)
+        return exported_pageids
+
+    def _category_files(self, titles) -> dict:
+
+        """
+        how many files each category holds according to its categoryinfo, 50 categories per request
+        """
+
+        files_counts = {}
+        for titles_chunk in Task3._chunks(titles, 50):
+            params = {"action": "query", "prop": "categoryinfo", "titles": "|".join(titles_chunk), "format": "json"}
+            for pages, normalized in Task3._query_pages(self.client, self.lang, params):
+                titles_by_normalized = {normalized.get(title, title): title for title in titles_chunk}
+                for title, page in pages.items():
+                    files_counts[titles_by_normalized.get(title, title)] = page.get('categoryinfo', {}).get('files', 0)
+        return files_counts
+
+    def _subcategories(self, cat_title) -> dict:
+
+        """
+        the subcategories of a category and how many files each holds, with generator=categorymembers and prop=categoryinfo
+        """
+
+        params = {
+            "action": "query",
+            "generator": "categorymembers",
+            "gcmtitle": cat_title,
+            "gcmnamespace": 14, #subcategories
+            "gcmlimit": "max",
+            "prop": "categoryinfo",
+            "format": "json",
+        }
+        subcategories = {}
+        for pages, normalized in Task3._query_pages(self.client, self.lang, params):
+            for title, page in pages.items():
+                subcategories[title] = page.get('categoryinfo', {}).get('files', 0)
+        return subcategories
+
+    def _write_batch(self, checkpoint, records):
+
+        """
+        appends records to the current shard and makes them durable before the checkpoint that covers them is saved
+        """
+
+        shard = checkpoint['shard']
+        if self._shard_file is None:
+            self._shard_file = open(self._shard_path(shard['index']), "ab")
+        for record in records:
+            self._shard_file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._shard_file.flush()
+        os.fsync(self._shard_file.fileno())
+
+        shard['offset'] = self._shard_file.tell()
+        shard['records'] += len(records)
+        checkpoint['exported'] += len(records)
+        if shard['records'] >= self.shard_size: #the next batch starts a new shard
+            self._shard_file.close()
+            self._shard_file = None
+            checkpoint['shard'] = {'index': shard['index'] + 1, 'offset': 0, 'records': 0}
+
+    def _record(self, file_resources, category) -> dict:
+        records = [Task3._file_record(file_resources.title, imageinfo_item) for imageinfo_item in file_resources.imageinfo]
+        record = {
+            'pageid': file_resources.pageid,
+            'title': file_resources.title,
+            'category': category, #the category the file was first found in
+            'categories': file_resources.categories,
+            'data': records[0]._asdict() if records else None,
+        }
+        if file_resources.depicts is not None:
+            record['depicts'] = file_resources.depicts
+        return record
+
+    def run(self) -> dict:
+
+        """
+        exports the tree, or resumes the export from the checkpoint of the directory
+
+        Returns:
+            checkpoint (dict): the final checkpoint, with done set and the number of files exported
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        checkpoint = Task3.load_snapshot(self.checkpoint_path)
+        if checkpoint is None:
+            checkpoint = self._new_checkpoint()
+            Task3.save_snapshot(checkpoint, self.checkpoint_path)
+        elif checkpoint['category'] != self.cat_title or checkpoint['lang'] != self.lang:
+            raise ValueError("{0} holds the export of {1}, not {2}".format(self.directory, checkpoint['category'], self.cat_title))
+
+        exported_pageids = self._recover_shards(checkpoint)
+        seen_categories = set(checkpoint['seen_categories'])
+        started, exported_at_start = time.monotonic(), checkpoint['exported']
+
+        try:
+            while not checkpoint['done']:
+                if checkpoint['current'] is None:
+                    if not checkpoint['pending']:
+                        checkpoint['done'] = True
+                        break
+                    cat_title, depth = checkpoint['pending'].pop(0)
+                    checkpoint['current'] = {'category': cat_title, 'depth': depth, 'continue': {}}
+
+                current = checkpoint['current']
+                if current['continue'] is not None: #the files of the category are not all exported yet
+                    params = dict(self.plan.query, gcmtitle=current['category'], **current['continue'])
+                    for pages, normalized, next_continue in Task3._query_batches(self.client, self.lang, params):
+                        records = []
+                        for file_resources in Task3._batch_resources(self.plan, pages, self.lang, self.client):
+                            if file_resources.pageid not in exported_pageids: #a file in several categories is exported once
+                                exported_pageids.add(file_resources.pageid)
+                                records.append(self._record(file_resources, current['category']))
+                        self._write_batch(checkpoint, records)
+                        current['continue'] = next_continue
+                        Task3.save_snapshot(checkpoint, self.checkpoint_path)
+                        self.progress(self._progress(checkpoint, started, exported_at_start))
+                    current['continue'] = None
+
+                if self.max_depth is None or current['depth'] < self.max_depth:
+                    for subcat_title, files_count in self._subcategories(current['category']).items():
+                        if subcat_title not in seen_categories:
+                            seen_categories.add(subcat_title)
+                            checkpoint['seen_categories'].append(subcat_title)
+                            checkpoint['pending'].append([subcat_title, current['depth'] + 1])
+                            checkpoint['estimated_total'] += files_count
+                checkpoint['categories_done'] += 1
+                checkpoint['current'] = None
+                Task3.save_snapshot(checkpoint, self.checkpoint_path)
+
+            Task3.save_snapshot(checkpoint, self.checkpoint_path)
+            self.progress(self._progress(checkpoint, started, exported_at_start))
+        finally:
+            if self._shard_file is not None:
+                self._shard_file.close()
+                self._shard_file = None
+
+        return checkpoint
+
+    @staticmethod
+    def _progress(checkpoint, started, exported_at_start) -> dict:
+
+        """
+        files per second of this run and the estimated time left. the estimate counts a file once for every category it
+        is in, so the eta is an upper bound that shrinks as the export finds the overlaps
+        """
+
+        elapsed = time.monotonic() - started
+        files_per_second = (checkpoint['exported'] - exported_at_start) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, checkpoint['estimated_total'] - checkpoint['exported'])
+        return {
+            'exported': checkpoint['exported'],
+            'estimated_total': checkpoint['exported'] if checkpoint['done'] else max(checkpoint['estimated_total'], checkpoint['exported']),
+            'categories_done': checkpoint['categories_done'],
+            'categories_pending': len(checkpoint['pending']) + (checkpoint['current'] is not None),
+            'files_per_second': files_per_second,
+            'eta_seconds': remaining / files_per_second if files_per_second else None,
+            'done': checkpoint['done'],
+        }
+
+
+def print_progress(progress, file=None):
+
+    """
+    prints one progress line, eg: 12345/40000 files  48.2 files/s  eta 0:09:33  17 categories left
+    """
+
+    eta = progress['eta_seconds']
+    eta_text = "done" if progress['done'] else "eta ?" if eta is None else "eta {0}:{1:02d}:{2:02d}".format(int(eta // 3600), int(eta % 3600 // 60), int(eta % 60))
+    print("{0}/{1} files  {2:.1f} files/s  {3}  {4} categories left".format(
+        progress['exported'], progress['estimated_total'], progress['files_per_second'], eta_text, progress['categories_pending']), file=file or sys.stderr)
+
+
+def export_category_tree(cat_title, directory, lang='commons', client=None, max_depth=None, shard_size=10000, depicts=False) -> dict:
+
+    """
+    exports the files of a category tree to directory, resuming an earlier run of the same export
+
+    Args:
+        cat_title (string): the title/name of the root category
+        directory (string): where the shards and the checkpoint are written
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        client (WikiClient): the shared api client, the module wide client is used when it is not given
+        max_depth (int): how many levels of subcategories are followed, None follows the whole tree
+        shard_size (int): how many records a shard holds
+        depicts (bool): whether the depicts (P180) statements of the files are exported too
+
+    Returns:
+        checkpoint (dict): the final checkpoint
+    """
+
+    return BulkExport(cat_title, directory, lang, client=client, max_depth=max_depth, shard_size=shard_size, depicts=depicts).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="checkpointed, resumable export of the files of a commons category tree")
+    parser.add_argument("category", help="the title of the root category")
+    parser.add_argument("directory", help="where the shards and the checkpoint are written, an existing export is resumed")
+    parser.add_argument("--lang", default="commons", help="the particular wikipedia api needed eg en, fr, commons")
+    parser.add_argument("--max-depth", type=int, help="how many levels of subcategories are followed, the whole tree by default")
+    parser.add_argument("--shard-size", type=int, default=10000, help="how many files each shard holds")
+    parser.add_argument("--depicts", action="store_true", help="export the depicts (P180) statements of the files too")
+    args = parser.parse_args(argv)
+
+    try:
+        checkpoint = export_category_tree(args.category, args.directory, args.lang, max_depth=args.max_depth, shard_size=args.shard_size, depicts=args.depicts)
+    except KeyboardInterrupt:
+        print("stopped, run the same command again to resume from the last checkpoint", file=sys.stderr)
+        sys.exit(130)
+    print("exported {0} files from {1} categories to {2}".format(checkpoint['exported'], checkpoint['categories_done'], args.directory), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
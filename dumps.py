@@ -0,0 +1,470 @@
+'''
+offline mode: reads the category membership and depicts data of commons from the wikimedia dump files instead of the
+api, for analytics over more files than the api can serve (https://dumps.wikimedia.org/commonswiki/ and
+https://dumps.wikimedia.org/other/wikibase/commonswiki/).
+
+    commonswiki-latest-page.sql.gz            page_id -> namespace and title
+    commonswiki-latest-categorylinks.sql.gz   page -> the categories it is in
+    commonswiki-latest-page_props.sql.gz      hiddencat marks the hidden categories
+    commonswiki-latest-linktarget.sql.gz      only for dumps where categorylinks has cl_target_id instead of cl_to
+    commons-latest-mediainfo.json.bz2         the MediaInfo entities with the depicts (P180) statements
+
+the compressed dumps are streamed line by line, one INSERT statement (about 1MB) at a time, and only the rows of the
+categories, files or pages asked for are kept, so the memory follows the size of the result and not of the dump.
+the methods of DumpReader give the same results as the api functions of Task3.py they are named after.
+
+    reader = DumpReader(page="commonswiki-latest-page.sql.gz", categorylinks="commonswiki-latest-categorylinks.sql.gz",
+                        page_props="commonswiki-latest-page_props.sql.gz", mediainfo="commons-latest-mediainfo.json.bz2")
+    reader.get_all_files_subcat('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil')
+'''
+
+import argparse
+import bz2
+import gzip
+import json
+import lzma
+import re
+
+import Task3
+
+_FIELD = rb"(?:'((?:[^'\\]|\\.)*)'|([^,'()]+))" #a quoted string, or a number or NULL
+_ESCAPE = re.compile(rb"\\(.)", re.S)
+_ESCAPES = {b"0": b"\0", b"b": b"\b", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"Z": b"\x1a"}
+_COLUMN = re.compile(rb"^\s*`([^`]+)`\s")
+_ENTITY_ID = re.compile(rb'"id"\s*:\s*"M(\d+)"')
+
+FILE_NAMESPACE = 6
+CATEGORY_NAMESPACE = 14
+
+
+def open_dump(path):
+
+    """
+    opens a dump for reading bytes, decompressing it on the fly according to its extension (.gz, .bz2, .xz)
+    """
+
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith((".xz", ".lzma")):
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+_row_patterns = {}
+
+def _row_pattern(width):
+
+    """
+    the pattern of a (..., ...) tuple of width fields, so re.findall splits a whole INSERT statement into rows and fields in one call
+    """
+
+    if width not in _row_patterns:
+        _row_patterns[width] = re.compile(rb"\(" + rb",".join([_FIELD] * width) + rb"\)")
+    return _row_patterns[width]
+
+def _value(quoted, bare):
+    if not bare: #findall gives an empty string for the alternative that did not match
+        return _ESCAPE.sub(lambda escape: _ESCAPES.get(escape.group(1), escape.group(1)), quoted) if b"\\" in quoted else quoted
+    if bare == b"NULL":
+        return None
+    try:
+        return int(bare)
+    except ValueError:
+        return float(bare)
+
+
+def iter_sql_rows(path, columns):
+
+    """
+    streams the rows of a mysqldump file, the column order is read from its CREATE TABLE statement
+
+    Args:
+        path (string): the dump eg commonswiki-latest-categorylinks.sql.gz
+        columns ([string]): the columns wanted eg ["cl_from", "cl_to"]
+
+    Returns:
+        generator of tuples with the values of columns, strings as bytes (titles are utf-8, sort keys are binary)
+    """
+
+    table_columns = []
+    indexes = None
+    in_create = False
+    with open_dump(path) as dump:
+        for line in dump:
+            if line.startswith(b"INSERT INTO "):
+                if indexes is None:
+                    missing = [column for column in columns if column.encode() not in table_columns]
+                    if missing:
+                        raise ValueError("{0} has no column {1}".format(path, ", ".join(missing)))
+                    indexes = [table_columns.index(column.encode()) for column in columns]
+                    row_pattern = _row_pattern(len(table_columns))
+                for fields in row_pattern.findall(line, line.index(b" VALUES ") + 8): #two groups per field, quoted and bare
+                    yield tuple(_value(fields[2 * index], fields[2 * index + 1]) for index in indexes) #only the wanted fields are unescaped
+            elif line.startswith(b"CREATE TABLE"):
+                in_create, table_columns = True, []
+            elif in_create:
+                column = _COLUMN.match(line)
+                if column:
+                    table_columns.append(column.group(1))
+                elif line.startswith(b")"):
+                    in_create = False
+
+
+def sql_columns(path) -> list:
+
+    """
+    the columns of the table of a mysqldump file, from its CREATE TABLE statement
+    """
+
+    table_columns = []
+    in_create = False
+    with open_dump(path) as dump:
+        for line in dump:
+            if line.startswith(b"CREATE TABLE"):
+                in_create = True
+            elif in_create:
+                column = _COLUMN.match(line)
+                if column:
+                    table_columns.append(column.group(1).decode())
+                elif line.startswith(b")"):
+                    break
+            elif line.startswith(b"INSERT INTO "):
+                break
+    return table_columns
+
+
+def iter_mediainfo(path, pageids=None):
+
+    """
+    streams the MediaInfo entities of the json dump, which holds one entity per line inside a json array
+
+    Args:
+        path (string): the dump eg commons-latest-mediainfo.json.bz2
+        pageids (set): only the entities of these pageids are decoded, None decodes all of them
+
+    Returns:
+        generator of (pageid, entity)
+    """
+
+    with open_dump(path) as dump:
+        for line in dump:
+            entity_id = _ENTITY_ID.search(line, 0, 256) or _ENTITY_ID.search(line) #the id comes near the start of the line
+            if entity_id is None: #the [ and ] lines of the array
+                continue
+            pageid = int(entity_id.group(1))
+            if pageids is not None and pageid not in pageids:
+                continue #the other entities are skipped without decoding the json
+            yield pageid, json.loads(line.rstrip().rstrip(b","))
+
+
+def _db_key(title) -> bytes:
+
+    """
+    the title as the dumps store it, without the namespace and with underscores eg Category:Foo bar -> Foo_bar
+    """
+
+    title = title.split(":", 1)[1] if ":" in title else title
+    return title.replace(" ", "_").encode("utf-8")
+
+
+def _title(prefix, db_key) -> str:
+    return prefix + db_key.decode("utf-8").replace("_", " ")
+
+
+class DumpReader:
+
+    """
+    the category membership, categories and depicts of commons files read from the dumps, with the same results as
+    the api functions of Task3.py. every call streams the dumps it needs once
+
+    Args:
+        page (string): the page table dump
+        categorylinks (string): the categorylinks table dump
+        page_props (string): the page_props table dump, needed to tell the hidden categories apart
+        linktarget (string): the linktarget table dump, needed when categorylinks has cl_target_id instead of cl_to
+        mediainfo (string): the MediaInfo json dump, needed for the depicts
+    """
+
+    def __init__(self, page, categorylinks, page_props=None, linktarget=None, mediainfo=None):
+        self.page = page
+        self.categorylinks = categorylinks
+        self.page_props = page_props
+        self.linktarget = linktarget
+        self.mediainfo = mediainfo
+        self._uses_target_id = None
+
+    def _target_ids(self) -> bool:
+
+        """
+        whether categorylinks points to linktarget with cl_target_id (newer dumps) instead of holding the title in cl_to
+        """
+
+        if self._uses_target_id is None:
+            self._uses_target_id = "cl_to" not in sql_columns(self.categorylinks)
+            if self._uses_target_id and self.linktarget is None:
+                raise ValueError("{0} uses cl_target_id, the linktarget dump is needed too".format(self.categorylinks))
+        return self._uses_target_id
+
+    def _linktarget_titles(self, target_ids) -> dict:
+        return {
+            lt_id: lt_title
+            for lt_id, lt_namespace, lt_title in iter_sql_rows(self.linktarget, ["lt_id", "lt_namespace", "lt_title"])
+            if lt_namespace == CATEGORY_NAMESPACE and lt_id in target_ids
+        }
+
+    def _hidden_category_ids(self) -> set:
+        if self.page_props is None:
+            return set()
+        return {pp_page for pp_page, pp_propname in iter_sql_rows(self.page_props, ["pp_page", "pp_propname"]) if pp_propname == b"hiddencat"}
+
+    def category_members(self, cat_titles) -> dict:
+
+        """
+        the files of many categories in one pass over categorylinks and one over page
+
+        Args:
+            cat_titles ([string]): the titles of the categories
+
+        Returns:
+            members (dict): maps each category to its [CategoryMember], in the order of the api (by sort key)
+        """
+
+        wanted = {_db_key(cat_title): cat_title for cat_title in cat_titles}
+        links = {cat_title: [] for cat_title in cat_titles}
+
+        if self._target_ids():
+            targets = {lt_id: wanted[lt_title] for lt_id, lt_namespace, lt_title in iter_sql_rows(self.linktarget, ["lt_id", "lt_namespace", "lt_title"])
+                       if lt_namespace == CATEGORY_NAMESPACE and lt_title in wanted}
+            rows = iter_sql_rows(self.categorylinks, ["cl_from", "cl_target_id", "cl_sortkey"])
+        else:
+            targets = wanted
+            rows = iter_sql_rows(self.categorylinks, ["cl_from", "cl_to", "cl_sortkey"])
+        for cl_from, target, cl_sortkey in rows:
+            if target in targets:
+                links[targets[target]].append((cl_sortkey, cl_from))
+
+        pageids = {cl_from for cat_links in links.values() for cl_sortkey, cl_from in cat_links}
+        files = {
+            page_id: _title("File:", page_title)
+            for page_id, page_namespace, page_title in iter_sql_rows(self.page, ["page_id", "page_namespace", "page_title"])
+            if page_namespace == FILE_NAMESPACE and page_id in pageids #the subcategories and other pages are left out like cmnamespace=6
+        }
+        return {
+            cat_title: [Task3.CategoryMember(cl_from, files[cl_from], FILE_NAMESPACE) for cl_sortkey, cl_from in sorted(cat_links) if cl_from in files]
+            for cat_title, cat_links in links.items()
+        }
+
+    def iter_category_members(self, cat_title, lang='commons', namespace=6):
+
+        """
+        offline version of Task3.iter_category_members, files only
+
+        Returns:
+            generator of CategoryMember(pageid, title, ns)
+        """
+
+        if int(namespace) != FILE_NAMESPACE:
+            raise ValueError("the dump reader lists the files of a category, namespace 6")
+        yield from self.category_members([cat_title])[cat_title]
+
+    def get_all_files_subcat(self, cat_title, lang='commons') -> list:
+
+        """
+        offline version of Task3.get_all_files_subcat
+
+        Returns:
+            files_list ([string]): the titles of the files of the category
+        """
+
+        return [member.title for member in self.iter_category_members(cat_title, lang)]
+
+    def get_categories_bulk(self, titles, lang='commons') -> dict:
+
+        """
+        offline version of Task3.get_categories_bulk, one pass over page_props, page and categorylinks for all the titles
+
+        Args:
+            titles ([string]): the titles of the commons files
+
+        Returns:
+            files_categories (dict): maps each title to {'hidden': [string], 'visible': [string]}, sorted like the api
+        """
+
+        titles = list(titles)
+        return self._categories_by_pageid(titles=titles)[1]
+
+    def _categories_by_pageid(self, titles=(), pageids=()):
+
+        """
+        the categories of files given by title or by pageid
+
+        Returns:
+            titles_by_pageid (dict): maps the pageid of every file found to its title
+            files_categories (dict): maps each title (as given, or as in the dump for pageids) to {'hidden', 'visible'}
+        """
+
+        hidden_ids = self._hidden_category_ids()
+        wanted_titles = {_db_key(title): title for title in titles}
+        wanted_pageids = set(pageids)
+
+        titles_by_pageid = {}
+        hidden_titles = set()
+        for page_id, page_namespace, page_title in iter_sql_rows(self.page, ["page_id", "page_namespace", "page_title"]):
+            if page_namespace == FILE_NAMESPACE and (page_title in wanted_titles or page_id in wanted_pageids):
+                titles_by_pageid[page_id] = wanted_titles.get(page_title) or _title("File:", page_title)
+            elif page_namespace == CATEGORY_NAMESPACE and page_id in hidden_ids:
+                hidden_titles.add(page_title)
+
+        links = {page_id: [] for page_id in titles_by_pageid}
+        target_column = "cl_target_id" if self._target_ids() else "cl_to"
+        for cl_from, target in iter_sql_rows(self.categorylinks, ["cl_from", target_column]):
+            if cl_from in links:
+                links[cl_from].append(target)
+        if self._uses_target_id:
+            target_titles = self._linktarget_titles({target for targets in links.values() for target in targets})
+            links = {page_id: [target_titles[target] for target in targets if target in target_titles] for page_id, targets in links.items()}
+
+        files_categories = {title: {'hidden': [], 'visible': []} for title in titles}
+        for page_id, categories in links.items():
+            file_categories = files_categories.setdefault(titles_by_pageid[page_id], {'hidden': [], 'visible': []})
+            for category in sorted(categories): #prop=categories is sorted by the title as stored
+                file_categories['hidden' if category in hidden_titles else 'visible'].append(_title("Category:", category))
+        return titles_by_pageid, files_categories
+
+    def iter_depicts(self, pageids=None):
+
+        """
+        the depicts (P180) statements of the files in the MediaInfo dump
+
+        Args:
+            pageids ([int]): only the entities of these files, None reads every entity of the dump
+
+        Returns:
+            generator of (pageid, [string]) with the wikidata items each file depicts
+        """
+
+        if self.mediainfo is None:
+            raise ValueError("the depicts are read from the mediainfo dump, it was not given")
+        for pageid, entity in iter_mediainfo(self.mediainfo, None if pageids is None else set(pageids)):
+            yield pageid, Task3._depicts_of(entity)
+
+    def get_depicts_bulk(self, pageids, lang='commons'):
+
+        """
+        offline version of Task3.get_depicts_bulk, one pass over the MediaInfo dump for all the pageids
+
+        Returns:
+            depicts_by_pageid (dict): maps each pageid to the list of wikidata items (Q-ids) it depicts
+            depicts_set (set): the unique wikidata items depicted by all the files
+        """
+
+        depicts_by_pageid = {int(pageid): [] for pageid in pageids} #files without structured data depict nothing, like the api
+        depicts_set = set()
+        for pageid, wikidata_list in self.iter_depicts(depicts_by_pageid):
+            depicts_by_pageid[pageid] = wikidata_list
+            depicts_set.update(wikidata_list)
+        return depicts_by_pageid, depicts_set
+
+    def get_wikidata(self, cat, lang='commons') -> list:
+
+        """
+        offline version of Task3.get_wikidata
+
+        Returns:
+            new_wikidata_list ([string]): the unique wikidata items depicted by the files of the category
+        """
+
+        depicts_by_pageid, depicts_set = self.get_depicts_bulk([member.pageid for member in self.iter_category_members(cat, lang)])
+        return list(depicts_set)
+
+    def harvest_category(self, cat_title, lang='commons', depicts=True) -> list:
+
+        """
+        the files of a category with their categories and depicts, like harvest_async.harvest_category without imageinfo
+
+        Returns:
+            files ([dict]): one dictionary per file with pageid, title, categories and depicts, in the order of the category
+        """
+
+        members = list(self.iter_category_members(cat_title, lang))
+        titles_by_pageid, files_categories = self._categories_by_pageid(pageids=[member.pageid for member in members])
+        depicts_by_pageid = self.get_depicts_bulk([member.pageid for member in members])[0] if depicts else {}
+        return [
+            {
+                "pageid": member.pageid,
+                "title": member.title,
+                "categories": files_categories.get(member.title, {'hidden': [], 'visible': []}),
+                "depicts": depicts_by_pageid.get(member.pageid, []),
+            }
+            for member in members
+        ]
+
+
+def _sql_literal(value) -> bytes:
+    if value is None:
+        return b"NULL"
+    if isinstance(value, (int, float)):
+        return str(value).encode()
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return b"'" + value.replace(b"\\", b"\\\\").replace(b"'", b"\\'").replace(b"\n", b"\\n").replace(b"\0", b"\\0") + b"'"
+
+
+def write_sql_dump(path, table, columns, rows, rows_per_insert=1000):
+
+    """
+    writes rows as a mysqldump file, to build small fixture dumps for DumpReader
+
+    Args:
+        path (string): the file to write, compressed according to its extension
+        table (string): the name of the table eg categorylinks
+        columns ([string]): the names of the columns
+        rows (iterable): tuples of values, bytes or strings, ints or None
+        rows_per_insert (int): how many rows each INSERT statement holds
+    """
+
+    opener = gzip.open if path.endswith(".gz") else bz2.open if path.endswith(".bz2") else open
+    with opener(path, "wb") as dump:
+        dump.write("CREATE TABLE `{0}` (\n".format(table).encode())
+        dump.write(b",\n".join("  `{0}` varbinary(255) NOT NULL".format(column).encode() for column in columns))
+        dump.write(b"\n) ENGINE=InnoDB DEFAULT CHARSET=binary;\n")
+        for rows_chunk in Task3._chunks(rows, rows_per_insert):
+            values = b",".join(b"(" + b",".join(_sql_literal(value) for value in row) + b")" for row in rows_chunk)
+            dump.write("INSERT INTO `{0}` VALUES ".format(table).encode() + values + b";\n")
+
+
+def write_mediainfo_dump(path, entities):
+
+    """
+    writes MediaInfo entities as a json dump, one entity per line inside a json array like the real dump
+    """
+
+    opener = gzip.open if path.endswith(".gz") else bz2.open if path.endswith(".bz2") else open
+    with opener(path, "wb") as dump:
+        dump.write(b"[\n")
+        first = True
+        for entity in entities:
+            dump.write((b"" if first else b",\n") + json.dumps(entity, ensure_ascii=False).encode("utf-8"))
+            first = False
+        dump.write(b"\n]\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="offline harvest of a commons category from the dump files, one json line per file")
+    parser.add_argument("category", help="the title of the category of interest")
+    parser.add_argument("--page", required=True, help="the page table dump eg commonswiki-latest-page.sql.gz")
+    parser.add_argument("--categorylinks", required=True, help="the categorylinks table dump")
+    parser.add_argument("--page-props", help="the page_props table dump, to tell the hidden categories apart")
+    parser.add_argument("--linktarget", help="the linktarget table dump, for dumps where categorylinks has cl_target_id")
+    parser.add_argument("--mediainfo", help="the MediaInfo json dump, for the depicts")
+    args = parser.parse_args(argv)
+
+    reader = DumpReader(args.page, args.categorylinks, page_props=args.page_props, linktarget=args.linktarget, mediainfo=args.mediainfo)
+    for file_item in reader.harvest_category(args.category, depicts=args.mediainfo is not None):
+        print(json.dumps(file_item, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+'''
+compact in-memory index over harvested files, their categories and the wikidata items they depict, for the questions
+asked after a harvest (which files share a category, which categories are the most common, which items are depicted
+across subcategories) without calling the api again or rescanning lists with list(set(...)).
+
+every title, category and item is interned once and given an integer id, and the links are kept as sorted numpy
+posting lists in both directions (category -> files, file -> categories, item -> files, file -> items), so
+intersections, unions and top-k counts run over int32 arrays. the index is saved to a single file of aligned arrays
+that is memory-mapped on load, so even a million-file index opens in milliseconds and only the pages a query touches
+are read.
+
+    index = FileIndex.build(harvest_async.harvest_category(cat_title))
+    index.intersect(categories=["Category:Quixadá", "Category:Wiki Loves Monuments 2021 in Brazil"])
+    index.top_categories(10)
+    index.save("wlm_2021_brazil.idx")
+    index = FileIndex.load("wlm_2021_brazil.idx")
+'''
+
+import argparse
+import bisect
+import json
+import mmap
+
+import numpy as np
+
+MAGIC = b"WTIDX1\n"
+ALIGNMENT = 64 #every array starts on a 64 byte boundary so it can be viewed from the map without a copy
+
+
+class _Strings:
+
+    """
+    interned strings as one utf-8 blob with offsets, and the ids sorted by their bytes to find an id with a binary search.
+    nothing is decoded when the index is loaded, only the strings a query gives back
+    """
+
+    def __init__(self, blob, offsets, order):
+        self.blob = blob
+        self.offsets = offsets
+        self.order = order
+
+    @classmethod
+    def from_list(cls, strings) -> "_Strings":
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+        order = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int32)
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets, order)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bytes(self, string_id) -> bytes:
+        return self.blob[self.offsets[string_id]:self.offsets[string_id + 1]].tobytes()
+
+    def __getitem__(self, string_id) -> str:
+        return self._bytes(string_id).decode("utf-8")
+
+    def id(self, string):
+
+        """
+        the id of a string, None when it is not in the index
+        """
+
+        value = string.encode("utf-8")
+        position = bisect.bisect_left(self.order, value, key=lambda string_id: self._bytes(string_id))
+        if position < len(self.order) and self._bytes(self.order[position]) == value:
+            return int(self.order[position])
+        return None
+
+
+def _csr(rows, columns, row_count):
+
+    """
+    the (offsets, values) of a compressed sparse row table from (row, column) pairs, values sorted within each row and unique
+    """
+
+    rows, columns = np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)
+    order = np.lexsort((columns, rows))
+    rows, columns = rows[order], columns[order]
+    if len(rows):
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1]) #a category listed twice for a file
+        rows, columns = rows[keep], columns[keep]
+    offsets = np.zeros(row_count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(rows, minlength=row_count))
+    return offsets, columns.astype(np.int32)
+
+
+class FileIndex:
+
+    """
+    the files of a harvest with their categories and depicts, built with FileIndex.build or opened with FileIndex.load
+
+    Args:
+        arrays (dict): the arrays of the index by name, as build gives them or as views of the memory map
+        mapped (mmap.mmap): the map the arrays are views of
+    """
+
+    def __init__(self, arrays, mapped=None):
+        self.arrays = arrays
+        self._mapped = mapped
+        self.titles = _Strings(arrays["title_blob"], arrays["title_offsets"], arrays["title_order"])
+        self.categories = _Strings(arrays["category_blob"], arrays["category_offsets"], arrays["category_order"])
+        self.items = _Strings(arrays["item_blob"], arrays["item_offsets"], arrays["item_order"])
+
+    @classmethod
+    def build(cls, records) -> "FileIndex":
+
+        """
+        builds the index from harvested files
+
+        Args:
+            records (iterable): one dictionary per file with title, and optionally pageid, categories
+                ({'hidden': [string], 'visible': [string]} or [string]) and depicts ([string]), eg the files of
+                harvest_async.harvest_category, DumpReader.harvest_category or the shards of bulk_export
+
+        Returns:
+            index (FileIndex)
+        """
+
+        titles, pageids = [], []
+        category_ids, item_ids = {}, {}
+        hidden = []
+        file_categories, file_items = ([], []), ([], [])
+        file_ids = {}
+
+        for record in records:
+            if record['title'] in file_ids: #the same file harvested from several categories
+                file_id = file_ids[record['title']]
+            else:
+                file_id = file_ids[record['title']] = len(titles)
+                titles.append(record['title'])
+                pageids.append(record.get('pageid') or -1)
+
+            categories = record.get('categories') or {}
+            if isinstance(categories, list):
+                categories = {'visible': categories}
+            for kind in ('hidden', 'visible'):
+                for category in categories.get(kind) or []:
+                    if category not in category_ids:
+                        category_ids[category] = len(category_ids)
+                        hidden.append(kind == 'hidden')
+                    file_categories[0].append(file_id)
+                    file_categories[1].append(category_ids[category])
+
+            for item in record.get('depicts') or []:
+                item_id = item_ids.setdefault(item, len(item_ids))
+                file_items[0].append(file_id)
+                file_items[1].append(item_id)
+
+        arrays = {"pageids": np.array(pageids, dtype=np.int64), "category_hidden": np.array(hidden, dtype=np.uint8)}
+        for name, strings in (("title", titles), ("category", list(category_ids)), ("item", list(item_ids))):
+            table = _Strings.from_list(strings)
+            arrays[name + "_blob"], arrays[name + "_offsets"], arrays[name + "_order"] = table.blob, table.offsets, table.order
+
+        arrays["file_category_offsets"], arrays["file_categories"] = _csr(file_categories[0], file_categories[1], len(titles))
+        arrays["category_file_offsets"], arrays["category_files"] = _csr(file_categories[1], file_categories[0], len(category_ids))
+        arrays["file_item_offsets"], arrays["file_items"] = _csr(file_items[0], file_items[1], len(titles))
+        arrays["item_file_offsets"], arrays["item_files"] = _csr(file_items[1], file_items[0], len(item_ids))
+        return cls(arrays)
+
+    @classmethod
+    def from_jsonl(cls, paths) -> "FileIndex":
+
+        """
+        builds the index from json lines files, eg the shards of bulk_export
+        """
+
+        def records():
+            for path in paths:
+                with open(path, encoding="utf-8") as jsonl_file:
+                    for line in jsonl_file:
+                        yield json.loads(line)
+
+        return cls.build(records())
+
+    def save(self, path):
+
+        """
+        writes the index as a header followed by its arrays, each aligned so load can view it in place
+        """
+
+        header = {}
+        offset = 0
+        for name, array in self.arrays.items():
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            header[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset += array.nbytes
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+        with open(path, "wb") as index_file:
+            index_file.write(MAGIC + len(header_bytes).to_bytes(8, "little") + header_bytes)
+            for name, array in self.arrays.items():
+                index_file.seek(data_start + header[name]["offset"])
+                index_file.write(np.ascontiguousarray(array).tobytes())
+            index_file.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, path) -> "FileIndex":
+
+        """
+        opens a saved index by memory-mapping it, the arrays are read lazily by the queries
+        """
+
+        with open(path, "rb") as index_file:
+            mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError("{0} is not a file index".format(path))
+        header_length = int.from_bytes(mapped[len(MAGIC):len(MAGIC) + 8], "little")
+        header = json.loads(mapped[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+        data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+
+        arrays = {}
+        for name, description in header.items():
+            dtype = np.dtype(description["dtype"])
+            count = int(np.prod(description["shape"]))
+            arrays[name] = np.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + description["offset"]).reshape(description["shape"])
+        return cls(arrays, mapped)
+
+    def __len__(self):
+        return len(self.titles)
+
+    @staticmethod
+    def _row(offsets, values, row):
+        return values[offsets[row]:offsets[row + 1]]
+
+    def _posting(self, name, string_id):
+        kind = "category" if name == "categories" else "item"
+        return self._row(self.arrays[kind + "_file_offsets"], self.arrays[kind + "_files"], string_id)
+
+    def _file_ids(self, categories=(), depicts=()) -> list:
+
+        """
+        the posting lists of categories and items, an unknown one is an empty list
+        """
+
+        postings = []
+        for table, name, strings in ((self.categories, "categories", categories), (self.items, "depicts", depicts)):
+            for string in strings:
+                string_id = table.id(string)
+                postings.append(self._posting(name, string_id) if string_id is not None else np.zeros(0, dtype=np.int32))
+        return postings
+
+    def _titles(self, file_ids) -> list:
+        return [self.titles[int(file_id)] for file_id in file_ids]
+
+    def files(self, category) -> list:
+
+        """
+        the titles of the files of a category
+        """
+
+        return self.intersect(categories=[category])
+
+    def files_depicting(self, item) -> list:
+
+        """
+        the titles of the files that depict a wikidata item
+        """
+
+        return self.intersect(depicts=[item])
+
+    def intersect_ids(self, categories=(), depicts=()):
+
+        """
+        the file ids in all of the categories and depicting all of the items, the smallest posting list first
+        """
+
+        postings = sorted(self._file_ids(categories, depicts), key=len)
+        if not postings:
+            return np.zeros(0, dtype=np.int32)
+        result = postings[0]
+        for posting in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    def union_ids(self, categories=(), depicts=()):
+
+        """
+        the file ids in any of the categories or depicting any of the items
+        """
+
+        postings = self._file_ids(categories, depicts)
+        return np.unique(np.concatenate(postings)) if postings else np.zeros(0, dtype=np.int32)
+
+    def intersect(self, categories=(), depicts=()) -> list:
+
+        """
+        the titles of the files that are in all of the categories and depict all of the items
+        """
+
+        return self._titles(self.intersect_ids(categories, depicts))
+
+    def union(self, categories=(), depicts=()) -> list:
+
+        """
+        the titles of the files that are in any of the categories or depict any of the items
+        """
+
+        return self._titles(self.union_ids(categories, depicts))
+
+    def categories_of(self, title) -> dict:
+
+        """
+        the categories of a file, {'hidden': [string], 'visible': [string]} like get_categories_bulk gives
+        """
+
+        file_categories = {'hidden': [], 'visible': []}
+        file_id = self.titles.id(title)
+        if file_id is None:
+            return file_categories
+        hidden = self.arrays["category_hidden"]
+        for category_id in self._row(self.arrays["file_category_offsets"], self.arrays["file_categories"], file_id):
+            file_categories['hidden' if hidden[category_id] else 'visible'].append(self.categories[int(category_id)])
+        return file_categories
+
+    def depicts_of(self, title) -> list:
+
+        """
+        the wikidata items a file depicts
+        """
+
+        file_id = self.titles.id(title)
+        if file_id is None:
+            return []
+        return [self.items[int(item_id)] for item_id in self._row(self.arrays["file_item_offsets"], self.arrays["file_items"], file_id)]
+
+    @staticmethod
+    def _gather(offsets, values, rows):
+
+        """
+        the values of several rows of a compressed sparse row table concatenated, without a python loop over the rows
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, lengths = offsets[rows], offsets[rows + 1] - offsets[rows]
+        if not lengths.sum():
+            return np.zeros(0, dtype=values.dtype)
+        shifts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return values[shifts + np.arange(int(lengths.sum()))]
+
+    def _counts(self, kind, file_ids):
+        if file_ids is None:
+            return np.diff(self.arrays[kind + "_file_offsets"]) #the length of every posting list
+        links = "file_categories" if kind == "category" else "file_items"
+        linked = self._gather(self.arrays["file_" + kind + "_offsets"], self.arrays[links], file_ids)
+        return np.bincount(linked, minlength=len(self.arrays[kind + "_file_offsets"]) - 1)
+
+    def _top(self, counts, table, k, allowed=None) -> list:
+        if allowed is not None:
+            counts = np.where(allowed, counts, 0)
+        k = min(k, int(np.count_nonzero(counts)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-counts, k - 1)[:k]
+        top = top[np.lexsort((top, -counts[top]))] #by count, then by id so ties come out the same every time
+        return [(table[int(string_id)], int(counts[string_id])) for string_id in top]
+
+    def top_categories(self, k=10, file_ids=None, hidden=None) -> list:
+
+        """
+        the k categories with the most files
+
+        Args:
+            k (int): how many categories
+            file_ids (array): only count these files, eg intersect_ids(...), None counts all of them
+            hidden (bool): True counts only the hidden categories, False only the visible ones, None both
+
+        Returns:
+            top ([(string, int)]): the categories and their number of files, the most common first
+        """
+
+        allowed = None if hidden is None else self.arrays["category_hidden"].astype(bool) == hidden
+        return self._top(self._counts("category", file_ids), self.categories, k, allowed)
+
+    def top_depicts(self, k=10, file_ids=None) -> list:
+
+        """
+        the k wikidata items depicted by the most files, only counting file_ids when they are given
+        """
+
+        return self._top(self._counts("item", file_ids), self.items, k)
+
+    def depicts_across(self, categories, min_categories=2) -> list:
+
+        """
+        the wikidata items depicted in the files of several of the given categories, eg the monuments photographed in
+        more than one subcategory
+
+        Returns:
+            items ([(string, int)]): the items and the number of categories they are depicted in, the most first
+        """
+
+        per_category = [np.flatnonzero(self._counts("item", posting)) for posting in self._file_ids(categories=categories) if len(posting)]
+        if not per_category:
+            return []
+        counts = np.bincount(np.concatenate(per_category), minlength=len(self.items))
+        return [(item, count) for item, count in self._top(counts, self.items, len(self.items)) if count >= min_categories]
+
+
+
+def main(argv=None):
+
+    """
+    builds an index from json lines files, eg the shards of bulk_export, and prints its most common categories and depicts
+    """
+
+    parser = argparse.ArgumentParser(description="build a file index from harvested json lines files")
+    parser.add_argument("output", help="the index file to write")
+    parser.add_argument("jsonl", nargs="+", help="json lines files with one harvested file per line")
+    parser.add_argument("--top", type=int, default=10, help="how many categories and depicts to print")
+    args = parser.parse_args(argv)
+
+    index = FileIndex.from_jsonl(args.jsonl)
+    index.save(args.output)
+    print("{0} files, {1} categories, {2} depicted items".format(len(index), len(index.categories), len(index.items)))
+    for category, count in index.top_categories(args.top):
+        print(count, category)
+    for item, count in index.top_depicts(args.top):
+        print(count, item)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+'''
+spatial index over the GPSLatitude/GPSLongitude of harvested files, for questions like "which monument photos are within
+2 km of this point" or "all files inside this municipality's bounding box" across hundreds of thousands of files.
+
+the points are bucketed in a grid of cell_size degree cells and sorted by cell, so the cells of a query are a few
+contiguous slices of the sorted arrays found with searchsorted. only the points of those cells are checked exactly, with
+vectorized haversine distances, instead of every point of the harvest.
+
+    index = GeoIndex.from_records(Task3.get_all_files_data(titles, "commons"))
+    index.radius(-4.97, -39.01, 2000)
+    index.bbox(-5.2, -39.3, -4.7, -38.8)
+    index.nearest(-4.97, -39.01, k=5)
+
+    python geo_index.py --benchmark --points 500000
+'''
+
+import argparse
+import csv
+import json
+import math
+import time
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8 #mean earth radius in meters
+
+
+def haversine(latitude, longitude, latitudes, longitudes):
+
+    """
+    great circle distances in meters from one point to arrays of points, all in degrees
+    """
+
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((latitudes - latitude) / 2) ** 2 + math.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _coordinates(record):
+
+    """
+    the title, latitude and longitude of a harvested file: a FileRecord, its dictionary from write_jsonl or write_csv, or
+    a record of bulk_export with the FileRecord under 'data'
+    """
+
+    if hasattr(record, "_asdict"):
+        record = record._asdict()
+    data = record.get('data') or record
+    return record.get('title'), data.get('gps_latitude'), data.get('gps_longitude')
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value
+
+
+def _float_array(values):
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64, copy=False)
+    return np.array([_to_float(value) for value in values], dtype=np.float64) #the csv output has the coordinates as strings, '' when missing
+
+
+class GeoIndex:
+
+    """
+    grid index of the coordinates of files, built with GeoIndex(titles, latitudes, longitudes) or GeoIndex.from_records
+
+    Args:
+        titles ([string]): the titles of the files
+        latitudes (array): their latitudes in degrees, files without coordinates (None or nan) are left out
+        longitudes (array): their longitudes in degrees
+        cell_size (float): the side of a grid cell in degrees, about the radius of the usual query works best
+    """
+
+    def __init__(self, titles, latitudes, longitudes, cell_size=0.02):
+        latitudes, longitudes = _float_array(latitudes), _float_array(longitudes)
+        valid = np.isfinite(latitudes) & np.isfinite(longitudes) & (np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180)
+
+        self.cell_size = cell_size
+        self.columns = int(math.ceil(360 / cell_size)) + 1
+        file_ids = np.flatnonzero(valid)
+        cells = self._cells(latitudes[file_ids], longitudes[file_ids])
+        order = np.argsort(cells, kind="stable")
+
+        self.titles = titles if isinstance(titles, list) else list(titles)
+        self.cells = cells[order]
+        self.file_ids = file_ids[order]
+        self.latitudes = latitudes[self.file_ids]
+        self.longitudes = longitudes[self.file_ids]
+
+    @classmethod
+    def from_records(cls, records, cell_size=0.02) -> "GeoIndex":
+
+        """
+        builds the index from harvested files, eg the FileRecords of Task3.get_all_files_data, the rows of its json lines or
+        csv output, or the records of bulk_export
+        """
+
+        titles, latitudes, longitudes = [], [], []
+        for record in records:
+            title, latitude, longitude = _coordinates(record)
+            titles.append(title)
+            latitudes.append(_to_float(latitude))
+            longitudes.append(_to_float(longitude))
+        return cls(titles, np.array(latitudes, dtype=np.float64), np.array(longitudes, dtype=np.float64), cell_size)
+
+    @classmethod
+    def from_files(cls, paths, cell_size=0.02) -> "GeoIndex":
+
+        """
+        builds the index from json lines and csv files written by Task3.write_jsonl, write_csv or bulk_export
+        """
+
+        def records():
+            for path in paths:
+                with open(path, encoding="utf-8", newline="") as harvest_file:
+                    if path.endswith(".csv"):
+                        yield from csv.DictReader(harvest_file)
+                    else:
+                        for line in harvest_file:
+                            yield json.loads(line)
+
+        return cls.from_records(records(), cell_size)
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def _rows(self, latitudes):
+        return np.floor((np.asarray(latitudes) + 90) / self.cell_size).astype(np.int64)
+
+    def _columns(self, longitudes):
+        return np.floor((np.asarray(longitudes) + 180) / self.cell_size).astype(np.int64)
+
+    def _cells(self, latitudes, longitudes):
+        return self._rows(latitudes) * self.columns + self._columns(longitudes)
+
+    def _candidates(self, south, west, north, east):
+
+        """
+        the positions of the points in the cells that cover a bounding box, west > east crosses the antimeridian
+        """
+
+        if west > east:
+            return np.concatenate([self._candidates(south, west, north, 180.0), self._candidates(south, -180.0, north, east)])
+        rows = np.arange(self._rows(max(south, -90.0)), self._rows(min(north, 90.0)) + 1)
+        starts = np.searchsorted(self.cells, rows * self.columns + self._columns(max(west, -180.0)), side="left")
+        ends = np.searchsorted(self.cells, rows * self.columns + self._columns(min(east, 180.0)), side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64)
+        shifts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) #every cell row is one slice of the sorted points
+        return shifts + np.arange(total)
+
+    def _inside(self, positions, south, west, north, east):
+        latitudes, longitudes = self.latitudes[positions], self.longitudes[positions]
+        inside_longitude = (longitudes >= west) & (longitudes <= east) if west <= east else (longitudes >= west) | (longitudes <= east)
+        return positions[(latitudes >= south) & (latitudes <= north) & inside_longitude]
+
+    def _titles(self, positions) -> list:
+        return [self.titles[file_id] for file_id in self.file_ids[positions]]
+
+    def bbox_ids(self, south, west, north, east):
+
+        """
+        the ids (positions in the titles given to the index) of the files inside a bounding box in degrees
+        """
+
+        positions = self._inside(self._candidates(south, west, north, east), south, west, north, east)
+        return np.sort(self.file_ids[positions])
+
+    def bbox(self, south, west, north, east) -> list:
+
+        """
+        the titles of the files inside a bounding box
+
+        Args:
+            south, west, north, east (float): the box in degrees, west greater than east crosses the antimeridian
+
+        Returns:
+            titles ([string]): in the order the files were given to the index
+        """
+
+        return [self.titles[file_id] for file_id in self.bbox_ids(south, west, north, east)]
+
+    def _radius_box(self, latitude, longitude, meters):
+        latitude_span = math.degrees(meters / EARTH_RADIUS)
+        south, north = latitude - latitude_span, latitude + latitude_span
+        if south <= -90 or north >= 90 or meters >= math.pi * EARTH_RADIUS / 2: #the circle takes in a pole, every longitude
+            return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+        longitude_span = math.degrees(math.asin(min(1.0, math.sin(meters / EARTH_RADIUS) / math.cos(math.radians(latitude)))))
+        west, east = longitude - longitude_span, longitude + longitude_span
+        if west < -180:
+            west += 360
+        if east > 180:
+            east -= 360
+        return south, west, north, east
+
+    def _within(self, latitude, longitude, meters):
+        positions = self._candidates(*self._radius_box(latitude, longitude, meters))
+        distances = haversine(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+        inside = distances <= meters
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return positions[order], distances[order]
+
+    def radius(self, latitude, longitude, meters) -> list:
+
+        """
+        the files within a distance of a point
+
+        Args:
+            latitude, longitude (float): the point in degrees
+            meters (float): the radius
+
+        Returns:
+            files ([(string, float)]): the titles and their distance in meters, the closest first
+        """
+
+        positions, distances = self._within(latitude, longitude, meters)
+        return list(zip(self._titles(positions), distances.tolist()))
+
+    def nearest(self, latitude, longitude, k=10) -> list:
+
+        """
+        the k files closest to a point, the radius searched is doubled from one cell until it holds k files
+
+        Returns:
+            files ([(string, float)]): the titles and their distance in meters, the closest first
+        """
+
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        meters = math.radians(self.cell_size) * EARTH_RADIUS
+        while True:
+            positions, distances = self._within(latitude, longitude, meters)
+            if len(positions) >= k or meters >= math.pi * EARTH_RADIUS: #half the circumference takes in the whole earth
+                return list(zip(self._titles(positions[:k]), distances[:k].tolist()))
+            meters *= 2
+
+
+def linear_radius(latitudes, longitudes, latitude, longitude, meters):
+
+    """
+    the ids of the points within a distance of a point by checking every one of them, the baseline of the benchmark
+    """
+
+    return np.flatnonzero(haversine(latitude, longitude, latitudes, longitudes) <= meters)
+
+
+def benchmark(points=500000, queries=200, meters=2000, cell_size=0.02, seed=0) -> dict:
+
+    """
+    times the radius, bounding-box and k-nearest queries of GeoIndex against a linear scan over the same numpy arrays,
+    on points spread over brazil like a wiki loves monuments harvest, and checks that both give the same files
+
+    Returns:
+        results (dict): the build time and, for every query, the mean seconds of the index and of the linear scan
+    """
+
+    random_state = np.random.default_rng(seed)
+    centres = np.column_stack([random_state.uniform(-30, 0, 300), random_state.uniform(-60, -35, 300)]) #towns the monuments cluster around
+    picked = centres[random_state.integers(0, len(centres), points)]
+    latitudes = picked[:, 0] + random_state.normal(0, 0.2, points)
+    longitudes = picked[:, 1] + random_state.normal(0, 0.2, points)
+    titles = ["File:Benchmark {0}.jpg".format(file_id) for file_id in range(points)]
+    query_points = picked[random_state.integers(0, points, queries)] + random_state.normal(0, 0.1, (queries, 2))
+
+    started = time.perf_counter()
+    index = GeoIndex(titles, latitudes, longitudes, cell_size)
+    results = {"points": points, "queries": queries, "meters": meters, "cell_size": cell_size, "build": time.perf_counter() - started}
+
+    def timed(function):
+        started = time.perf_counter()
+        answers = [function(latitude, longitude) for latitude, longitude in query_points]
+        return answers, (time.perf_counter() - started) / queries
+
+    box = math.degrees(meters / EARTH_RADIUS) #a box about as large as the radius
+    cases = {
+        "radius": (lambda latitude, longitude: np.sort(index.file_ids[index._within(latitude, longitude, meters)[0]]),
+                   lambda latitude, longitude: linear_radius(latitudes, longitudes, latitude, longitude, meters)),
+        "bbox": (lambda latitude, longitude: index.bbox_ids(latitude - box, longitude - box, latitude + box, longitude + box),
+                 lambda latitude, longitude: np.flatnonzero((latitudes >= latitude - box) & (latitudes <= latitude + box) & (longitudes >= longitude - box) & (longitudes <= longitude + box))),
+        "nearest": (lambda latitude, longitude: index.nearest(latitude, longitude, 10),
+                    lambda latitude, longitude: np.argsort(haversine(latitude, longitude, latitudes, longitudes), kind="stable")[:10]),
+    }
+    for name, (indexed, linear) in cases.items():
+        indexed_answers, indexed_time = timed(indexed)
+        linear_answers, linear_time = timed(linear)
+        if name == "nearest": #ties aside the nearest files are the same, so compare their distances
+            indexed_answers = [[distance for _, distance in answer] for answer in indexed_answers]
+            linear_answers = [haversine(latitude, longitude, latitudes[answer], longitudes[answer]).tolist() for answer, (latitude, longitude) in zip(linear_answers, query_points)]
+            same = all(np.allclose(a, b) for a, b in zip(indexed_answers, linear_answers))
+        else:
+            same = all(np.array_equal(a, b) for a, b in zip(indexed_answers, linear_answers))
+        results[name] = {"index": indexed_time, "linear": linear_time, "speedup": linear_time / indexed_time, "same": same}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="spatial queries over the coordinates of harvested files")
+    parser.add_argument("files", nargs="*", help="json lines or csv files written by Task3.write_jsonl, write_csv or bulk_export")
+    parser.add_argument("--radius", type=float, nargs=3, metavar=("LAT", "LON", "METERS"), help="files within METERS of a point")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("SOUTH", "WEST", "NORTH", "EAST"), help="files inside a bounding box")
+    parser.add_argument("--nearest", type=float, nargs=3, metavar=("LAT", "LON", "K"), help="the K files closest to a point")
+    parser.add_argument("--cell-size", type=float, default=0.02, help="side of a grid cell in degrees")
+    parser.add_argument("--benchmark", action="store_true", help="compare the index with a linear scan on synthetic points")
+    parser.add_argument("--points", type=int, default=500000, help="number of synthetic points of the benchmark")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.points, cell_size=args.cell_size), indent=2))
+        return
+
+    index = GeoIndex.from_files(args.files, args.cell_size)
+    if args.radius:
+        for title, distance in index.radius(*args.radius):
+            print("{0:10.1f} m {1}".format(distance, title))
+    if args.bbox:
+        for title in index.bbox(*args.bbox):
+            print(title)
+    if args.nearest:
+        for title, distance in index.nearest(args.nearest[0], args.nearest[1], int(args.nearest[2])):
+            print("{0:10.1f} m {1}".format(distance, title))
+
+
+if __name__ == "__main__":
+    main()
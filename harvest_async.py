@@ -0,0 +1,212 @@
+'''
+asyncio engine that runs the fetchers of Task3.py concurrently. the blocking requests go through the pooled WikiClient
+on a thread pool per host, so every host gets at most `concurrency` requests in flight at the same time, while the
+results are put back in the order of the files of the category.
+'''
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import Task3
+
+
+class AsyncHarvester:
+
+    """
+    async versions of the category, imageinfo, entity and sparql fetchers of Task3.py
+
+    Args:
+        client (WikiClient): the shared api client, a client with a pool of `concurrency` connections is made when it is not given
+            and closed by close. a client that is passed in is left open and should have pool_maxsize >= concurrency or the
+            extra connections are not kept alive
+        concurrency (int): the most requests in flight at the same time for each host
+        sparql (SparqlQuery): the sparql query object, the shared one of Task3.py is used when it is not given
+        chunk_size (int): how many titles, pageids or wikidata items are sent in each request
+        items (ItemCache): the cache item_details takes the wikidata items from, see item_cache.py
+    """
+
+    def __init__(self, client=None, concurrency=8, sparql=None, chunk_size=50, items=None):
+        self._owns_client = client is None #a client passed in is closed by whoever made it
+        self.client = client or Task3.WikiClient(pool_maxsize=concurrency)
+        self.concurrency = concurrency
+        self.sparql = sparql
+        self.chunk_size = chunk_size
+        self.items = items
+        self._executors = {} #one thread pool per host, its size is the concurrency limit of the host
+
+    def _executor(self, host) -> ThreadPoolExecutor:
+        if host not in self._executors:
+            self._executors[host] = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="harvest-" + host)
+        return self._executors[host]
+
+    async def _run(self, host, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(host), functools.partial(function, *args, **kwargs))
+
+    async def _run_chunks(self, host, function, items, **kwargs) -> list:
+
+        """
+        runs function on every chunk of items concurrently and gives the results back in the order of the chunks
+        """
+
+        chunks = list(Task3._chunks(items, self.chunk_size))
+        return await asyncio.gather(*(self._run(host, function, chunk, **kwargs) for chunk in chunks))
+
+    async def get(self, lang, params) -> dict:
+
+        """
+        async version of WikiClient.get
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            params (dict): the parameters of the api request
+
+        Returns:
+            response (dict): the json response of the api
+        """
+
+        return await self._run(lang, self.client.get, lang, params)
+
+    async def category_members(self, cat_title, lang='commons', namespace=6) -> list:
+
+        """
+        async version of iter_category_members, the pages of a category depend on each other so they are fetched one after the other
+
+        Returns:
+            members ([CategoryMember]): the members of the category in the order the api gives them
+        """
+
+        return await self._run(lang, lambda: list(Task3.iter_category_members(cat_title, lang, namespace=namespace, client=self.client)))
+
+    async def categories(self, titles, lang='commons') -> dict:
+
+        """
+        async version of get_categories_bulk, the chunks of 50 titles are fetched concurrently
+
+        Returns:
+            files_categories (dict): maps each title to {'hidden': [string], 'visible': [string]}, in the order of titles
+        """
+
+        files_categories = {}
+        for chunk_categories in await self._run_chunks(lang, Task3.get_categories_bulk, titles, lang=lang, client=self.client):
+            files_categories.update(chunk_categories)
+        return files_categories
+
+    async def imageinfo(self, titles, lang='commons', iiprop="extmetadata|commonmetadata|size|dimensions|mime|mediatype") -> dict:
+
+        """
+        async version of get_imageinfo_bulk, the chunks of 50 titles are fetched concurrently
+
+        Returns:
+            files_imageinfo (dict): maps each title to its imageinfo list, in the order of titles
+        """
+
+        files_imageinfo = {}
+        for chunk_imageinfo in await self._run_chunks(lang, Task3.get_imageinfo_bulk, titles, lang=lang, client=self.client, iiprop=iiprop):
+            files_imageinfo.update(chunk_imageinfo)
+        return files_imageinfo
+
+    async def depicts(self, pageids, lang='commons'):
+
+        """
+        async version of get_depicts_bulk, the chunks of 50 entity ids are fetched concurrently
+
+        Returns:
+            depicts_by_pageid (dict): maps each pageid to the list of wikidata items it depicts, in the order of pageids
+            depicts_set (set): the unique wikidata items depicted by all the files
+        """
+
+        depicts_by_pageid = {}
+        depicts_set = set()
+        for chunk_depicts, chunk_set in await self._run_chunks(lang, Task3.get_depicts_bulk, pageids, lang=lang, client=self.client):
+            depicts_by_pageid.update(chunk_depicts)
+            depicts_set.update(chunk_set)
+        return depicts_by_pageid, depicts_set
+
+    async def item_details(self, wikidata_list) -> dict:
+
+        """
+        async version of get_item_details, the sparql queries of every chunk of items are sent concurrently
+
+        Returns:
+            item_details (dict): maps each wikidata item to the list of its result rows
+        """
+
+        item_details = {}
+        for chunk_details in await self._run_chunks(Task3.SPARQL_HOST, Task3.get_item_details, wikidata_list, chunk_size=self.chunk_size, sparql=self.sparql, metrics=self.client.metrics, throttle=self.client.throttle, items=self.items, client=self.client):
+            item_details.update(chunk_details)
+        return item_details
+
+    async def harvest_category(self, cat_title, lang='commons', depicts=True) -> list:
+
+        """
+        fetches the categories, imageinfo and (optionally) depicts of every file of a category, all the chunks concurrently
+
+        Args:
+            cat_title (string): the title/name of the category of interest
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            depicts (bool): whether the depicts (P180) statements are fetched too
+
+        Returns:
+            files ([dict]): one dictionary per file with pageid, title, categories, imageinfo and depicts, in the order of the category
+        """
+
+        members = await self.category_members(cat_title, lang)
+        titles = [member.title for member in members]
+
+        fetches = [self.categories(titles, lang), self.imageinfo(titles, lang)]
+        if depicts:
+            fetches.append(self.depicts([member.pageid for member in members], lang))
+        results = await asyncio.gather(*fetches)
+
+        files_categories, files_imageinfo = results[0], results[1]
+        depicts_by_pageid = results[2][0] if depicts else {}
+        return [
+            {
+                "pageid": member.pageid,
+                "title": member.title,
+                "categories": files_categories.get(member.title, {'hidden': [], 'visible': []}),
+                "imageinfo": files_imageinfo.get(member.title, []),
+                "depicts": depicts_by_pageid.get(member.pageid, []),
+            }
+            for member in members
+        ]
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        self._executors.clear()
+        if self._owns_client:
+            self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+def harvest_category(cat_title, lang='commons', concurrency=8, client=None, depicts=True) -> list:
+
+    """
+    runs AsyncHarvester.harvest_category from synchronous code
+
+    Args:
+        cat_title (string): the title/name of the category of interest
+        lang(string): the particular wikipedia api needed eg en, fr, commons
+        concurrency (int): the most requests in flight at the same time for each host
+        client (WikiClient): the shared api client
+        depicts (bool): whether the depicts (P180) statements are fetched too
+
+    Returns:
+        files ([dict]): one dictionary per file, in the order of the category
+    """
+
+    async def _harvest():
+        async with AsyncHarvester(client=client, concurrency=concurrency) as harvester:
+            return await harvester.harvest_category(cat_title, lang, depicts=depicts)
+
+    return asyncio.run(_harvest())
+
+#harvest_category('Category:Images_by_Ana_Beatriz_Sampaio_in_Wiki_Loves_Monuments_2021_in_Brazil', lang='commons')
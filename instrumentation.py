@@ -0,0 +1,246 @@
+'''
+request and latency instrumentation for the api and sparql calls of Task3.py. every WikiClient has a Metrics object that
+counts, for each endpoint (query:categories, query:imageinfo, wbgetentities, sparql, ...), the requests, bytes received,
+retries and cache hits, and keeps a latency histogram to give p50/p95/p99. pipeline stages can be timed with
+metrics.stage(name), and a hook can wrap every stage eg with cProfile or a tracing span.
+
+    client = WikiClient()
+    with client.metrics.stage("categories"):
+        get_categories_bulk(titles, 'commons', client=client)
+    client.metrics.dump()
+'''
+
+import bisect
+import contextlib
+import cProfile
+import os
+import sys
+import threading
+import time
+
+LATENCY_BUCKETS = [0.001 * 1.25 ** exponent for exponent in range(64)] #upper bounds in seconds, from 1ms to about 1.6 hours
+
+
+def endpoint_name(params) -> str:
+
+    """
+    the endpoint a request is counted under
+
+    Args:
+        params (dict): the parameters of the api request
+
+    Returns:
+        endpoint (string): eg query:categories, query:categorymembers, wbgetentities
+    """
+
+    action = params.get("action", "unknown")
+    if action != "query":
+        return action
+    modules = [str(params[module]) for module in ("prop", "list", "generator", "meta") if module in params]
+    return "query:" + "|".join(modules) if modules else "query"
+
+
+class LatencyHistogram:
+
+    """
+    latency histogram with fixed log-scale buckets, so it takes the same memory for ten requests or ten million
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent) -> float:
+
+        """
+        the latency under which percent of the requests were, as the upper bound of its bucket (at most 25% over)
+        """
+
+        if not self.count:
+            return 0.0
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(LATENCY_BUCKETS[bucket], self.max) if bucket < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class _EndpointMetrics:
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+
+class Metrics:
+
+    """
+    per-endpoint counters and latency histograms, and timings of the pipeline stages
+
+    Args:
+        stage_hook (callable): optional, called with the name of every stage and returns a context manager wrapped
+            around the stage, eg cprofile_hook("profiles") or a tracing span
+    """
+
+    def __init__(self, stage_hook=None):
+        self.stage_hook = stage_hook
+        self._endpoints = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint) -> _EndpointMetrics:
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = _EndpointMetrics()
+        return self._endpoints[endpoint]
+
+    def record_request(self, endpoint, seconds, error=False):
+
+        """
+        counts a request that went to the network and the time it took
+        """
+
+        with self._lock:
+            endpoint_metrics = self._endpoint(endpoint)
+            endpoint_metrics.requests += 1
+            endpoint_metrics.errors += bool(error)
+            endpoint_metrics.latency.add(seconds)
+
+    def record_bytes(self, endpoint, bytes_received):
+        with self._lock:
+            self._endpoint(endpoint).bytes_received += bytes_received
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._endpoint(endpoint).retries += 1
+
+    def record_cache_hit(self, endpoint):
+        with self._lock:
+            self._endpoint(endpoint).cache_hits += 1
+
+    @contextlib.contextmanager
+    def timed(self, endpoint):
+
+        """
+        times the block as one request to endpoint, counted as an error if it raises
+        """
+
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record_request(endpoint, time.perf_counter() - started, error=True)
+            raise
+        self.record_request(endpoint, time.perf_counter() - started)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+
+        """
+        times a stage of the pipeline eg categories, imageinfo, depicts, sparql, wrapped in the stage hook if there is one
+        """
+
+        hook = self.stage_hook(name) if self.stage_hook else contextlib.nullcontext()
+        started = time.perf_counter()
+        try:
+            with hook:
+                yield
+        finally:
+            with self._lock:
+                stage_metrics = self._stages.setdefault(name, {"runs": 0, "seconds": 0.0})
+                stage_metrics["runs"] += 1
+                stage_metrics["seconds"] += time.perf_counter() - started
+
+    def summary(self) -> dict:
+
+        """
+        all the metrics as a dictionary
+
+        Returns:
+            summary (dict): endpoints maps each endpoint to requests, bytes_received, retries, cache_hits, errors and
+                latency (count, mean, p50, p95, p99, max in seconds), stages maps each stage to runs and seconds
+        """
+
+        with self._lock:
+            return {
+                "endpoints": {
+                    endpoint: {
+                        "requests": endpoint_metrics.requests,
+                        "bytes_received": endpoint_metrics.bytes_received,
+                        "retries": endpoint_metrics.retries,
+                        "cache_hits": endpoint_metrics.cache_hits,
+                        "errors": endpoint_metrics.errors,
+                        "latency": endpoint_metrics.latency.summary(),
+                    }
+                    for endpoint, endpoint_metrics in sorted(self._endpoints.items())
+                },
+                "stages": {name: dict(stage_metrics) for name, stage_metrics in self._stages.items()},
+            }
+
+    def dump(self, file=None):
+
+        """
+        prints the summary as a table, to stderr by default so it does not mix with the reports
+        """
+
+        file = file or sys.stderr
+        summary = self.summary()
+        print("{0:32} {1:>8} {2:>12} {3:>7} {4:>7} {5:>9} {6:>9} {7:>9}".format(
+            "endpoint", "requests", "bytes", "retries", "cached", "p50 ms", "p95 ms", "p99 ms"), file=file)
+        for endpoint, endpoint_metrics in summary["endpoints"].items():
+            latency = endpoint_metrics["latency"]
+            print("{0:32} {1:>8} {2:>12} {3:>7} {4:>7} {5:>9.1f} {6:>9.1f} {7:>9.1f}".format(
+                endpoint, endpoint_metrics["requests"], endpoint_metrics["bytes_received"], endpoint_metrics["retries"],
+                endpoint_metrics["cache_hits"], latency["p50"] * 1000, latency["p95"] * 1000, latency["p99"] * 1000), file=file)
+        for name, stage_metrics in summary["stages"].items():
+            print("stage {0:26} {1:>8} runs {2:>10.3f}s".format(name, stage_metrics["runs"], stage_metrics["seconds"]), file=file)
+
+
+def cprofile_hook(directory):
+
+    """
+    stage hook that runs every stage under cProfile and saves the stats to <directory>/<stage>.prof
+
+    Args:
+        directory (string): where the profiles are written
+
+    Returns:
+        hook (callable): to pass as Metrics(stage_hook=...)
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def hook(name):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(directory, name.replace("/", "_") + ".prof"))
+
+    return hook
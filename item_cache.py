@@ -0,0 +1,304 @@
+'''
+persistent cache of the wikidata items behind the heritage details of Task3.py. get_labels_description_subcat looks up
+the same monuments for every subcategory (many photographers shoot the same sites), so the items are kept in sqlite by
+Q-id with their label, description and the claims the details use, and expire after a ttl.
+
+the items that are not cached are fetched in bulk with wbgetentities, 50 ids per request with their labels, descriptions
+and claims. only the location (P131) and heritage status (P1435) items they point to need their labels resolved, which
+is done with the label SERVICE of the query service, 50 items per query, and those are cached too. a repeated item costs
+no request and a new one about a fiftieth of one.
+
+    items = ItemCache("wikitask_items.sqlite")
+    get_labels_description_subcat(cat, "commons", items=items)
+'''
+
+import json
+import sqlite3
+import threading
+import time
+
+from Task3 import _chunks
+
+WIKIDATA = "wikidata" #the lang the WikiClient sends the wbgetentities requests to, see Task3.OTHER_HOSTS
+ENTITY_PREFIX = "http://www.wikidata.org/entity/"
+LOCATION, HERITAGE, STREET, DESCRIBED_AT = "P131", "P1435", "P6375", "P973"
+ITEM_PROPERTIES = (LOCATION, HERITAGE, STREET, DESCRIBED_AT) #the claims of ITEM_DETAILS_QUERY, the rest are not stored
+REFERENCED_PROPERTIES = (LOCATION, HERITAGE) #the claims whose items the details give the label of
+
+LABELS_QUERY = """
+SELECT ?item ?itemLabel ?itemDescription WHERE {
+    VALUES ?item { %s }
+    SERVICE wikibase:label { bd:serviceParam wikibase:language "%s". }
+}
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    fetched REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_fetched ON items (fetched);
+"""
+
+
+def _snak_value(snak):
+
+    """
+    the value of a claim as the query service gives it: the Q-id of an item, the text of a monolingual text, the string
+    of a string or url
+    """
+
+    value = (snak.get('datavalue') or {}).get('value')
+    if isinstance(value, dict):
+        return value.get('id') or value.get('text')
+    return value
+
+
+def _truthy(statements) -> list:
+
+    """
+    the values of the statements wdt: gives, the preferred ones when there are any, else the normal ones
+    """
+
+    statements = [statement for statement in statements if statement.get('mainsnak', {}).get('snaktype') == 'value']
+    preferred = [statement for statement in statements if statement.get('rank') == 'preferred']
+    return [_snak_value(statement['mainsnak']) for statement in preferred or [statement for statement in statements if statement.get('rank') == 'normal']]
+
+
+def compact_entity(entity, language="en") -> dict:
+
+    """
+    the part of a wbgetentities entity that is cached
+
+    Returns:
+        item (dict): {'label': string, 'description': string, 'claims': {property: [value]}} for the ITEM_PROPERTIES,
+            label and description are None when the item has none in language
+    """
+
+    claims = {prop: _truthy((entity.get('claims') or {}).get(prop) or []) for prop in ITEM_PROPERTIES}
+    return {
+        'label': (entity.get('labels') or {}).get(language, {}).get('value'),
+        'description': (entity.get('descriptions') or {}).get(language, {}).get('value'),
+        'claims': {prop: values for prop, values in claims.items() if values}, #unknown or no value claims are left out like wdt: does
+    }
+
+
+def detail_rows(wikidata_item, item, labels) -> list:
+
+    """
+    the rows ITEM_DETAILS_QUERY gives for an item, built from the cache: one row for every location, heritage status and
+    (street, described at) pair, none when the item has no location or no heritage status
+
+    Args:
+        wikidata_item (string): the Q-id
+        item (dict): its compact_entity
+        labels (dict): the compact_entity of the location and heritage items it points to
+
+    Returns:
+        rows ([dict]): maps each variable name to its value, like get_item_details
+    """
+
+    claims = item['claims']
+    if not claims.get(LOCATION) or not claims.get(HERITAGE): #the query requires both
+        return []
+
+    row = {'item': ENTITY_PREFIX + wikidata_item, 'itemLabel': item['label'] or wikidata_item} #the label service falls back to the id
+    if item['description']:
+        row['itemDescription'] = item['description']
+    optional = [{'streetLabel': street, 'descriptionLabel': url} for street in claims.get(STREET, []) for url in claims.get(DESCRIBED_AT, [])] or [{}]
+
+    rows = []
+    for location in claims[LOCATION]:
+        location_item = labels.get(location) or {}
+        for heritage in claims[HERITAGE]:
+            for extra in optional:
+                detail = dict(row, locationLabel=location_item.get('label') or location)
+                if location_item.get('description'):
+                    detail['locationDescription'] = location_item['description']
+                detail['heritageLabel'] = (labels.get(heritage) or {}).get('label') or heritage
+                detail.update(extra)
+                rows.append(detail)
+    return rows
+
+
+class ItemCache:
+
+    """
+    sqlite backed cache of wikidata items by Q-id with a ttl
+
+    Args:
+        path (string): the sqlite file, ":memory:" keeps the cache for the life of the process only
+        ttl (float): seconds an item is reused for before it is fetched again, None keeps items until expire is called
+            with a ttl
+        language (string): the language of the labels and descriptions
+    """
+
+    def __init__(self, path="wikitask_items.sqlite", ttl=7 * 24 * 60 * 60, language="en"):
+        self.path = path
+        self.ttl = ttl
+        self.language = language
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False) #the cache is shared by the threads of the client
+        self._db.executescript(SCHEMA)
+
+    def get(self, ids, complete=True) -> dict:
+
+        """
+        the cached items that have not expired
+
+        Args:
+            ids ([string]): the Q-ids
+            complete (bool): only the items fetched with their claims, not the ones only their label was resolved for
+
+        Returns:
+            items (dict): maps each cached Q-id to its compact_entity, the others are missing
+        """
+
+        ids = list(dict.fromkeys(ids))
+        oldest = time.time() - self.ttl if self.ttl is not None else None
+        items = {}
+        with self._lock:
+            for ids_chunk in _chunks(ids, 500): #sqlite allows a limited number of parameters
+                rows = self._db.execute("SELECT id, value, complete, fetched FROM items WHERE id IN ({0})".format(",".join("?" * len(ids_chunk))), ids_chunk)
+                for wikidata_item, value, item_complete, fetched in rows:
+                    if (oldest is None or fetched >= oldest) and (item_complete or not complete):
+                        items[wikidata_item] = json.loads(value)
+            self.hits += len(items)
+            self.misses += len(ids) - len(items)
+        return items
+
+    def set(self, items, complete=True):
+
+        """
+        stores items, replacing what was cached for them
+
+        Args:
+            items (dict): maps each Q-id to its compact_entity
+            complete (bool): whether the items have their claims
+        """
+
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO items (id, value, complete, fetched) VALUES (?, ?, ?, ?)",
+                [(wikidata_item, json.dumps(item, ensure_ascii=False), int(complete), now) for wikidata_item, item in items.items()],
+            )
+            self._db.commit()
+
+    def expire(self, ttl=None) -> int:
+
+        """
+        deletes the items older than ttl, the ttl of the cache when not given
+
+        Returns:
+            count (int): how many items were deleted
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is None:
+            return 0
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM items WHERE fetched < ?", (time.time() - ttl,)).rowcount
+            self._db.commit()
+        return deleted
+
+    def fetch(self, ids, client, chunk_size=50) -> dict:
+
+        """
+        the items with their claims, from the cache or with one wbgetentities request for every chunk_size missing items
+
+        Args:
+            ids ([string]): the Q-ids
+            client (WikiClient): sends the requests to wikidata
+            chunk_size (int): how many ids are sent in each request, 50 is the most wbgetentities accepts
+
+        Returns:
+            items (dict): maps each Q-id to its compact_entity, an item that does not exist has no label and no claims
+        """
+
+        ids = list(dict.fromkeys(ids))
+        items = self.get(ids)
+        for ids_chunk in _chunks([wikidata_item for wikidata_item in ids if wikidata_item not in items], chunk_size):
+            params = {
+                "action": "wbgetentities",
+                "ids": "|".join(ids_chunk),
+                "props": "labels|descriptions|claims",
+                "languages": self.language,
+                "format": "json",
+            }
+            entities = client.get(WIKIDATA, params).get('entities', {})
+            fetched = {}
+            for entity_id, entity in entities.items():
+                requested = (entity.get('redirects') or {}).get('from', entity_id) #a merged item comes back under the id it redirects to
+                fetched[requested] = compact_entity(entity, self.language)
+            fetched.update({wikidata_item: compact_entity({}) for wikidata_item in ids_chunk if wikidata_item not in fetched})
+            self.set(fetched)
+            self.fetched += len(fetched)
+            items.update(fetched)
+        return items
+
+    def labels(self, ids, query, chunk_size=50) -> dict:
+
+        """
+        the labels and descriptions of items, from the cache or with the label SERVICE for every chunk_size missing items
+
+        Args:
+            ids ([string]): the Q-ids
+            query (callable): sends a sparql query and gives its json response
+            chunk_size (int): how many items are sent in the VALUES clause of each query
+
+        Returns:
+            items (dict): maps each Q-id to a compact_entity, without claims for the items only their label was resolved for
+        """
+
+        ids = list(dict.fromkeys(ids))
+        items = self.get(ids, complete=False)
+        for ids_chunk in _chunks([wikidata_item for wikidata_item in ids if wikidata_item not in items], chunk_size):
+            response = query(LABELS_QUERY % (" ".join("wd:" + wikidata_item for wikidata_item in ids_chunk), self.language))
+            resolved = {wikidata_item: {'label': None, 'description': None, 'claims': {}} for wikidata_item in ids_chunk}
+            for binding in response['results']['bindings']:
+                wikidata_item = binding['item']['value'].rsplit('/', 1)[-1]
+                label = binding.get('itemLabel', {}).get('value')
+                resolved[wikidata_item] = {
+                    'label': label if label != wikidata_item else None, #the label service gives the id when there is no label
+                    'description': binding.get('itemDescription', {}).get('value'),
+                    'claims': {},
+                }
+            self.set(resolved, complete=False)
+            items.update(resolved)
+        return items
+
+    def item_details(self, wikidata_list, client, query, chunk_size=50) -> dict:
+
+        """
+        what get_item_details gives for many wikidata items, built from the cache and filling it in bulk
+
+        Args:
+            wikidata_list ([string]): the wikidata items eg Q123, any iterable
+            client (WikiClient): sends the wbgetentities requests to wikidata
+            query (callable): sends a sparql query and gives its json response, used for the location and heritage labels
+            chunk_size (int): how many items are sent in each request or query
+
+        Returns:
+            item_details (dict): maps each wikidata item to the list of its result rows, each row maps the variable name to its value
+        """
+
+        wikidata_list = list(dict.fromkeys(wikidata_list))
+        items = self.fetch(wikidata_list, client, chunk_size)
+        referenced = [value for item in items.values() if item['claims'].get(LOCATION) and item['claims'].get(HERITAGE) for prop in REFERENCED_PROPERTIES for value in item['claims'][prop]]
+        labels = self.labels(referenced, query, chunk_size)
+        return {wikidata_item: detail_rows(wikidata_item, items[wikidata_item], labels) for wikidata_item in wikidata_list}
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        return {"items": count, "hits": self.hits, "misses": self.misses, "fetched": self.fetched}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,326 @@
+'''
+persistent on-disk cache for the api responses of Task3.py, stored in sqlite so repeated runs of the same reports do not
+refetch identical imageinfo, categories and wbgetentities payloads. it plugs in under the WikiClient:
+
+    client = WikiClient(cache=ResponseCache("wikitask_cache.sqlite"))
+
+entries are keyed by the normalized request parameters, expire after a ttl and the least recently used ones are evicted
+when the cache grows past max_bytes. entries about files can be revalidated cheaply in bulk with prop=info, which keeps
+the ones whose lastrevid did not change and drops the others. the command line of Task3.py does both:
+
+    python Task3.py 'Category:...' --cache wikitask_cache.sqlite --revalidate
+'''
+
+import calendar
+import json
+import sqlite3
+import threading
+import time
+
+from Task3 import _chunks #splits the keys into batches like the api requests
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS entry_pages (
+    key TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    page TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entry_pages_page ON entry_pages (lang, page);
+CREATE INDEX IF NOT EXISTS entry_pages_key ON entry_pages (key);
+CREATE TABLE IF NOT EXISTS revisions (
+    lang TEXT NOT NULL,
+    page TEXT NOT NULL,
+    revid INTEGER NOT NULL,
+    PRIMARY KEY (lang, page)
+);
+"""
+
+
+UNKEYED_PARAMS = ("format", "maxlag") #format is always json and maxlag only decides whether the request is refused, not what it returns
+
+
+def normalize_params(params) -> dict:
+
+    """
+    normalizes request parameters so the same request always gives the same cache key
+
+    Args:
+        params (dict): the parameters of the api request
+
+    Returns:
+        normalized (dict): the parameters as sorted strings, lists joined with | like mwapi does, the UNKEYED_PARAMS are dropped
+    """
+
+    normalized = {}
+    for key in sorted(params):
+        value = params[key]
+        if key in UNKEYED_PARAMS or value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = "|".join(str(item) for item in value)
+        normalized[key] = str(value)
+    return normalized
+
+
+def _page_refs(params, response) -> set:
+
+    """
+    the pages a cached response is about, so it can be dropped when one of them is edited: the MediaInfo ids requested
+    and every page the response gives, which links the files of generator queries too. listings like categorymembers
+    give no pages and just expire with the ttl
+    """
+
+    refs = set()
+    for entity_id in str(params.get("ids", "")).split("|"):
+        if entity_id[:1] == "M" and entity_id[1:].isdigit(): #M<pageid> is the MediaInfo entity of a file
+            refs.add("pageid:" + entity_id[1:])
+
+    pages = response.get("query", {}).get("pages", {})
+    for page in pages.values() if isinstance(pages, dict) else pages:
+        if "pageid" in page:
+            refs.add("pageid:" + str(page["pageid"]))
+        if "title" in page:
+            refs.add("title:" + page["title"])
+    return refs
+
+
+class ResponseCache:
+
+    """
+    sqlite backed cache of api responses with a ttl, size based lru eviction and revision aware revalidation
+
+    Args:
+        path (string): the sqlite file, ":memory:" keeps the cache for the life of the process only
+        ttl (float): seconds an entry is reused for before it is fetched again, None keeps entries until they are evicted
+        max_bytes (int): the most bytes of responses kept, the least recently used entries are evicted past it
+    """
+
+    def __init__(self, path="wikitask_cache.sqlite", ttl=24 * 60 * 60, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False) #the cache is shared by the threads of the client
+        self._db.executescript(SCHEMA)
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def key(lang, params) -> str:
+
+        """
+        the cache key of a request
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            params (dict): the parameters of the api request
+
+        Returns:
+            key (string): the lang and the normalized parameters as json
+        """
+
+        return json.dumps([lang, normalize_params(params)], ensure_ascii=False, separators=(",", ":"))
+
+    def get(self, lang, params):
+
+        """
+        the cached response of a request
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            params (dict): the parameters of the api request
+
+        Returns:
+            response (dict): the cached json response, None when it is not cached or has expired
+        """
+
+        key = self.key(lang, params)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._delete([key])
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, lang, params, response):
+
+        """
+        stores the response of a request, evicting the least recently used entries if the cache grows past max_bytes
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            params (dict): the parameters of the api request
+            response (dict): the json response of the api
+        """
+
+        key = self.key(lang, params)
+        value = json.dumps(response, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        now = time.time()
+        with self._lock:
+            self._delete([key])
+            self._db.execute("INSERT INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now))
+            self._db.executemany("INSERT INTO entry_pages (key, lang, page) VALUES (?, ?, ?)", [(key, lang, ref) for ref in _page_refs(params, response)])
+            self._bytes += len(value)
+            self._evict()
+            self._db.commit()
+
+    def _delete(self, keys):
+        for key in keys:
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._bytes -= row[0]
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.execute("DELETE FROM entry_pages WHERE key = ?", (key,))
+
+    def _evict(self):
+        while self.max_bytes is not None and self._bytes > self.max_bytes:
+            oldest = self._db.execute("SELECT key FROM entries ORDER BY accessed LIMIT 64").fetchall()
+            if not oldest:
+                break
+            for (key,) in oldest:
+                if self._bytes <= self.max_bytes:
+                    break
+                self._delete([key])
+                self.evictions += 1
+
+    def invalidate_pages(self, lang, refs) -> int:
+
+        """
+        drops every entry about the given pages
+
+        Args:
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            refs ([string]): the pages as "title:<title>" or "pageid:<pageid>"
+
+        Returns:
+            dropped (int): how many entries were dropped
+        """
+
+        with self._lock:
+            keys = set()
+            for ref in refs:
+                keys.update(key for (key,) in self._db.execute("SELECT key FROM entry_pages WHERE lang = ? AND page = ?", (lang, ref)))
+            self._delete(keys)
+            self.invalidations += len(keys)
+            self._db.commit()
+        return len(keys)
+
+    def revalidate(self, client, lang, titles=(), pageids=(), chunk_size=50) -> list:
+
+        """
+        checks in bulk whether the cached entries of files are still current. prop=info gives the lastrevid of 50 files
+        per request, the entries of files edited since they were cached are dropped and the others get a fresh ttl.
+        a file seen for the first time is compared by its touched timestamp against when its entries were cached
+
+        Args:
+            client (WikiClient): the api client, the prop=info requests always go to the network
+            lang(string): the particular wikipedia api needed eg en, fr, commons
+            titles ([string]): the titles of the files to revalidate
+            pageids ([int]): the pageids of the files to revalidate
+            chunk_size (int): how many files are checked in each request
+
+        Returns:
+            changed ([string]): the titles of the files whose cached entries were dropped, the pageid (int) instead for a
+                deleted file that was revalidated by pageid
+        """
+
+        batches = [("titles", chunk) for chunk in _chunks(titles, chunk_size)]
+        batches += [("pageids", chunk) for chunk in _chunks(pageids, chunk_size)]
+
+        changed = []
+        for batch_param, batch in batches:
+            params = {"action": "query", "prop": "info", batch_param: "|".join(str(item) for item in batch), "format": "json"}
+            response = client.get(lang, params, cache=False)
+            pages = response.get("query", {}).get("pages", {})
+            for page in pages.values() if isinstance(pages, dict) else pages:
+                refs = []
+                if "title" in page:
+                    refs.append("title:" + page["title"])
+                if "pageid" in page:
+                    refs.append("pageid:" + str(page["pageid"]))
+
+                if self._page_changed(lang, refs, page):
+                    self.invalidate_pages(lang, refs)
+                    changed.append(page.get("title", page.get("pageid"))) #a deleted file asked for by pageid comes back without its title
+                else:
+                    self._refresh(lang, refs)
+        return changed
+
+    def _page_changed(self, lang, refs, page) -> bool:
+        if "missing" in page or "lastrevid" not in page: #deleted files are never reused
+            return True
+
+        with self._lock:
+            placeholders = ",".join("?" * len(refs))
+            stored = self._db.execute("SELECT revid FROM revisions WHERE lang = ? AND page IN ({0})".format(placeholders), [lang] + refs).fetchone()
+            if stored is not None:
+                page_changed = stored[0] != page["lastrevid"]
+            else:
+                oldest = self._db.execute(
+                    "SELECT MIN(entries.created) FROM entries JOIN entry_pages ON entries.key = entry_pages.key "
+                    "WHERE entry_pages.lang = ? AND entry_pages.page IN ({0})".format(placeholders), [lang] + refs).fetchone()[0]
+                touched = calendar.timegm(time.strptime(page["touched"], "%Y-%m-%dT%H:%M:%SZ")) if "touched" in page else None
+                page_changed = oldest is not None and (touched is None or touched > oldest)
+
+            self._db.executemany("INSERT OR REPLACE INTO revisions (lang, page, revid) VALUES (?, ?, ?)", [(lang, ref, page["lastrevid"]) for ref in refs])
+            self._db.commit()
+        return page_changed
+
+    def _refresh(self, lang, refs):
+        with self._lock:
+            placeholders = ",".join("?" * len(refs))
+            self._db.execute(
+                "UPDATE entries SET created = ? WHERE key IN (SELECT key FROM entry_pages WHERE lang = ? AND page IN ({0}))".format(placeholders),
+                [time.time(), lang] + list(refs))
+            self._db.commit()
+
+    def stats(self) -> dict:
+
+        """
+        hit and miss statistics of the cache
+
+        Returns:
+            stats (dict): hits, misses, hit_rate, evictions, invalidations, entries and bytes
+        """
+
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": entries,
+            "bytes": self._bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db.executescript("DELETE FROM entries; DELETE FROM entry_pages; DELETE FROM revisions;")
+            self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,154 @@
+'''
+a local stand-in http server for the mediawiki api and the sparql endpoint, so the harvesting code in Task3.py can be
+run and timed without touching wikimedia.org. it answers every request by calling a responder with the request parameters.
+'''
+
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1" #keep-alive, so connection reuse can be measured like against the real api
+    disable_nagle_algorithm = True #the headers and the body are written separately, nagle would delay every response
+
+    def _answer(self, params):
+        stub = self.server.stub
+        with stub._lock:
+            stub.requests_served += 1
+
+        if stub.latency:
+            time.sleep(stub.latency) #artificial network latency
+
+        answer = stub.responder(urlparse(self.path).path, params)
+        status, headers, document = answer if isinstance(answer, tuple) else (200, {}, answer)
+        body = document if isinstance(document, bytes) else json.dumps(document).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for header_name, header_value in headers.items():
+            self.send_header(header_name, str(header_value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = urlparse(self.path).query
+        self._answer({key: values[0] for key, values in parse_qs(query, keep_blank_values=True).items()})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = self.rfile.read(length).decode("utf-8")
+        self._answer({key: values[0] for key, values in parse_qs(form, keep_blank_values=True).items()})
+
+    def log_message(self, format, *args):
+        pass #keeps the output of the runs clean
+
+
+class StubServer:
+
+    """
+    local http server answering every request with the document given by the responder, used as a context manager
+
+    Args:
+        responder (callable): called with (path, params) for every request, returns the json document to answer with,
+            or a (status, headers, document) tuple to answer with another status eg 429 with a Retry-After header
+        latency (float): seconds every response is delayed by, to stand in for the network
+        host (string): the address to listen on
+        port (int): the port to listen on, 0 picks a free port
+    """
+
+    def __init__(self, responder, latency=0.0, host="127.0.0.1", port=0):
+        self.responder = responder
+        self.latency = latency
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+
+        """
+        the base url of the server eg http://127.0.0.1:8080, usable as the host of a WikiClient
+        """
+
+        host, port = self._server.server_address[:2]
+        return "http://{0}:{1}".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FaultInjector:
+
+    """
+    wraps a responder and answers some of the requests with the errors of a server that pushes back, to test the
+    throttling of Task3.py. a request over capacity gets a 429 with Retry-After, and a share of the others gets a maxlag
+    error (status 200 with the MediaWiki-API-Error header like the real api) or a 503
+
+    Args:
+        responder (callable): the responder answering the requests that are let through
+        capacity (int): the most requests handled at the same time, the ones over it get a 429, None has no limit
+        latency (float): seconds every request is held for, counted in the capacity (leave the latency of the StubServer at 0)
+        maxlag_rate (float): share of the mediawiki requests answered with a maxlag error
+        unavailable_rate (float): share of the requests answered with a 503
+        retry_after (float): the Retry-After sent with the errors
+        seed (int): seed of the random draws, so runs can be repeated
+    """
+
+    def __init__(self, responder, capacity=None, latency=0.0, maxlag_rate=0.0, unavailable_rate=0.0, retry_after=1, seed=0):
+        self.responder = responder
+        self.capacity = capacity
+        self.latency = latency
+        self.maxlag_rate = maxlag_rate
+        self.unavailable_rate = unavailable_rate
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.faults = {"too_many_requests": 0, "maxlag": 0, "unavailable": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, path, params):
+        with self._lock:
+            self.in_flight += 1
+            over_capacity = self.capacity is not None and self.in_flight > self.capacity
+            draw = self._random.random()
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if over_capacity:
+                return self._fault("too_many_requests", 429, {"Retry-After": self.retry_after}, b"Too many requests")
+            if draw < self.unavailable_rate:
+                return self._fault("unavailable", 503, {"Retry-After": self.retry_after}, b"Service Unavailable")
+            if draw < self.unavailable_rate + self.maxlag_rate and not path.rstrip("/").endswith("/sparql"):
+                return self._fault("maxlag", 200, {"Retry-After": self.retry_after, "MediaWiki-API-Error": "maxlag", "X-Database-Lag": 7}, {
+                    "error": {"code": "maxlag", "info": "Waiting for 10.64.0.1: 7 seconds lagged.", "host": "10.64.0.1", "lag": 7},
+                })
+            return self.responder(path, params)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _fault(self, kind, status, headers, document):
+        with self._lock:
+            self.faults[kind] += 1
+        return status, headers, document
@@ -0,0 +1,49 @@
+import Task3
+from benchmark import FixtureWiki, StubSparql
+from response_cache import ResponseCache, normalize_params
+from stub_server import StubServer
+
+TITLE = "File:Benchmark 0.jpg"
+
+
+def _recorded_categories(path, params):
+    return {"batchcomplete": "", "query": {"pages": {"1000000": {"pageid": 1000000, "ns": 6, "title": TITLE, "categories": [{"ns": 14, "title": "Category:Recorded"}]}}}}
+
+
+def _recorded_sparql(path, params):
+    return {"head": {"vars": ["item", "itemLabel"]}, "results": {"bindings": [{"item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q1"}, "itemLabel": {"type": "literal", "value": "Recorded"}}]}}
+
+
+def test_maxlag_is_not_part_of_the_cache_key():
+    assert normalize_params({"action": "query", "maxlag": 5, "format": "json"}) == normalize_params({"action": "query"})
+
+
+def test_recorded_responses_are_replayed_with_maxlag(tmp_path):
+    recorded = ResponseCache(str(tmp_path / "recorded.sqlite"))
+    with StubServer(_recorded_categories) as stub: #records the response the way a real run fills its cache
+        recording_client = Task3.WikiClient(host=stub.url + "/{0}", cache=recorded)
+        Task3.get_categories_bulk([TITLE], "commons", client=recording_client)
+        recording_client.close()
+
+    with StubServer(FixtureWiki(recorded=recorded)) as stub:
+        client = Task3.WikiClient(host=stub.url + "/{0}")
+        assert client.throttle.maxlag is not None #the stub receives maxlag, the recording was stored without it
+        files_categories = Task3.get_categories_bulk([TITLE], "commons", client=client)
+        client.close()
+
+    assert files_categories[TITLE] == {'hidden': [], 'visible': ["Category:Recorded"]}
+
+
+def test_recorded_sparql_is_replayed(tmp_path):
+    recorded = ResponseCache(str(tmp_path / "recorded.sqlite"))
+    with StubServer(_recorded_sparql) as stub:
+        recording_client = Task3.WikiClient(host=stub.url + "/{0}", cache=recorded)
+        Task3.get_item_details(["Q1"], sparql=StubSparql(stub.url + "/sparql"), client=recording_client)
+        recording_client.close()
+
+    with StubServer(FixtureWiki(recorded=recorded)) as stub:
+        client = Task3.WikiClient(host=stub.url + "/{0}")
+        item_details = Task3.get_item_details(["Q1"], sparql=StubSparql(stub.url + "/sparql"), client=client)
+        client.close()
+
+    assert item_details == {"Q1": [{"item": "http://www.wikidata.org/entity/Q1", "itemLabel": "Recorded"}]}
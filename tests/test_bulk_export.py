@@ -0,0 +1,92 @@
+import glob
+import os
+
+import pytest
+
+import Task3
+from benchmark import FixtureWiki
+from bulk_export import CHECKPOINT_NAME, SHARD_NAME, BulkExport
+from stub_server import StubServer
+
+CATEGORY = "Category:Benchmark 730"
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CrashingExport(BulkExport):
+
+    """
+    dies after writing the records of a batch but before saving the checkpoint that covers them
+    """
+
+    def __init__(self, *args, crash_after=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches_left = crash_after
+
+    def _write_batch(self, checkpoint, records):
+        super()._write_batch(checkpoint, records)
+        self.batches_left -= 1
+        if not self.batches_left:
+            raise Interrupted()
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with StubServer(FixtureWiki()) as stub:
+        yield stub
+
+
+def _export(stub, directory, export_class=BulkExport, progress=None, **kwargs):
+    client = Task3.WikiClient(host=stub.url + "/{0}")
+    try:
+        return export_class(CATEGORY, str(directory), client=client, shard_size=100, depicts=True, progress=progress or (lambda progress: None), **kwargs).run()
+    finally:
+        client.close()
+
+
+def _shards(directory) -> dict:
+    shards = {}
+    for path in sorted(glob.glob(os.path.join(str(directory), "files-*.jsonl"))):
+        with open(path, "rb") as shard_file:
+            shards[os.path.basename(path)] = shard_file.read()
+    return shards
+
+
+@pytest.fixture(scope="module")
+def reference(stub, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("reference")
+    checkpoint = _export(stub, directory)
+    return checkpoint, _shards(directory)
+
+
+@pytest.mark.parametrize("batches", [1, 3, 7, 12])
+def test_interrupted_export_resumes_to_the_same_shards(stub, tmp_path, reference, batches):
+    calls = []
+
+    def interrupt(progress):
+        calls.append(progress)
+        if len(calls) == batches:
+            raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        _export(stub, tmp_path, progress=interrupt)
+    checkpoint = _export(stub, tmp_path)
+
+    assert checkpoint['done']
+    assert checkpoint['exported'] == reference[0]['exported']
+    assert _shards(tmp_path) == reference[1]
+
+
+@pytest.mark.parametrize("batches", [2, 5])
+def test_crash_between_shard_write_and_checkpoint_is_truncated_on_resume(stub, tmp_path, reference, batches):
+    with pytest.raises(Interrupted):
+        _export(stub, tmp_path, export_class=CrashingExport, crash_after=batches)
+    saved = Task3.load_snapshot(os.path.join(str(tmp_path), CHECKPOINT_NAME))['shard']
+    assert os.path.getsize(os.path.join(str(tmp_path), SHARD_NAME.format(saved['index']))) > saved['offset'] #records past the checkpoint were written
+
+    checkpoint = _export(stub, tmp_path)
+
+    assert checkpoint['exported'] == reference[0]['exported']
+    assert _shards(tmp_path) == reference[1] #no record duplicated or lost
@@ -0,0 +1,15 @@
+import Task3
+from benchmark import FixtureWiki, _files
+from stub_server import StubServer
+
+
+def test_repeated_titles_get_their_categories_once():
+    titles = _files(3)
+    with StubServer(FixtureWiki()) as stub:
+        client = Task3.WikiClient(host=stub.url + "/{0}")
+        try:
+            expected = Task3.get_categories_bulk(titles, "commons", client=client)
+            assert Task3.get_categories_bulk(titles * 2, "commons", client=client) == expected #the same chunk
+            assert Task3.get_categories_bulk(titles * 2, "commons", client=client, chunk_size=2) == expected #later chunks
+        finally:
+            client.close()
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import mwapi.errors
+import pytest
+
+import Task3
+from stub_server import StubServer
+
+TREE = { #category: (subcategories, files), B and C lead back up the tree
+    "Category:Root": (["Category:A", "Category:B"], ["File:0.jpg", "File:1.jpg"]),
+    "Category:A": (["Category:C"], ["File:1.jpg", "File:2.jpg", "File:3.jpg"]),
+    "Category:B": (["Category:A", "Category:Root"], ["File:3.jpg", "File:4.jpg"]),
+    "Category:C": (["Category:Root"], ["File:5.jpg", "File:2.jpg"]),
+    "Category:Big": ([], ["File:Big {0}.jpg".format(i) for i in range(5000)]),
+    "Category:Big and broken": (["Category:Big", "Category:Broken"], []),
+}
+
+
+class TreeWiki:
+
+    """
+    answers list=categorymembers for TREE, cmlimit members at a time, and remembers every listing request
+    """
+
+    def __init__(self):
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def __call__(self, path, params):
+        with self._lock:
+            self.requests.append((params["cmtitle"], params["cmnamespace"]))
+        if params["cmtitle"] not in TREE:
+            return {"error": {"code": "internal_api_error", "info": "the listing failed"}}
+        subcategories, files = TREE[params["cmtitle"]]
+        namespaces = params["cmnamespace"].split("|")
+        members = [{"pageid": 0, "ns": 14, "title": title} for title in subcategories if "14" in namespaces]
+        members += [{"pageid": 0, "ns": 6, "title": title} for title in files if "6" in namespaces]
+        offset, limit = int(params.get("cmcontinue") or 0), int(params["cmlimit"])
+        response = {"batchcomplete": "", "query": {"categorymembers": members[offset:offset + limit]}}
+        if offset + limit < len(members):
+            response["continue"] = {"cmcontinue": str(offset + limit), "continue": "-||"}
+        return response
+
+
+@pytest.fixture
+def wiki():
+    return TreeWiki()
+
+
+@pytest.fixture
+def client(wiki):
+    with StubServer(wiki) as stub:
+        client = Task3.WikiClient(host=stub.url + "/{0}")
+        yield client
+        client.close()
+
+
+def test_cycles_end_and_every_file_is_given_once(wiki, client):
+    pairs = list(Task3.crawl_category_tree("Category:Root", client=client))
+
+    files = [file_title for category, file_title in pairs]
+    assert sorted(files) == ["File:{0}.jpg".format(i) for i in range(6)] #File:1, 2 and 3 are in two categories each
+    assert sorted(title for title, namespace in wiki.requests) == ["Category:A", "Category:B", "Category:C", "Category:Root"] #every category listed once
+
+
+def test_max_depth_and_min_depth(wiki, client):
+    assert sorted(file_title for category, file_title in Task3.crawl_category_tree("Category:Root", max_depth=0, client=client)) == ["File:0.jpg", "File:1.jpg"]
+    assert wiki.requests == [("Category:Root", "6")] #the subcategories of the last level are not listed
+
+    del wiki.requests[:]
+    pairs = list(Task3.crawl_category_tree("Category:Root", max_depth=1, min_depth=1, client=client))
+    assert sorted(set(category for category, file_title in pairs)) == ["Category:A", "Category:B"]
+    assert sorted(file_title for category, file_title in pairs) == ["File:1.jpg", "File:2.jpg", "File:3.jpg", "File:4.jpg"]
+    assert sorted(wiki.requests) == [("Category:A", "6"), ("Category:B", "6"), ("Category:Root", "14")] #no files listed above min_depth
+    assert sorted(Task3.get_all_files_cat("Category:Root", "commons", client=client)) == sorted(file_title for category, file_title in pairs) #siblings are listed concurrently, in no set order
+
+
+def _requests_settle(wiki):
+    count = -1
+    while count != len(wiki.requests):
+        count = len(wiki.requests)
+        time.sleep(0.3)
+    return count
+
+
+def test_closing_the_crawl_early_stops_the_listing(wiki, client):
+    crawl = Task3.crawl_category_tree("Category:Big", client=client, queue_size=10)
+    for _ in range(5):
+        next(crawl)
+    crawl.close()
+
+    assert _requests_settle(wiki) <= 2 #5000 files are 10 pages of 500, the listing stops after the page it was on
+
+
+def test_a_failed_listing_stops_its_siblings(wiki, client):
+    with pytest.raises(mwapi.errors.APIError):
+        list(Task3.crawl_category_tree("Category:Big and broken", client=client, queue_size=10))
+
+    assert sum(title == "Category:Big" for title, namespace in wiki.requests) < 10 #the big listing did not run to its last page
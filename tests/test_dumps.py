@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+import Task3
+import dumps
+from stub_server import StubServer
+from throttle import Throttle
+
+CATEGORIES = {"Wiki Loves Monuments 2021 in Brazil": 1000, "Images by Ana (test)": 1001, "Hidden 'quoted' cat": 1002, "Media with locations": 1003, "Açude do Cedro": 1004}
+HIDDEN = {1002, 1003}
+
+
+class FixtureData:
+
+    """
+    a small commons with quotes, backslashes, accents and binary sort keys in its titles, written as dumps and
+    answered by the api responder from the same data
+    """
+
+    def __init__(self, seed=1):
+        rng = random.Random(seed)
+        self.files = {5000 + i: "Foto_{0}_d'Ávila_(teste)\\x.jpg".format(i) if i % 7 == 0 else "Açude_Cedro_{0:03d}.jpg".format(i) for i in range(230)}
+        self.links = [] #(cl_from, cl_to, sortkey)
+        for pageid, title in self.files.items():
+            for category in rng.sample(sorted(CATEGORIES), rng.randint(0, 4)):
+                self.links.append((pageid, category.replace(" ", "_"), (title.upper() + "\n" + title).encode() + bytes([0xff, pageid % 256])))
+        self.links.append((1001, "Wiki_Loves_Monuments_2021_in_Brazil", b"IMAGES")) #a subcategory
+        self.entities = []
+        for pageid in self.files:
+            if pageid % 5 == 0: #files without structured data
+                continue
+            statements = {"P180": [{"mainsnak": {"snaktype": "value", "property": "P180", "datavalue": {"value": {"id": "Q{0}".format(pageid % 17)}}}}]} if pageid % 3 else {}
+            if pageid % 11 == 0 and statements:
+                statements["P180"].append({"mainsnak": {"snaktype": "somevalue", "property": "P180"}})
+            self.entities.append({"type": "mediainfo", "id": "M{0}".format(pageid), "statements": statements})
+
+    def write(self, directory, target_ids):
+        paths = {name: str(directory / name) for name in ("page.sql.gz", "categorylinks.sql.bz2", "page_props.sql.gz", "linktarget.sql.gz", "mediainfo.json.bz2")}
+        dumps.write_sql_dump(paths["page.sql.gz"], "page", ["page_id", "page_namespace", "page_title", "page_is_redirect"],
+                             [(pageid, 6, title, 0) for pageid, title in self.files.items()] + [(pageid, 14, category.replace(" ", "_"), 0) for category, pageid in CATEGORIES.items()], rows_per_insert=37)
+        if target_ids: #the schema since 1.44, categorylinks points to linktarget
+            target_by_title = {category.replace(" ", "_"): 900 + k for k, category in enumerate(sorted(CATEGORIES))}
+            dumps.write_sql_dump(paths["linktarget.sql.gz"], "linktarget", ["lt_id", "lt_namespace", "lt_title"], [(target_id, 14, title) for title, target_id in target_by_title.items()])
+            dumps.write_sql_dump(paths["categorylinks.sql.bz2"], "categorylinks", ["cl_from", "cl_sortkey", "cl_sortkey_prefix", "cl_timestamp", "cl_collation_id", "cl_type", "cl_target_id"],
+                                 [(pageid, sortkey, "", "2021-01-01 00:00:00", 1, "file", target_by_title[category]) for pageid, category, sortkey in self.links], rows_per_insert=50)
+        else:
+            dumps.write_sql_dump(paths["categorylinks.sql.bz2"], "categorylinks", ["cl_from", "cl_to", "cl_sortkey", "cl_timestamp", "cl_sortkey_prefix", "cl_collation", "cl_type"],
+                                 [(pageid, category, sortkey, "2021-01-01 00:00:00", "", "uppercase", "file") for pageid, category, sortkey in self.links], rows_per_insert=50)
+        dumps.write_sql_dump(paths["page_props.sql.gz"], "page_props", ["pp_page", "pp_propname", "pp_value", "pp_sortkey"],
+                             [(pageid, "hiddencat", "", None) for pageid in HIDDEN] + [(5001, "page_image_free", "x", None)])
+        dumps.write_mediainfo_dump(paths["mediainfo.json.bz2"], self.entities)
+        return dumps.DumpReader(paths["page.sql.gz"], paths["categorylinks.sql.bz2"], page_props=paths["page_props.sql.gz"],
+                                linktarget=paths["linktarget.sql.gz"] if target_ids else None, mediainfo=paths["mediainfo.json.bz2"])
+
+    @staticmethod
+    def _api_title(db_key):
+        return "File:" + db_key.replace("_", " ")
+
+    def __call__(self, path, params):
+        if params.get("action") == "wbgetentities":
+            entities = {entity["id"]: entity for entity in self.entities}
+            return {"entities": {entity_id: entities.get(entity_id, {"id": entity_id, "missing": ""}) for entity_id in params["ids"].split("|")}}
+        if params.get("list") == "categorymembers":
+            category = params["cmtitle"].split(":", 1)[1].replace(" ", "_")
+            members = sorted((sortkey, pageid) for pageid, link_category, sortkey in self.links if link_category == category and pageid in self.files)
+            return {"batchcomplete": "", "query": {"categorymembers": [{"pageid": pageid, "ns": 6, "title": self._api_title(self.files[pageid])} for sortkey, pageid in members]}}
+        if params.get("prop") == "categories":
+            pages, normalized = {}, []
+            pageids = {title: pageid for pageid, title in self.files.items()}
+            for title in params["titles"].split("|"):
+                db_key = title.split(":", 1)[1].replace(" ", "_")
+                if "_" in title:
+                    normalized.append({"from": title, "to": title.replace("_", " ")})
+                pageid = pageids[db_key]
+                page = {"pageid": pageid, "ns": 6, "title": self._api_title(db_key)}
+                categories = sorted(category for link_pageid, category, sortkey in self.links if link_pageid == pageid)
+                if categories:
+                    page["categories"] = [dict({"ns": 14, "title": "Category:" + category.replace("_", " ")}, **({"hidden": ""} if CATEGORIES[category.replace("_", " ")] in HIDDEN else {})) for category in categories]
+                pages[str(pageid)] = page
+            return {"batchcomplete": "", "query": {"normalized": normalized, "pages": pages}}
+        return {"error": {"code": "unknown_action", "info": "not covered by the dump fixtures"}}
+
+
+@pytest.fixture(scope="module")
+def data():
+    return FixtureData()
+
+
+@pytest.fixture
+def client(data):
+    with StubServer(data) as stub:
+        client = Task3.WikiClient(host=stub.url + "/{0}", throttle=Throttle(maxlag=None))
+        yield client
+        client.close()
+
+
+@pytest.mark.parametrize("target_ids", [False, True], ids=["cl_to", "cl_target_id"])
+def test_dump_reader_matches_the_api(data, client, tmp_path, target_ids):
+    reader = data.write(tmp_path, target_ids)
+
+    for category in CATEGORIES:
+        assert reader.get_all_files_subcat("Category:" + category) == Task3.get_all_files_subcat("Category:" + category, client=client)
+
+    titles = ["File:" + title for title in data.files.values()][:120] + ["File:" + title.replace("_", " ") for title in data.files.values()][120:]
+    assert reader.get_categories_bulk(titles) == Task3.get_categories_bulk(titles, "commons", client=client)
+
+    pageids = list(data.files)
+    assert reader.get_depicts_bulk(pageids) == Task3.get_depicts_bulk(pageids, client=client)
+
+    category = "Category:Wiki Loves Monuments 2021 in Brazil"
+    assert sorted(reader.get_wikidata(category)) == sorted(Task3.get_wikidata(category, "commons", client=client))
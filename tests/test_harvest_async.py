@@ -0,0 +1,37 @@
+import Task3
+from benchmark import FixtureWiki, run_benchmarks
+from harvest_async import harvest_category
+from stub_server import StubServer
+
+CATEGORY = "Category:Benchmark 230"
+
+
+def test_harvest_gives_the_results_of_the_sequential_functions_in_category_order():
+    with StubServer(FixtureWiki()) as stub:
+        client = Task3.WikiClient(host=stub.url + "/{0}")
+        try:
+            files = harvest_category(CATEGORY, concurrency=8, client=client)
+
+            members = list(Task3.iter_category_members(CATEGORY, client=client))
+            titles = [member.title for member in members]
+            files_categories = Task3.get_categories_bulk(titles, "commons", client=client)
+            files_imageinfo = Task3.get_imageinfo_bulk(titles, "commons", client=client)
+            depicts_by_pageid, depicts_set = Task3.get_depicts_bulk([member.pageid for member in members], client=client)
+        finally:
+            client.close()
+
+    assert [file["title"] for file in files] == titles
+    assert [file["pageid"] for file in files] == [member.pageid for member in members]
+    for file in files:
+        assert file["categories"] == files_categories[file["title"]]
+        assert file["imageinfo"] == files_imageinfo[file["title"]]
+        assert file["depicts"] == depicts_by_pageid[file["pageid"]]
+
+
+def test_harvest_speeds_up_with_concurrency():
+    results = run_benchmarks(sizes=[200], functions=["harvest_category_1", "harvest_category_8"], latency=0.1)["results"]
+    wall_time = {result["function"]: result["wall_time"] for result in results}
+    requests = {result["function"]: result["requests"] for result in results}
+
+    assert requests["harvest_category_1"] == requests["harvest_category_8"] #the same requests, only sent concurrently
+    assert wall_time["harvest_category_8"] * 2 < wall_time["harvest_category_1"] #the 12 chunk requests overlap, the listing does not
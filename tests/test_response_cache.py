@@ -0,0 +1,76 @@
+import Task3
+from response_cache import ResponseCache
+from stub_server import StubServer
+from throttle import Throttle
+
+FILES = {7001: "File:A.jpg", 7002: "File:B.jpg"}
+
+
+class Wiki:
+
+    """
+    a category of two files whose revisions can be bumped and which can be deleted, answering generator queries and the
+    prop=info of revalidate
+    """
+
+    def __init__(self):
+        self.revisions = {pageid: 100 + pageid for pageid in FILES}
+        self.deleted = set()
+        self.requests = []
+
+    def __call__(self, path, params):
+        self.requests.append(params)
+        if params.get("generator") == "categorymembers":
+            pages = {str(pageid): {"pageid": pageid, "ns": 6, "title": title, "categories": [{"ns": 14, "title": params["gcmtitle"]}]} for pageid, title in FILES.items()}
+            return {"batchcomplete": "", "query": {"pages": pages}}
+        if params.get("prop") == "info":
+            by_title = {title: pageid for pageid, title in FILES.items()}
+            pageids = [int(pageid) for pageid in params["pageids"].split("|")] if "pageids" in params else [by_title[title] for title in params["titles"].split("|")]
+            pages = {}
+            for pageid in pageids:
+                if pageid in self.deleted: #the api gives no title for a missing pageid
+                    pages[str(pageid)] = {"pageid": pageid, "missing": ""}
+                else:
+                    pages[str(pageid)] = {"pageid": pageid, "ns": 6, "title": FILES[pageid], "lastrevid": self.revisions[pageid], "touched": "2001-01-01T00:00:00Z"}
+            return {"batchcomplete": "", "query": {"pages": pages}}
+        return {"error": {"code": "unknown_action", "info": "not covered by the fixture"}}
+
+
+def test_generator_responses_are_dropped_when_one_of_their_files_is_edited():
+    wiki = Wiki()
+    params = {"action": "query", "generator": "categorymembers", "gcmtitle": "Category:Cedro", "gcmtype": "file", "prop": "categories", "format": "json"}
+    with StubServer(wiki) as stub:
+        cache = ResponseCache(":memory:")
+        client = Task3.WikiClient(host=stub.url + "/{0}", cache=cache, throttle=Throttle(maxlag=None))
+        try:
+            first = client.get("commons", params)
+            assert cache.revalidate(client, "commons", titles=list(FILES.values())) == []
+            assert client.get("commons", params) == first
+            assert len(wiki.requests) == 2 #the generator query was answered from the cache
+
+            wiki.revisions[7002] += 1
+            assert cache.revalidate(client, "commons", titles=list(FILES.values())) == ["File:B.jpg"]
+            client.get("commons", params)
+            assert len(wiki.requests) == 4 #refetched after the edit
+        finally:
+            client.close()
+            cache.close()
+
+
+def test_revalidate_by_pageid_drops_the_entries_of_deleted_files():
+    wiki = Wiki()
+    params = {"action": "query", "generator": "categorymembers", "gcmtitle": "Category:Cedro", "gcmtype": "file", "prop": "categories", "format": "json"}
+    with StubServer(wiki) as stub:
+        cache = ResponseCache(":memory:")
+        client = Task3.WikiClient(host=stub.url + "/{0}", cache=cache, throttle=Throttle(maxlag=None))
+        try:
+            client.get("commons", params)
+            assert cache.revalidate(client, "commons", pageids=list(FILES)) == []
+
+            wiki.deleted.add(7001)
+            assert cache.revalidate(client, "commons", pageids=list(FILES)) == [7001]
+            client.get("commons", params)
+            assert len(wiki.requests) == 4 #refetched after the deletion
+        finally:
+            client.close()
+            cache.close()
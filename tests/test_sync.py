@@ -0,0 +1,74 @@
+import pytest
+
+import Task3
+from benchmark import FixtureWiki
+from response_cache import ResponseCache
+from stub_server import StubServer
+
+CATEGORY = "Category:Benchmark 30"
+
+
+class ChangingWiki(FixtureWiki):
+
+    """
+    the benchmark commons with files that can be added to or removed from the category and edited, an edit bumps the
+    lastrevid of the file and gives it one more category
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.files = set(range(20))
+        self.edits = {}
+
+    def _members(self, title, namespaces):
+        return [member for member in super()._members(title, namespaces) if member["ns"] != 6 or self._file_number(member["title"]) in self.files]
+
+    def _info(self, title):
+        page = super()._info(title)
+        page["lastrevid"] += self.edits.get(self._file_number(title), 0)
+        return page
+
+    def categories(self, params):
+        response = super().categories(params)
+        for page in response["query"]["pages"].values():
+            edits = self.edits.get(self._file_number(page["title"]))
+            if edits:
+                page["categories"].append({"ns": 14, "title": "Category:Edited {0}".format(edits)})
+        return response
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "cached"])
+def test_sync_refetches_added_and_edited_files_and_drops_removed_ones(cached):
+    wiki = ChangingWiki()
+    with StubServer(wiki) as stub:
+        client = Task3.WikiClient(host=stub.url + "/{0}", cache=ResponseCache(":memory:") if cached else None)
+        try:
+            snapshot = Task3.sync_category(CATEGORY, client=client)
+            assert sorted(snapshot['changes']['added']) == sorted("File:Benchmark {0}.jpg".format(i) for i in range(20))
+
+            wiki.files.add(25)
+            wiki.files.discard(3)
+            wiki.edits[5] = 1
+            snapshot = Task3.sync_category(CATEGORY, snapshot=snapshot, client=client)
+
+            assert snapshot['changes'] == {'added': ["File:Benchmark 25.jpg"], 'edited': ["File:Benchmark 5.jpg"], 'removed': ["File:Benchmark 3.jpg"]}
+            edited = snapshot['files']["File:Benchmark 5.jpg"]
+            assert edited['lastrevid'] == 500000006
+            assert "Category:Edited 1" in edited['categories']['visible']
+
+            for edits in (2, 3): #the second run sends the same refetch requests as the first, the cache must not answer them
+                wiki.edits[5] = edits
+                snapshot = Task3.sync_category(CATEGORY, snapshot=snapshot, client=client)
+                assert snapshot['changes'] == {'added': [], 'edited': ["File:Benchmark 5.jpg"], 'removed': []}
+                assert "Category:Edited {0}".format(edits) in snapshot['files']["File:Benchmark 5.jpg"]['categories']['visible']
+
+            unchanged = Task3.sync_category(CATEGORY, snapshot=snapshot, client=client)
+            assert unchanged['changes'] == {'added': [], 'edited': [], 'removed': []}
+        finally:
+            client.close()
+
+        fresh_client = Task3.WikiClient(host=stub.url + "/{0}")
+        try:
+            assert snapshot['files'] == Task3.sync_category(CATEGORY, client=fresh_client)['files'] #the same as a full sync from scratch
+        finally:
+            fresh_client.close()
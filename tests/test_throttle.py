@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Task3
+from benchmark import FixtureWiki, _files
+from instrumentation import Metrics
+from stub_server import FaultInjector, StubServer
+from throttle import AdaptiveLimiter, Throttle
+
+
+def _client(stub, **throttle_options):
+    metrics = Metrics()
+    options = dict(backoff=0.01, max_backoff=0.05, max_retries=30, metrics=metrics)
+    options.update(throttle_options)
+    return Task3.WikiClient(host=stub.url + "/{0}", metrics=metrics, throttle=Throttle(**options))
+
+
+def _retries(client) -> int:
+    return sum(endpoint["retries"] for endpoint in client.metrics.summary()["endpoints"].values())
+
+
+def _categories(client, titles):
+    return Task3.get_categories_bulk(titles, "commons", client=client, chunk_size=10)
+
+
+def test_maxlag_and_503_are_retried_until_every_result_comes_back():
+    titles = _files(300)
+    with StubServer(FixtureWiki()) as stub:
+        expected = _categories(_client(stub), titles)
+
+    faults = FaultInjector(FixtureWiki(), maxlag_rate=0.2, unavailable_rate=0.2, retry_after=0)
+    with StubServer(faults) as stub:
+        client = _client(stub)
+        files_categories = _categories(client, titles)
+
+    assert files_categories == expected
+    assert faults.faults["maxlag"] > 0 and faults.faults["unavailable"] > 0
+    assert _retries(client) == faults.faults["maxlag"] + faults.faults["unavailable"] #one retry for every fault
+
+
+def test_429_over_capacity_halves_the_limit_and_it_recovers():
+    faults = FaultInjector(FixtureWiki(), capacity=2, latency=0.02, retry_after=0)
+    params = [{"action": "query", "prop": "categories", "titles": title, "clprop": "hidden", "format": "json"} for title in _files(120)]
+    with StubServer(faults) as stub:
+        client = _client(stub, initial_concurrency=8, max_concurrency=8)
+        limiter = client.throttle.limiter("commons")
+        lowest = [limiter.limit]
+        watching = threading.Event()
+
+        def watch(): #the lowest limit seen while the requests are sent
+            while not watching.is_set():
+                lowest[0] = min(lowest[0], limiter.limit)
+                time.sleep(0.001)
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda request_params: client.get("commons", request_params), params))
+        watching.set()
+        watcher.join()
+
+        assert all('query' in response for response in responses) #every request got its answer in the end
+        assert faults.faults["too_many_requests"] > 0
+        assert _retries(client) == faults.faults["too_many_requests"]
+        assert lowest[0] < 8 #halved on the 429s
+
+        faults.capacity = None #the server takes everything again
+        for request_params in params[:20]:
+            client.get("commons", request_params)
+        assert limiter.limit >= lowest[0] + 2 #grows back by one for every window of healthy responses
+
+
+def test_retry_after_is_waited_out_before_the_next_attempt():
+    answers = iter([(429, {"Retry-After": "0.3"}, b"Too many requests")])
+
+    def responder(path, params):
+        return next(answers, {"batchcomplete": "", "query": {"pages": {}}})
+
+    waits = []
+    with StubServer(responder) as stub:
+        client = _client(stub, sleep=lambda seconds: waits.append(seconds) or time.sleep(seconds))
+        started = time.monotonic()
+        response = client.get("commons", {"action": "query", "titles": "File:A.jpg"})
+        elapsed = time.monotonic() - started
+
+    assert response == {"batchcomplete": "", "query": {"pages": {}}}
+    assert waits and waits[0] >= 0.3
+    assert elapsed >= 0.3
+    assert _retries(client) == 1
+
+
+def test_adaptive_limiter_is_aimd():
+    limiter = AdaptiveLimiter(initial=8, minimum=1, maximum=10)
+    limiter.throttled()
+    assert limiter.limit == 4
+    limiter.throttled()
+    limiter.throttled()
+    limiter.throttled()
+    assert limiter.limit == 1 #never below the minimum
+    for _ in range(100):
+        limiter.succeeded()
+    assert limiter.limit == 10 #never past the maximum
@@ -0,0 +1,240 @@
+'''
+adaptive throttling shared by the mediawiki and sparql requests of Task3.py. every request goes through Throttle.call,
+which sends it when its host has a free slot and retries it when the server pushes back (429, 503, maxlag, ratelimited,
+timeouts), honouring Retry-After or backing off exponentially with full jitter.
+
+the number of slots of each host follows AIMD like tcp congestion control: it grows by one for every window of healthy
+responses and is halved when the server pushes back, so the client stays close to the most the server will take
+without being blocked.
+
+    throttle = Throttle(max_concurrency=8)
+    throttle.call("commons", "query:categories", session.get, action="query", ...)
+'''
+
+import contextlib
+import email.utils
+import itertools
+import random
+import threading
+import time
+
+RETRY_STATUSES = (429, 500, 502, 503, 504) #too many requests and the server or gateway errors of an overloaded server
+RETRY_API_ERRORS = ("maxlag", "ratelimited", "readonly") #mediawiki error codes that go away if the request is sent later
+
+
+class Throttled(Exception):
+
+    """
+    the server pushed back on a request, retry_after is how many seconds it asked to wait (None when it did not say)
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+
+    """
+    the seconds of a Retry-After header, which is either a number of seconds or an http date
+
+    Returns:
+        seconds (float): None when there is no header or it cannot be read
+    """
+
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+def check_response(response, *args, **kwargs):
+
+    """
+    response hook of a requests session that raises Throttled when the server pushed back, so the request is retried
+    instead of its error page being decoded as json. mediawiki marks maxlag and ratelimited errors with the
+    MediaWiki-API-Error header even when the status is 200
+    """
+
+    api_error = response.headers.get("MediaWiki-API-Error")
+    if response.status_code in RETRY_STATUSES or api_error in RETRY_API_ERRORS:
+        response.content #reads the body so the connection goes back to the pool
+        raise Throttled("{0} {1}".format(response.status_code, api_error or response.reason), parse_retry_after(response.headers.get("Retry-After")))
+
+
+def retry_after(error):
+
+    """
+    whether an error is worth retrying and how long the server asked to wait
+
+    Args:
+        error (Exception): what the request raised
+
+    Returns:
+        retry (bool): whether the request should be sent again
+        seconds (float): the wait the server asked for, None when it did not say
+    """
+
+    seen = set()
+    while error is not None and id(error) not in seen: #mwapi wraps what the requests hooks raise
+        seen.add(id(error))
+        if isinstance(error, Throttled):
+            return True, error.retry_after
+        if getattr(error, "code", None) in RETRY_API_ERRORS: #mwapi.errors.APIError
+            return True, None
+        response = getattr(error, "response", None)
+        if response is not None and getattr(response, "status_code", None) is not None: #requests.HTTPError
+            return response.status_code in RETRY_STATUSES, parse_retry_after(response.headers.get("Retry-After"))
+        if isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in ("Timeout", "ConnectTimeout", "ReadTimeout", "ConnectionError", "TimeoutError", "ServerError"):
+            return True, None #requests, mwapi and pywikibot have their own timeout and connection errors
+        error = error.__cause__ or error.__context__
+    return False, None
+
+
+class AdaptiveLimiter:
+
+    """
+    the in-flight requests of one host, with an AIMD limit and a pause every request waits out after a Retry-After
+
+    Args:
+        initial (int): the limit the host starts with
+        minimum (int): the limit is never halved below this
+        maximum (int): the limit never grows past this
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.resume_at = 0.0 #monotonic time before which no request is sent to the host
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def slot(self):
+
+        """
+        waits for the pause to end and for a free slot, and holds the slot for the duration of the block
+        """
+
+        with self._condition:
+            while True:
+                pause = self.resume_at - time.monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def succeeded(self):
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit) #one more slot for every window of healthy responses
+            self._condition.notify_all()
+
+    def throttled(self, pause=0.0):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit / 2.0)
+            self.resume_at = max(self.resume_at, time.monotonic() + pause)
+
+
+class Throttle:
+
+    """
+    sends every request through the AdaptiveLimiter of its host and retries the ones the server pushed back on
+
+    Args:
+        maxlag (int): the maxlag sent with every mediawiki request, the api refuses the request when the database
+            replicas lag more than this many seconds, None does not send it
+        max_retries (int): how many times a request is retried before its error is raised
+        backoff (float): the base of the exponential backoff in seconds, attempt n waits up to backoff * 2 ** n
+        max_backoff (float): the longest wait between two attempts
+        initial_concurrency (int): the slots every host starts with
+        max_concurrency (int): the most slots a host grows to
+        metrics (Metrics): where the retries are counted, see instrumentation.py
+        sleep (callable): waits between the attempts, time.sleep
+    """
+
+    def __init__(self, maxlag=5, max_retries=6, backoff=1.0, max_backoff=120.0, initial_concurrency=4, max_concurrency=16, metrics=None, sleep=time.sleep):
+        self.maxlag = maxlag
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.metrics = metrics
+        self.sleep = sleep
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, host) -> AdaptiveLimiter:
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = AdaptiveLimiter(self.initial_concurrency, maximum=self.max_concurrency)
+            return self._limiters[host]
+
+    def delay(self, attempt, server_wait=None) -> float:
+
+        """
+        how long to wait before attempt + 1, full jitter over the exponential backoff but never less than the server asked
+        """
+
+        jitter = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return max(jitter, server_wait or 0.0)
+
+    def call(self, host, endpoint, function, *args, **kwargs):
+
+        """
+        calls function(*args, **kwargs) in a slot of host, retrying it while the server pushes back
+
+        Args:
+            host (string): the lang of the mediawiki api, or sparql, every host has its own limiter
+            endpoint (string): the endpoint the retries are counted under
+            function (callable): sends the request
+
+        Returns:
+            whatever function returns, the error of the last attempt is raised once max_retries is used up
+        """
+
+        limiter = self.limiter(host)
+        for attempt in itertools.count():
+            with limiter.slot():
+                try:
+                    result = function(*args, **kwargs)
+                except Exception as error:
+                    retry, server_wait = retry_after(error)
+                    if not retry or attempt >= self.max_retries:
+                        raise
+                else:
+                    limiter.succeeded()
+                    return result
+
+            wait = self.delay(attempt, server_wait)
+            limiter.throttled(server_wait or 0.0) #a Retry-After holds back every request to the host, not just this one
+            if self.metrics is not None:
+                self.metrics.record_retry(endpoint)
+            self.sleep(wait)
+
+    def stats(self) -> dict:
+
+        """
+        the current limit and in-flight requests of every host
+        """
+
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {host: {"limit": round(limiter.limit, 2), "in_flight": limiter.in_flight} for host, limiter in limiters.items()}